@@ -6,18 +6,15 @@ UI được thiết kế theo phong cách Antigravity Kit - Experimental & Futur
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sentiment_analyzer import SentimentAnalyzer
+from model_registry import MODEL_REGISTRY, describe_key
+from tuning_profile import load_profile
 import io
 from datetime import datetime
 import os
+import importlib.util
 
-# Thử import plotly cho biểu đồ đẹp hơn
-try:
-    import plotly.express as px
-    import plotly.graph_objects as go
-    HAS_PLOTLY = True
-except:
-    HAS_PLOTLY = False
+# Dùng plotly cho biểu đồ đẹp hơn nếu có (chỉ import khi vẽ, trang mở nhanh hơn)
+HAS_PLOTLY = importlib.util.find_spec('plotly') is not None
 
 # Cấu hình trang
 st.set_page_config(
@@ -1747,8 +1744,11 @@ if 'use_gemini' not in st.session_state:
     st.session_state.use_gemini = False
 if 'gemini_api_key' not in st.session_state:
     st.session_state.gemini_api_key = ""
-if 'batch_size' not in st.session_state:
-    st.session_state.batch_size = 32
+# Mặc định theo profile auto-tune của model (python src/run_auto_tune.py), chưa tune thì torch / 32
+if 'batch_size' not in st.session_state or 'backend' not in st.session_state:
+    _profile = load_profile(st.session_state.model_choice)
+    st.session_state.batch_size = _profile['batch_size'] if _profile else 32
+    st.session_state.backend = _profile['backend'] if _profile else 'torch'
 if 'text_column' not in st.session_state:
     st.session_state.text_column = 'text'
 if 'sentiment_column' not in st.session_state:
@@ -1931,10 +1931,13 @@ with tab1:
                                 status_text.empty()
                                 st.stop()
                             
+                            # Import khi cần (torch/transformers nặng, không tải khi chỉ mở trang)
+                            from sentiment_analyzer import SentimentAnalyzer
                             analyzer = SentimentAnalyzer(
                                 model_name='gemini-2.5-flash' if use_gemini else st.session_state.model_choice,
                                 use_gemini=use_gemini,
-                                gemini_api_key=gemini_key
+                                gemini_api_key=gemini_key,
+                                backend=st.session_state.backend
                             )
                             st.session_state.analyzer = analyzer
                             progress_bar.progress(20)
@@ -2142,6 +2145,7 @@ with tab2:
             with col1:
                 st.markdown("**Phân Bố Sentiment**")
                 if HAS_PLOTLY:
+                    import plotly.graph_objects as go
                     fig_bar = go.Figure(data=[
                         go.Bar(
                             x=['Tích cực', 'Trung tính', 'Tiêu cực'],
@@ -2171,6 +2175,7 @@ with tab2:
             with col2:
                 st.markdown("**Tỷ Lệ Sentiment**")
                 if HAS_PLOTLY:
+                    import plotly.express as px
                     fig_pie = px.pie(
                         values=[positive, neutral, negative],
                         names=['Tích cực', 'Trung tính', 'Tiêu cực'],
@@ -2306,23 +2311,54 @@ with tab3:
             - Nhanh hơn, nhẹ hơn
             - Hỗ trợ đa ngôn ngữ cơ bản
             """)
+            
+            backend_options = ["torch", "onnx", "fast"]
+            st.session_state.backend = st.selectbox(
+                "Backend Suy Luận",
+                backend_options,
+                index=backend_options.index(st.session_state.backend),
+                help="onnx: ONNX Runtime trên CPU, nhanh hơn khi không có GPU (cần: pip install optimum[onnxruntime]). "
+                     "fast: bộ phân loại tuyến tính chưng cất từ transformer, hàng triệu comment/phút, kém chính xác hơn"
+            )
+            
+            if st.session_state.backend == "onnx":
+                st.caption("Lần đầu chạy sẽ export model sang ONNX và lưu cache, các lần sau tải trực tiếp.")
+            elif st.session_state.backend == "fast":
+                fast_model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache', 'fast_classifier.npz')
+                if os.path.exists(fast_model_path):
+                    st.caption("Không dùng Model Phân Tích ở trên: chấm bằng bộ phân loại đã huấn luyện trong .model_cache.")
+                else:
+                    st.warning("Chưa có bộ phân loại nhanh. Huấn luyện bằng: `python src/run_train_fast.py`")
     
     with col2:
-        st.session_state.batch_size = st.slider(
+        # Các mức 8..64 cùng batch size hiện tại (có thể là giá trị ngoài lưới do profile auto-tune chọn)
+        batch_options = sorted(set(range(8, 65, 8)) | {st.session_state.batch_size})
+        st.session_state.batch_size = st.select_slider(
             "Batch Size",
-            min_value=8,
-            max_value=64,
+            options=batch_options,
             value=st.session_state.batch_size,
-            step=8,
             help="Lớn hơn = nhanh hơn nhưng tốn RAM hơn"
         )
         
         st.caption(f"Đang sử dụng: **{st.session_state.batch_size}** items/batch")
         
-        if st.session_state.batch_size >= 48:
-            st.warning("⚠️ Batch size lớn có thể gây lỗi out of memory. Nên dùng GPU.")
-        elif st.session_state.batch_size <= 16:
-            st.info("💡 Batch size nhỏ an toàn nhưng chậm hơn.")
+        # Cấu hình đã đo trên máy này thay cho lời khuyên chung về batch size
+        profile = None if st.session_state.use_gemini else load_profile(st.session_state.model_choice)
+        if profile:
+            rss = f", RAM đỉnh {profile['peak_rss_mb']:.0f} MB" if profile.get('peak_rss_mb') else ""
+            st.success(
+                f"⚡ Nhanh nhất trên máy này: backend **{profile['backend']}**, batch **{profile['batch_size']}**, "
+                f"{profile['intra_op_threads']}/{profile['inter_op_threads']} thread "
+                f"({profile['comments_per_sec']:.0f} comment/s{rss})"
+            )
+            if (st.session_state.batch_size, st.session_state.backend) != (profile['batch_size'], profile['backend']):
+                if st.button("Dùng cấu hình đã đo"):
+                    st.session_state.batch_size = profile['batch_size']
+                    st.session_state.backend = profile['backend']
+                    st.rerun()
+        else:
+            st.info("💡 Chưa đo cấu hình cho model này. Chạy `python src/run_auto_tune.py --input <file.csv>` "
+                    "để tìm backend, số thread và batch size nhanh nhất trên máy này.")
     
     st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
     
@@ -2341,6 +2377,15 @@ with tab3:
         - Nếu có GPU, tool sẽ tự động sử dụng để tăng tốc
         """)
     
+    # Model đã tải được dùng chung cho mọi session, chỉ tải lại sau khi giải phóng
+    loaded_models = MODEL_REGISTRY.keys()
+    if loaded_models:
+        st.caption("Model đang giữ trong bộ nhớ: " + ", ".join(describe_key(key) for key in loaded_models))
+        if st.button("Giải phóng model đã tải", help="Dùng khi máy thiếu RAM. Lần phân tích sau sẽ tải lại model"):
+            MODEL_REGISTRY.clear()
+            st.session_state.analyzer = None
+            st.rerun()
+    
     st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
     
     st.markdown("### Tùy Chọn Nâng Cao")
@@ -2366,7 +2411,8 @@ with tab3:
     with st.expander("Tối Ưu Hiệu Suất"):
         st.markdown("""
         **Để tăng tốc độ:**
-        1. Tăng batch size (nếu có đủ RAM)
+        1. Chạy `python src/run_auto_tune.py --input <file.csv>` để đo backend, số thread và batch size
+           nhanh nhất trên máy này (app và CLI tự dùng kết quả)
         2. Sử dụng GPU (nếu có)
         3. Chọn model nhẹ hơn (twitter-roberta)
         
@@ -0,0 +1,93 @@
+"""
+Journal checkpoint cho process_csv (file SQLite đặt cạnh file đầu ra)
+Lưu kết quả đã phân tích theo key của dòng (cid hoặc số thứ tự dòng) sau mỗi đợt,
+hoặc trạng thái ghi file (chế độ đọc theo chunk); chạy lại với cùng input/output thì
+bỏ qua các dòng đã xong và chạy tiếp
+"""
+
+import math
+import os
+import sqlite3
+
+# Các cột xác suất lưu cùng score (thứ tự như OUTPUT_COLUMNS của sentiment_analyzer)
+_PROB_COLUMNS = ['pos', 'neu', 'neg', 'confidence']
+
+
+class CheckpointJournal:
+    """Kết quả sentiment theo key dòng, ghi bền vững sau mỗi lần record()"""
+
+    def __init__(self, path, fingerprint):
+        """
+        Mở (hoặc tạo) journal
+
+        Args:
+            path: Đường dẫn file journal
+            fingerprint: Chuỗi định danh lần chạy (file đầu vào, cột, model...). Journal có
+                         fingerprint khác (input hoặc model đã đổi) bị xóa để chạy lại từ đầu
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS results (row_key TEXT PRIMARY KEY, score INTEGER NOT NULL)')
+        # Journal cũ chỉ có cột score
+        existing = {row[1] for row in self._conn.execute('PRAGMA table_info(results)')}
+        for column in _PROB_COLUMNS:
+            if column not in existing:
+                self._conn.execute(f'ALTER TABLE results ADD COLUMN {column} REAL')
+
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is not None and row[0] != fingerprint:
+            print("⚠️  Journal checkpoint thuộc lần chạy khác (input/cột/model đã đổi), bắt đầu lại từ đầu")
+            self._conn.execute('DELETE FROM results')
+            self._conn.execute("DELETE FROM meta WHERE key != 'fingerprint'")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+        self._conn.commit()
+
+    def load(self):
+        """
+        Returns:
+            dict: {row_key: (score, pos, neu, neg, confidence)} của các dòng đã xong
+                  (NaN nếu không có xác suất)
+        """
+        rows = self._conn.execute(f'SELECT row_key, score, {", ".join(_PROB_COLUMNS)} FROM results')
+        return {row[0]: tuple(math.nan if value is None else value for value in row[1:]) for row in rows}
+
+    def record(self, items):
+        """Ghi nhiều kết quả {row_key: (score, pos, neu, neg, confidence)} trong một transaction"""
+        if not items:
+            return
+        rows = []
+        for key, output in items.items():
+            score, *probs = output
+            rows.append((str(key), int(score), *(None if math.isnan(p) else float(p) for p in probs)))
+        with self._conn:
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO results (row_key, score, {", ".join(_PROB_COLUMNS)}) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def get_meta(self, key):
+        """Giá trị trạng thái đã lưu theo key (None nếu chưa có)"""
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        """Lưu giá trị trạng thái (chuỗi) theo key"""
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def remove(self):
+        """Đóng và xóa journal (sau khi đã ghi xong file đầu ra)"""
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
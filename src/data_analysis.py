@@ -5,8 +5,6 @@ Phân tích toàn diện dữ liệu comments TikTok
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import warnings
 import sys
@@ -26,15 +24,27 @@ if sys.platform == 'win32':
 
 warnings.filterwarnings('ignore')
 
-# Set style for plots
-try:
-    plt.style.use('seaborn-v0_8-darkgrid')
-except:
-    try:
-        plt.style.use('seaborn-darkgrid')
-    except:
-        plt.style.use('default')
-sns.set_palette("husl")
+_PLOTTING = None
+
+
+def _plotting():
+    """Import matplotlib/seaborn và đặt style khi vẽ biểu đồ lần đầu, trả về (plt, sns)"""
+    global _PLOTTING
+    if _PLOTTING is None:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        
+        # Set style for plots
+        try:
+            plt.style.use('seaborn-v0_8-darkgrid')
+        except:
+            try:
+                plt.style.use('seaborn-darkgrid')
+            except:
+                plt.style.use('default')
+        sns.set_palette("husl")
+        _PLOTTING = (plt, sns)
+    return _PLOTTING
 
 class TikTokDataAnalyzer:
     """Phân tích dữ liệu comments TikTok"""
@@ -148,6 +158,7 @@ class TikTokDataAnalyzer:
         """Vẽ biểu đồ phân bố sentiment"""
         sentiment_counts = self.df['trust'].value_counts().sort_index()
         sentiment_labels = {-1: 'Tiêu cực', 0: 'Trung tính', 1: 'Tích cực'}
+        plt, sns = _plotting()
         
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
         
@@ -235,6 +246,7 @@ class TikTokDataAnalyzer:
         n_cols = len(engagement_cols)
         if n_cols == 0:
             return
+        plt, sns = _plotting()
         
         fig, axes = plt.subplots(1, n_cols, figsize=(6*n_cols, 6))
         if n_cols == 1:
@@ -322,6 +334,7 @@ class TikTokDataAnalyzer:
     
     def _plot_time_analysis(self, df_time, daily_counts, hourly_counts):
         """Vẽ biểu đồ phân tích thời gian"""
+        plt, sns = _plotting()
         fig, axes = plt.subplots(2, 1, figsize=(14, 10))
         
         # Daily comments
@@ -517,6 +530,7 @@ class TikTokDataAnalyzer:
         print(corr_df.to_string())
         
         # Vẽ heatmap
+        plt, sns = _plotting()
         plt.figure(figsize=(10, 8))
         sns.heatmap(corr_df, annot=True, fmt='.2f', cmap='coolwarm', center=0,
                     square=True, linewidths=1, cbar_kws={"shrink": 0.8})
@@ -0,0 +1,172 @@
+"""
+Bộ phân loại tuyến tính nhanh cho backend 'fast' của SentimentAnalyzer
+Đặc trưng hashing (từ, cặp từ liền nhau, emoji/dấu câu) -> hồi quy logistic 3 lớp (pos/neu/neg).
+Được huấn luyện offline bằng run_train_fast.py trên nhãn trust của dữ liệu đã gán nhãn trong repo,
+chưng cất (distill) từ xác suất của transformer, rồi lưu thành một file .npz nhỏ.
+Chấm điểm chỉ gồm tách từ, tra bucket và một phép nhân ma trận thưa, không cần torch
+"""
+
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+# Từ (chữ/số) hoặc từng ký tự không phải chữ (emoji, dấu câu)
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+# Thứ tự lớp (giống cột pos/neu/neg của RAW_COLUMNS) và nhãn tương ứng
+CLASS_LABELS = np.array([1, 0, -1])
+
+# Số bucket mặc định (2^18 x 3 trọng số float32 ~ 3 MB, nén còn nhỏ hơn vì đa số bucket bằng 0)
+DEFAULT_N_FEATURES = 2 ** 18
+
+
+class FastClassifier:
+    """Hashing vectorizer + hồi quy logistic đa lớp, toàn bộ bằng NumPy/SciPy"""
+
+    # Số token tối đa giữ trong bảng nhớ bucket (tránh tính lại crc32 cho từ đã gặp)
+    _MEMO_SIZE = 1_000_000
+
+    def __init__(self, n_features=DEFAULT_N_FEATURES, weights=None, bias=None, metadata=None):
+        """
+        Args:
+            n_features: Số bucket của hashing vectorizer (lũy thừa của 2)
+            weights: Ma trận trọng số (n_features x 3), None = chưa huấn luyện
+            bias: Vector bias (3,)
+            metadata: Dict thông tin huấn luyện (model teacher, số dòng, ...) lưu kèm artifact
+        """
+        self.n_features = n_features
+        self.weights = weights if weights is not None else np.zeros((n_features, len(CLASS_LABELS)), np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(CLASS_LABELS), np.float32)
+        self.metadata = metadata or {}
+        self._memo = {}
+
+    def _bucket(self, feature):
+        bucket = self._memo.get(feature)
+        if bucket is None:
+            if len(self._memo) >= self._MEMO_SIZE:
+                self._memo.clear()
+            # crc32 ổn định giữa các process (hash() của Python thì không)
+            bucket = self._memo[feature] = zlib.crc32(feature.encode('utf-8')) & (self.n_features - 1)
+        return bucket
+
+    def features(self, texts):
+        """
+        Ma trận đặc trưng thưa, mỗi dòng chuẩn hóa L2 (từ + cặp từ liền nhau, đã lower)
+
+        Returns:
+            scipy.sparse.csr_matrix: (số text x n_features)
+        """
+        from scipy import sparse
+
+        bucket = self._bucket
+        indices = []
+        indptr = [0]
+        for text in texts:
+            tokens = _TOKEN.findall(str(text).lower())
+            indices.extend(map(bucket, tokens))
+            indices.extend(bucket(f"{a} {b}") for a, b in zip(tokens, tokens[1:]))
+            indptr.append(len(indices))
+
+        indptr = np.array(indptr, dtype=np.int64)
+        counts = np.diff(indptr)
+        data = np.repeat(1.0 / np.sqrt(np.maximum(counts, 1)), counts).astype(np.float32)
+        return sparse.csr_matrix((data, np.array(indices, dtype=np.int64), indptr),
+                                 shape=(len(counts), self.n_features))
+
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, texts, matrix=None):
+        """Xác suất (số text x 3) theo thứ tự pos, neu, neg"""
+        matrix = self.features(texts) if matrix is None else matrix
+        return self._softmax(np.asarray(matrix @ self.weights) + self.bias)
+
+    def raw_outputs(self, texts):
+        """
+        Output thô giống transformer: (label, pos, neu, neg, confidence) cho cả batch
+
+        Returns:
+            numpy array: (số text x 5)
+        """
+        probs = self.predict_proba(texts)
+        top = probs.argmax(axis=1)
+        return np.column_stack([CLASS_LABELS[top], probs, probs[np.arange(len(probs)), top]]).astype(np.float64)
+
+    def fit(self, texts, targets, sample_weight=None, epochs=10, batch_size=256, learning_rate=0.02,
+            l2=1e-6, seed=42):
+        """
+        Huấn luyện bằng mini-batch Adam với cross-entropy trên phân phối mục tiêu (có thể là nhãn mềm)
+
+        Args:
+            texts: List texts
+            targets: Ma trận (số text x 3) phân phối mục tiêu theo pos, neu, neg (mỗi dòng tổng = 1)
+            sample_weight: Trọng số từng dòng (None = như nhau)
+            epochs: Số lượt duyệt dữ liệu
+            batch_size: Số dòng mỗi bước cập nhật
+            learning_rate: Tốc độ học của Adam
+            l2: Hệ số regularization L2 (chỉ áp dụng cho các bucket xuất hiện trong batch)
+            seed: Seed xáo trộn dữ liệu
+        """
+        from scipy import sparse
+
+        matrix = self.features(texts)
+        targets = np.asarray(targets, dtype=np.float32)
+        sample_weight = (np.ones(len(targets), np.float32) if sample_weight is None
+                         else np.asarray(sample_weight, dtype=np.float32))
+        params = [self.weights, self.bias]
+        moments = [(np.zeros_like(p), np.zeros_like(p)) for p in params]
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        rng = np.random.default_rng(seed)
+        step = 0
+
+        for _ in range(epochs):
+            order = rng.permutation(len(targets))
+            for start in range(0, len(order), batch_size):
+                rows = order[start:start+batch_size]
+                batch = matrix[rows]
+                weight = sample_weight[rows, None] / sample_weight[rows].sum()
+                diff = (self.predict_proba(None, batch) - targets[rows]) * weight
+                # Chỉ các bucket có mặt trong batch được cập nhật (Adam thưa)
+                touched, local = np.unique(batch.indices, return_inverse=True)
+                local_batch = sparse.csr_matrix((batch.data, local, batch.indptr), shape=(len(rows), len(touched)))
+                grad_w = np.asarray(local_batch.T @ diff) + l2 * self.weights[touched]
+                grad_b = diff.sum(axis=0)
+
+                step += 1
+                correction1 = 1 - beta1 ** step
+                correction2 = 1 - beta2 ** step
+                for param, (m, v), grad, index in [(self.weights, moments[0], grad_w, touched),
+                                                   (self.bias, moments[1], grad_b, slice(None))]:
+                    m[index] = beta1 * m[index] + (1 - beta1) * grad
+                    v[index] = beta2 * v[index] + (1 - beta2) * grad * grad
+                    param[index] -= learning_rate * (m[index] / correction1) / (np.sqrt(v[index] / correction2) + eps)
+        return self
+
+    def save(self, path):
+        """Lưu artifact .npz nén (trọng số, bias, số bucket, metadata dạng JSON)"""
+        import json
+        import os
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, n_features=self.n_features,
+                                metadata=json.dumps(self.metadata, ensure_ascii=False))
+
+    @classmethod
+    def load(cls, path):
+        """Tải artifact đã lưu bằng save()"""
+        import json
+
+        with np.load(path) as data:
+            return cls(int(data['n_features']), data['weights'], data['bias'], json.loads(str(data['metadata'])))
+
+    @staticmethod
+    def fingerprint(path):
+        """Hash nội dung artifact (dùng trong key cache: huấn luyện lại thì không dùng kết quả cũ)"""
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
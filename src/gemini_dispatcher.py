@@ -0,0 +1,322 @@
+"""
+Gửi nhiều batch prompt tới Gemini song song (asyncio)
+Giữ tối đa N request đang chạy, giới hạn request/phút và token/phút bằng token bucket,
+tự thử lại khi bị 429 và trả kết quả đúng thứ tự các prompt.
+BatchPacker chia comment thành batch theo ngân sách token input/output và tự điều chỉnh
+theo kích thước response và tỉ lệ lỗi quan sát được
+"""
+
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+class RateLimitError(Exception):
+    """Server trả về 429 (vượt quota), request sẽ được gửi lại sau"""
+
+
+def estimate_tokens(text):
+    """Ước lượng số token của text (~3 ký tự/token với tiếng Việt có dấu và emoji)"""
+    return max(1, len(text) // 3)
+
+
+class BatchPacker:
+    """
+    Chia comment thành các batch theo ngân sách token thay vì số lượng cố định
+
+    Một batch dừng khi đạt input_budget (token prompt ước lượng), khi output dự kiến
+    (số comment x token output/comment x safety) vượt output_budget, hoặc khi đạt items_cap.
+    Sau mỗi response, observe() cập nhật:
+    - output_per_item: trung bình trượt số token output thực tế cho mỗi comment
+      (response bị cắt cụt cho biết số token thực tế, dùng để hiệu chỉnh ước lượng)
+    - items_cap: giảm một nửa khi batch lỗi hoặc bị cắt cụt, giảm 1/4 khi tỉ lệ comment bị thiếu
+      cao, tăng dần khi các batch trả đủ
+    """
+
+    def __init__(self, input_budget=6000, output_budget=2048, initial_items=20, max_items=200,
+                 prompt_overhead=250, output_per_item=8.0, safety=1.5):
+        """
+        Args:
+            input_budget: Số token input tối đa mỗi request
+            output_budget: Số token output tối đa mỗi request
+            initial_items: Số comment tối đa mỗi batch lúc bắt đầu
+            max_items: Giới hạn trên của số comment mỗi batch
+            prompt_overhead: Số token của phần hướng dẫn cố định trong prompt
+            output_per_item: Ước lượng ban đầu số token output cho mỗi comment
+            safety: Hệ số dự phòng khi tính max_output_tokens
+        """
+        self.input_budget = input_budget
+        self.output_budget = output_budget
+        self.max_items = max_items
+        self.items_cap = min(initial_items, max_items)
+        self.prompt_overhead = prompt_overhead
+        self.output_per_item = output_per_item
+        self.safety = safety
+        # Tỉ lệ comment bị thiếu/sai (trung bình trượt)
+        self.miss_rate = 0.0
+        # Số token thực tế / số token ước lượng của response (hiệu chỉnh khi bị cắt cụt)
+        self.token_scale = 1.0
+        self.observed = 0
+        self.failures = 0
+
+    def max_output_tokens(self, n_items):
+        """max_output_tokens cho batch n_items comment"""
+        return min(self.output_budget, math.ceil(n_items * self.output_per_item * self.safety) + 16)
+
+    def pack(self, item_tokens, max_batches=None):
+        """
+        Chia các comment (theo thứ tự) thành batch liên tiếp
+
+        Args:
+            item_tokens: Số token input ước lượng của từng comment
+            max_batches: Chỉ tạo tối đa bấy nhiêu batch (None = hết danh sách)
+
+        Returns:
+            list: Số comment của từng batch
+        """
+        sizes = []
+        count = 0
+        tokens = self.prompt_overhead
+        for size in item_tokens:
+            if count and (count >= self.items_cap
+                          or tokens + size > self.input_budget
+                          or math.ceil((count + 1) * self.output_per_item * self.safety) + 16 > self.output_budget):
+                sizes.append(count)
+                if max_batches is not None and len(sizes) >= max_batches:
+                    return sizes
+                count = 0
+                tokens = self.prompt_overhead
+            count += 1
+            tokens += size
+        if count:
+            sizes.append(count)
+        return sizes
+
+    def observe(self, n_items, n_answered, response_text=None, max_output_tokens=None, truncated=False):
+        """
+        Cập nhật ước lượng sau một response
+
+        Args:
+            n_items: Số comment trong batch
+            n_answered: Số comment có nhãn hợp lệ
+            response_text: Text response (None nếu request lỗi)
+            max_output_tokens: max_output_tokens đã gửi cho batch
+            truncated: Response bị cắt cụt (JSON không đóng)
+        """
+        self.observed += 1
+        if response_text is None:
+            self.failures += 1
+            self.items_cap = max(1, self.items_cap // 2)
+            return
+
+        used = estimate_tokens(response_text)
+        if truncated and max_output_tokens:
+            # Bị cắt ở đúng max_output_tokens: hiệu chỉnh tỉ lệ token thực tế / ước lượng
+            self.failures += 1
+            self.token_scale = max(self.token_scale, max_output_tokens / used)
+            self.output_per_item = max(self.output_per_item, max_output_tokens / max(n_answered, 1))
+            self.items_cap = max(1, self.items_cap // 2)
+        elif n_answered:
+            self.output_per_item = 0.8 * self.output_per_item + 0.2 * (used * self.token_scale / n_answered)
+
+        self.miss_rate = 0.8 * self.miss_rate + 0.2 * (1 - n_answered / n_items)
+        if truncated:
+            return
+        if self.miss_rate > 0.1:
+            self.items_cap = max(1, self.items_cap * 3 // 4)
+        elif n_answered == n_items and n_items >= self.items_cap:
+            self.items_cap = min(self.max_items, self.items_cap + max(1, self.items_cap // 5))
+
+
+class TokenBucket:
+    """
+    Token bucket: nạp lại `rate_per_minute` đơn vị mỗi phút, chứa tối đa `capacity`
+
+    Dùng cho cả giới hạn request/phút (mỗi request = 1) và token/phút (mỗi request = số token).
+    Không gắn với event loop nào: một bucket dùng chung cho mọi lần dispatch() (mỗi lần một
+    event loop mới) nên giới hạn giữ nguyên giữa các lần gọi.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """Chờ tới khi đủ `amount` đơn vị rồi trừ đi (amount lớn hơn capacity được tính bằng capacity)"""
+        amount = min(amount, self.capacity)
+        # Trừ ngay (số dư có thể âm) rồi chờ phần thiếu được nạp lại: các request xếp hàng
+        # theo thứ tự gọi mà không phải giữ lock trong lúc chờ
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            await asyncio.sleep(wait)
+
+    def drain(self):
+        """Bỏ hết đơn vị đang có (sau khi bị 429, các request tiếp theo phải chờ nạp lại)"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+
+class GeminiDispatcher:
+    """
+    Chạy danh sách job (prompt, max_output_tokens) qua hàm gửi async
+
+    send(prompt, max_output_tokens) trả về text của response, raise RateLimitError khi bị 429.
+    Lỗi khác (hoặc 429 quá max_retries lần) được trả về dưới dạng exception tại vị trí của job.
+    """
+
+    def __init__(self, send, max_in_flight=4, requests_per_minute=60, tokens_per_minute=1_000_000,
+                 max_retries=5, backoff=1.0):
+        """
+        Args:
+            send: Hàm async (prompt, max_output_tokens) -> str
+            max_in_flight: Số request chạy đồng thời tối đa
+            requests_per_minute: Giới hạn request/phút
+            tokens_per_minute: Giới hạn token/phút (input ước lượng + max output)
+            max_retries: Số lần thử lại khi bị 429
+            backoff: Thời gian chờ (giây) trước lần thử lại đầu tiên, nhân đôi sau mỗi lần
+        """
+        self.send = send
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = None
+        # Giới hạn request/token tính trên cả đời dispatcher, không nạp đầy lại mỗi lần run()
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+
+    async def run(self, jobs, on_done=None):
+        """
+        Args:
+            jobs: List (prompt, max_output_tokens)
+            on_done: Hàm gọi sau mỗi job hoàn thành, nhận (số job đã xong, tổng số job)
+
+        Returns:
+            list: Text response hoặc exception, cùng thứ tự với jobs
+        """
+        # Semaphore tạo trong event loop đang chạy, bucket dùng chung giữa các lần run()
+        request_bucket = self.request_bucket
+        token_bucket = self.token_bucket
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        results = [None] * len(jobs)
+        stats = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'seconds': 0.0}
+        done = 0
+        start = time.perf_counter()
+
+        async def run_job(idx, prompt, max_output_tokens):
+            nonlocal done
+            cost = estimate_tokens(prompt) + max_output_tokens
+            async with semaphore:
+                for attempt in range(self.max_retries + 1):
+                    await request_bucket.acquire(1)
+                    await token_bucket.acquire(cost)
+                    stats['requests'] += 1
+                    try:
+                        results[idx] = await self.send(prompt, max_output_tokens)
+                        break
+                    except RateLimitError as e:
+                        stats['rate_limited'] += 1
+                        request_bucket.drain()
+                        if attempt == self.max_retries:
+                            results[idx] = e
+                            stats['errors'] += 1
+                            break
+                        delay = self.backoff * (2 ** attempt)
+                        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+                    except Exception as e:
+                        results[idx] = e
+                        stats['errors'] += 1
+                        break
+            done += 1
+            if on_done:
+                on_done(done, len(jobs))
+
+        await asyncio.gather(*(run_job(idx, prompt, max_output_tokens)
+                               for idx, (prompt, max_output_tokens) in enumerate(jobs)))
+        stats['seconds'] = time.perf_counter() - start
+        self.stats = stats
+        return results
+
+    def dispatch(self, jobs, on_done=None):
+        """Bản đồng bộ của run(), dùng được cả khi thread hiện tại đã có event loop chạy (Jupyter)"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.run(jobs, on_done))
+
+        box = {}
+        thread = threading.Thread(target=lambda: box.update(result=asyncio.run(self.run(jobs, on_done))))
+        thread.start()
+        thread.join()
+        return box['result']
+
+
+def gemini_sender(model, temperature=0.2, response_mime_type='application/json'):
+    """
+    Hàm gửi dùng google-generativeai (GenerativeModel.generate_content), mặc định yêu cầu JSON
+
+    Gọi bản đồng bộ trong thread (như http_sender): client async của thư viện gắn với event loop
+    của lần gọi đầu tiên, còn mỗi lần dispatch() chạy trên event loop mới.
+    """
+    import google.generativeai as genai
+
+    async def send(prompt, max_output_tokens):
+        try:
+            response = await asyncio.to_thread(
+                model.generate_content,
+                prompt,
+                generation_config=genai.types.GenerationConfig(
+                    temperature=temperature,
+                    max_output_tokens=max_output_tokens,
+                    response_mime_type=response_mime_type,
+                )
+            )
+        except Exception as e:
+            # google.api_core.exceptions.ResourceExhausted (429)
+            if getattr(e, 'code', None) == 429 or type(e).__name__ == 'ResourceExhausted':
+                raise RateLimitError(str(e)) from e
+            raise
+        return response.text
+
+    return send
+
+
+def http_sender(endpoint, timeout=60):
+    """
+    Hàm gửi tới một endpoint HTTP đơn giản (ví dụ server giả lập gemini_stub_server)
+
+    POST JSON {"prompt", "max_output_tokens"}, nhận JSON {"text"}; HTTP 429 -> RateLimitError.
+    """
+    def post(prompt, max_output_tokens):
+        body = json.dumps({'prompt': prompt, 'max_output_tokens': max_output_tokens}).encode('utf-8')
+        request = urllib.request.Request(endpoint, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read().decode('utf-8'))['text']
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimitError(f"HTTP 429 từ {endpoint}") from e
+            raise
+
+    async def send(prompt, max_output_tokens):
+        return await asyncio.to_thread(post, prompt, max_output_tokens)
+
+    return send
@@ -0,0 +1,224 @@
+"""
+Server HTTP giả lập Gemini để thử GeminiDispatcher mà không cần API key
+Mô phỏng độ trễ, giới hạn request/phút, lỗi 429 ngẫu nhiên, response thiếu/sai mục và
+response bị cắt cụt ở max_output_tokens;
+nhãn của mỗi comment cố định theo nội dung (xem stub_label) nên kiểm tra được kết quả
+ghép lại đúng thứ tự
+
+Sử dụng:
+    python src/gemini_stub_server.py --port 8765 --latency 0.5 --error-rate 0.1
+    python src/sentiment_analyzer.py --input file.csv --gemini-endpoint http://127.0.0.1:8765
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Comment trong batch prompt: 1. "nội dung" (nội dung có thể nhiều dòng)
+_COMMENT_ITEM = re.compile(r'^(\d+)\. "(.*?)"$(?=\n\d+\. "|\n\n|\Z)', re.MULTILINE | re.DOTALL)
+
+
+def stub_label(comment):
+    """Nhãn giả lập (1, 0, -1) cố định theo nội dung comment"""
+    return hashlib.sha1(comment.encode('utf-8')).digest()[0] % 3 - 1
+
+
+# Số ký tự mỗi token output giả lập (response dài hơn max_output_tokens bị cắt cụt)
+STUB_CHARS_PER_TOKEN = 2
+
+
+def stub_response(prompt, drop_rate=0.0, max_output_tokens=None):
+    """
+    Response giả lập cho batch prompt: JSON {số thứ tự: nhãn}
+
+    Mỗi mục bị bỏ (hoặc thay bằng nhãn không hợp lệ) với xác suất drop_rate.
+    Như Gemini, response vượt max_output_tokens bị cắt cụt giữa chừng.
+    """
+    labels = {}
+    for idx, comment in _COMMENT_ITEM.findall(prompt):
+        if random.random() < drop_rate:
+            if random.random() < 0.5:
+                labels[idx] = 2
+            continue
+        labels[idx] = stub_label(comment)
+    text = json.dumps(labels)
+    if max_output_tokens is not None:
+        text = text[:max_output_tokens * STUB_CHARS_PER_TOKEN]
+    return text
+
+
+class GeminiStubServer:
+    """
+    Server giả lập chạy trong thread nền, dùng được như context manager
+
+        with GeminiStubServer(latency=0.2, error_rate=0.1) as server:
+            analyzer = SentimentAnalyzer(use_gemini=True, gemini_endpoint=server.url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.3, jitter=0.1, error_rate=0.0, rpm=None,
+                 drop_rate=0.0):
+        """
+        Args:
+            port: Cổng lắng nghe (0 = chọn cổng trống)
+            latency: Độ trễ trung bình mỗi request (giây)
+            jitter: Độ lệch ngẫu nhiên tối đa của độ trễ (giây)
+            error_rate: Xác suất trả về 429 cho mỗi request
+            rpm: Giới hạn request/phút phía server, vượt quá trả 429 (None = không giới hạn)
+            drop_rate: Xác suất mỗi comment bị thiếu hoặc có nhãn không hợp lệ trong response
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.rate_limited = 0
+        # Thời điểm (time.monotonic) nhận từng request
+        self.request_times = []
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _should_reject(self):
+        """Quyết định trả 429 cho request hiện tại (gọi khi đang giữ lock)"""
+        now = time.monotonic()
+        if self.rpm is not None:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.rpm:
+                return True
+            self._recent.append(now)
+        return random.random() < self.error_rate
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+                with server._lock:
+                    server.requests += 1
+                    server.request_times.append(time.monotonic())
+                    reject = server._should_reject()
+                    if reject:
+                        server.rate_limited += 1
+                    else:
+                        server._concurrent += 1
+                        server.max_concurrent = max(server.max_concurrent, server._concurrent)
+
+                if reject:
+                    self._send(429, {'error': 'RESOURCE_EXHAUSTED'})
+                    return
+
+                try:
+                    time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+                    self._send(200, {'text': stub_response(body.get('prompt', ''), server.drop_rate,
+                                                              body.get('max_output_tokens'))})
+                finally:
+                    with server._lock:
+                        server._concurrent -= 1
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def check_dispatcher_rpm(rpm=60, dispatches=3, jobs_per_dispatch=25, concurrency=4, latency=0.05):
+    """
+    Kiểm tra giới hạn request/phút của GeminiDispatcher được giữ qua nhiều lần dispatch()
+
+    Gửi dispatches lần, mỗi lần jobs_per_dispatch prompt, tới server giả lập. Bucket của dispatcher
+    bắt đầu đầy (rpm request) rồi nạp rpm/60 request mỗi giây, nên trong t giây đầu server
+    không được nhận quá rpm + rpm * t / 60 request (cộng 1 cho sai số đồng hồ).
+
+    Returns:
+        bool: True nếu không lần nào vượt giới hạn
+    """
+    from gemini_dispatcher import GeminiDispatcher, http_sender
+
+    with GeminiStubServer(latency=latency, jitter=0.0) as server:
+        dispatcher = GeminiDispatcher(http_sender(server.url), max_in_flight=concurrency, requests_per_minute=rpm)
+        start = time.monotonic()
+        for i in range(dispatches):
+            jobs = [(f'1. "comment {i}-{j}"', 32) for j in range(jobs_per_dispatch)]
+            dispatcher.dispatch(jobs)
+        times = [t - start for t in server.request_times]
+
+    excess = max((count - (rpm + rpm * t / 60)) for count, t in enumerate(times, 1))
+    ok = excess <= 1
+    print(f"{len(times)} request qua {dispatches} lần dispatch() trong {times[-1]:.1f}s với --rpm {rpm}: "
+          f"{'✓ không vượt' if ok else f'✗ vượt {excess:.0f} request so với'} giới hạn của token bucket")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server giả lập Gemini (độ trễ + 429) để thử batch dispatcher')
+    parser.add_argument('--port', type=int, default=8765, help='Cổng lắng nghe (mặc định: 8765)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Độ trễ mỗi request, giây (mặc định: 0.5)')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Độ lệch ngẫu nhiên của độ trễ, giây (mặc định: 0.1)')
+    parser.add_argument('--error-rate', type=float, default=0.05,
+                        help='Xác suất trả về 429 (mặc định: 0.05)')
+    parser.add_argument('--rpm', type=int, default=None, help='Giới hạn request/phút phía server')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='Xác suất mỗi comment bị thiếu/sai nhãn trong response (mặc định: 0)')
+    parser.add_argument('--check-rpm', type=int, default=None, metavar='RPM',
+                        help='Không chạy server: kiểm tra GeminiDispatcher giữ giới hạn RPM qua nhiều lần dispatch()')
+    args = parser.parse_args()
+
+    if args.check_rpm:
+        raise SystemExit(0 if check_dispatcher_rpm(args.check_rpm) else 1)
+
+    server = GeminiStubServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, rpm=args.rpm, drop_rate=args.drop_rate)
+    print(f"Server giả lập Gemini đang chạy tại {server.url} (Ctrl+C để dừng)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+        print(f"\nĐã nhận {server.requests} request, {server.rate_limited} lần 429, "
+              f"tối đa {server.max_concurrent} request đồng thời")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Ánh xạ label của model sentiment sang -1/0/1
+Tính một lần từ config.id2label khi tải model thành mảng tra cứu, sau đó cả batch output
+được chuyển bằng vài phép toán NumPy (argmax + index) thay vì so chuỗi từng label.
+Model đánh giá theo sao (nlptown: '1 star' ... '5 stars') có thể dùng kỳ vọng số sao
+theo xác suất thay cho label cao nhất
+"""
+
+import re
+
+import numpy as np
+
+# Cách chuyển model đánh giá theo sao sang sentiment
+# - 'argmax': label có xác suất cao nhất (1-2 sao tiêu cực, 3 sao trung tính, 4-5 sao tích cực)
+# - 'expected': số sao kỳ vọng theo xác suất (< 2.5 tiêu cực, > 3.5 tích cực, còn lại trung tính)
+STAR_MAPPINGS = ['argmax', 'expected']
+
+_STAR_LABEL = re.compile(r'^\s*(\d+)\s*stars?\s*$', re.IGNORECASE)
+
+# Thứ tự cột nhóm xác suất (giống RAW_COLUMNS của sentiment_analyzer: pos, neu, neg)
+_GROUPS = [1, 0, -1]
+
+
+def label_sentiment(label, position, n_labels):
+    """
+    Sentiment (-1/0/1) và số sao (None nếu không phải label sao) của một label
+
+    Args:
+        label: Tên label trong id2label ('positive', '4 stars', 'LABEL_2', ...)
+        position: Vị trí (id) của label
+        n_labels: Số label của model (dùng cho label dạng LABEL_k)
+    """
+    match = _STAR_LABEL.match(label)
+    if match:
+        stars = int(match.group(1))
+        return (-1 if stars <= 2 else 0 if stars == 3 else 1), stars
+
+    name = label.strip().lower()
+    if name.startswith('neg'):
+        return -1, None
+    if name.startswith('neu'):
+        return 0, None
+    if name.startswith('pos'):
+        return 1, None
+    # Label không tên (LABEL_0, LABEL_1, ...): theo quy ước tiêu cực -> (trung tính) -> tích cực
+    if n_labels == 3:
+        return [-1, 0, 1][position], None
+    if n_labels == 2:
+        return [-1, 1][position], None
+    print(f"⚠️  Không nhận ra label '{label}', coi là trung tính")
+    return 0, None
+
+
+class LabelMapping:
+    """Bảng tra label id -> sentiment và ma trận gom xác suất theo pos/neu/neg của một model"""
+
+    def __init__(self, id2label, star_mapping='argmax'):
+        """
+        Args:
+            id2label: Dict {id: tên label} trong config của model
+            star_mapping: Một trong STAR_MAPPINGS (chỉ có tác dụng với model đánh giá theo sao)
+        """
+        if star_mapping not in STAR_MAPPINGS:
+            raise ValueError(f"star_mapping không hợp lệ: {star_mapping}. Chọn một trong: {', '.join(STAR_MAPPINGS)}")
+
+        ids = sorted(int(i) for i in id2label)
+        self.labels = [id2label[i] if i in id2label else id2label[str(i)] for i in ids]
+        self.index = {label: i for i, label in enumerate(self.labels)}
+
+        mapped = [label_sentiment(label, i, len(self.labels)) for i, label in enumerate(self.labels)]
+        # sentiment[id] -> -1/0/1
+        self.sentiment = np.array([sentiment for sentiment, _ in mapped], dtype=np.int64)
+        # groups[id, k] = 1 nếu label thuộc nhóm _GROUPS[k]
+        self.groups = (self.sentiment[:, None] == np.array(_GROUPS)[None, :]).astype(np.float64)
+
+        stars = [stars for _, stars in mapped]
+        self.stars = np.array(stars, dtype=np.float64) if all(s is not None for s in stars) else None
+        if star_mapping == 'expected' and self.stars is None:
+            print("⚠️  Model không đánh giá theo sao, dùng label có xác suất cao nhất")
+            star_mapping = 'argmax'
+        self.star_mapping = star_mapping
+
+    @classmethod
+    def from_pipeline(cls, pipeline, star_mapping='argmax'):
+        """Tạo bảng tra từ model.config.id2label của pipeline"""
+        return cls(pipeline.model.config.id2label, star_mapping)
+
+    def probability_matrix(self, outputs):
+        """
+        Output của pipeline (top_k=None) -> ma trận xác suất
+
+        Args:
+            outputs: Với mỗi text, list dict {'label', 'score'} của mọi label
+
+        Returns:
+            numpy array: (số text x số label), cột theo id của label
+        """
+        probs = np.zeros((len(outputs), len(self.labels)))
+        for i, label_scores in enumerate(outputs):
+            for item in label_scores:
+                probs[i, self.index[item['label']]] = item['score']
+        return probs
+
+    def raw_outputs(self, probs):
+        """
+        Ma trận xác suất -> output thô (label, pos, neu, neg, confidence) cho cả batch
+
+        Với 'argmax', label là sentiment của label cao nhất và confidence là xác suất của nó;
+        với 'expected', label theo số sao kỳ vọng và confidence là tổng xác suất của nhóm đó.
+        """
+        probs = np.asarray(probs, dtype=np.float64)
+        rows = np.arange(len(probs))
+        grouped = probs @ self.groups
+
+        if self.star_mapping == 'expected':
+            expected = (probs @ self.stars) / np.maximum(probs.sum(axis=1), 1e-12)
+            labels = np.select([expected < 2.5, expected > 3.5], [-1, 1], default=0)
+            # Cột của nhóm trong grouped: 1 -> 0 (pos), 0 -> 1 (neu), -1 -> 2 (neg)
+            confidence = grouped[rows, 1 - labels]
+        else:
+            top = probs.argmax(axis=1)
+            labels = self.sentiment[top]
+            confidence = probs[rows, top]
+
+        return np.column_stack([labels, grouped, confidence])
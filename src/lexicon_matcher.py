@@ -0,0 +1,223 @@
+"""
+So khớp nhiều từ khóa/cụm từ/emoji trong một lần duyệt text (Aho-Corasick)
+Dùng cho phần chấm điểm từ khóa của SentimentAnalyzer
+"""
+
+import bisect
+from collections import deque
+
+import numpy as np
+
+# Thư viện C (pyahocorasick) nhanh hơn nhiều, nếu không có thì dùng bản Python thuần
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+# Ký tự phân cách khi nối các text trong hit_matrix
+_SEPARATOR = b'\x00'
+
+
+class _PyAhoCorasick:
+    """Automaton Aho-Corasick viết bằng Python thuần"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                    self.goto[node][ch] = nxt
+                node = nxt
+            self.out[node] = self.out[node] + (pattern_id,)
+
+        # Tính fail link theo BFS, gộp output của trạng thái fail
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+        self.alphabet = set().union(*(set(p) for p in patterns)) if patterns else set()
+
+    def find(self, text):
+        """Trả về tập id các pattern xuất hiện trong text (kể cả chồng lấn nhau)"""
+        goto, fail, out, alphabet = self.goto, self.fail, self.out, self.alphabet
+        found = set()
+        node = 0
+        for ch in text:
+            if ch not in alphabet:
+                node = 0
+                continue
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class _CAhoCorasick:
+    """Bọc pyahocorasick với cùng interface như _PyAhoCorasick"""
+
+    def __init__(self, patterns):
+        self.automaton = ahocorasick.Automaton()
+        for pattern_id, pattern in enumerate(patterns):
+            self.automaton.add_word(pattern, pattern_id)
+        self.automaton.make_automaton()
+        self.has_patterns = bool(patterns)
+
+    def find(self, text):
+        if not self.has_patterns:
+            return set()
+        return {pattern_id for _, pattern_id in self.automaton.iter(text)}
+
+
+class LexiconMatcher:
+    """
+    Biên dịch nhiều danh sách pattern thành một automaton duy nhất
+
+    Mỗi danh sách là một nhóm (category). count(text) trả về, cho từng nhóm, số phần tử
+    của danh sách xuất hiện trong text. Phần tử lặp lại trong danh sách được đếm nhiều lần,
+    giống như khi duyệt `for keyword in LIST: if keyword in text`.
+    """
+
+    def __init__(self, categories):
+        """
+        Args:
+            categories: Dict {tên nhóm: list các pattern}, thứ tự nhóm được giữ nguyên
+        """
+        self.category_names = list(categories)
+        self.patterns = []
+        # pattern_categories[pattern_id] = list (chỉ số nhóm, số lần pattern có trong danh sách của nhóm)
+        self.pattern_categories = []
+        pattern_ids = {}
+
+        for category_idx, patterns in enumerate(categories.values()):
+            for pattern in patterns:
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = len(self.patterns)
+                    self.patterns.append(pattern)
+                    self.pattern_categories.append({})
+                weights = self.pattern_categories[pattern_ids[pattern]]
+                weights[category_idx] = weights.get(category_idx, 0) + 1
+
+        self.pattern_categories = [list(weights.items()) for weights in self.pattern_categories]
+        self._encoded_patterns = [pattern.encode('utf-8') for pattern in self.patterns]
+        if any(_SEPARATOR in pattern for pattern in self._encoded_patterns):
+            raise ValueError("Pattern không được chứa ký tự \\x00")
+
+        # category_matrix[pattern_id, category_idx] = số lần pattern có trong danh sách của nhóm
+        self.category_matrix = np.zeros((len(self.patterns), len(self.category_names)), dtype=np.int32)
+        for pattern_id, weights in enumerate(self.pattern_categories):
+            for category_idx, multiplicity in weights:
+                self.category_matrix[pattern_id, category_idx] = multiplicity
+
+        self._automaton = (_CAhoCorasick if HAS_AHOCORASICK else _PyAhoCorasick)(self.patterns)
+
+    def find(self, text):
+        """Tập id các pattern (chỉ số trong self.patterns) xuất hiện trong text"""
+        return self._automaton.find(text)
+
+    def count(self, text):
+        """
+        Đếm số pattern xuất hiện theo từng nhóm
+
+        Returns:
+            list: Số lượng theo thứ tự self.category_names
+        """
+        counts = [0] * len(self.category_names)
+        for pattern_id in self._automaton.find(text):
+            for category_idx, multiplicity in self.pattern_categories[pattern_id]:
+                counts[category_idx] += multiplicity
+        return counts
+
+    def hit_matrix(self, texts):
+        """
+        Ma trận thưa (số text x số pattern), phần tử = 1 nếu pattern xuất hiện trong text
+
+        Args:
+            texts: pandas Series các chuỗi (đã lower, không có NaN)
+
+        Returns:
+            scipy.sparse.csr_matrix
+        """
+        from scipy import sparse
+
+        docs = texts.tolist()
+        if not self.patterns:
+            rows = cols = np.zeros(0, dtype=np.int64)
+        elif HAS_AHOCORASICK:
+            rows, cols = self._hits_single_pass(docs)
+        else:
+            rows, cols = self._hits_per_pattern(docs)
+
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(len(docs), len(self.patterns))
+        )
+        # Một pattern khớp nhiều lần trong cùng text vẫn chỉ tính 1
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def _hits_single_pass(self, docs):
+        """(chỉ số text, id pattern) của mọi lần khớp, duyệt cả cột một lần bằng pyahocorasick"""
+        lengths = np.fromiter(map(len, docs), dtype=np.int64, count=len(docs))
+        ends = np.cumsum(lengths + 1) - 1
+        matches = np.array(list(self._automaton.automaton.iter(_SEPARATOR.decode().join(docs))),
+                           dtype=np.int64).reshape(-1, 2)
+        return np.searchsorted(ends, matches[:, 0], side='right'), matches[:, 1]
+
+    def _hits_per_pattern(self, docs):
+        """(chỉ số text, id pattern) của các text chứa từng pattern, mỗi pattern quét cả cột một lần"""
+        # Nối tất cả text (dạng UTF-8) thành một chuỗi bytes, phân cách bằng ký tự không có
+        # trong pattern nào; UTF-8 tự đồng bộ nên khớp bytes <=> khớp ký tự
+        docs = [doc.encode('utf-8') for doc in docs]
+        lengths = np.fromiter(map(len, docs), dtype=np.int64, count=len(docs))
+        ends = (np.cumsum(lengths + 1) - 1).tolist()
+        corpus = _SEPARATOR.join(docs)
+
+        rows = []
+        cols = []
+        for pattern_id, pattern in enumerate(self._encoded_patterns):
+            # bytes.find chạy trong C; sau mỗi lần khớp nhảy sang text kế tiếp
+            # nên số vòng lặp Python = số text chứa pattern
+            hits = []
+            pos = corpus.find(pattern)
+            while pos != -1:
+                doc = bisect.bisect_right(ends, pos)
+                hits.append(doc)
+                if doc + 1 >= len(docs):
+                    break
+                pos = corpus.find(pattern, ends[doc] + 1)
+            if hits:
+                rows.append(np.asarray(hits, dtype=np.int64))
+                cols.append(np.full(len(hits), pattern_id, dtype=np.int64))
+
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def count_matrix(self, texts):
+        """
+        Đếm theo nhóm cho cả cột: hit_matrix @ category_matrix
+
+        Returns:
+            numpy array (số text x số nhóm), cùng ý nghĩa với count() cho từng text
+        """
+        return np.asarray(self.hit_matrix(texts) @ self.category_matrix)
@@ -0,0 +1,98 @@
+"""
+Kho output thô của model trên đĩa (SQLite)
+Key = hash(text đưa vào model + model), không phụ thuộc từ điển từ khóa: mỗi comment lưu nhãn
+label cao nhất của model (-1/0/1), xác suất pos/neu/neg và confidence trước khi kết hợp với
+từ khóa/emoji. Sau khi sửa từ điển hoặc ngưỡng kết hợp, chạy lại chỉ cần kết hợp lại trên
+output đã lưu (SentimentAnalyzer.fuse_outputs), không phải chạy lại model
+"""
+
+import os
+import sqlite3
+import threading
+
+from sentiment_cache import SentimentCache
+
+# Cột output thô của model (thứ tự như RAW_COLUMNS của sentiment_analyzer)
+_RAW_COLUMNS = ['label', 'pos', 'neu', 'neg', 'confidence']
+
+
+class ModelOutputStore:
+    """Output thô của model theo nội dung comment, dùng chung cho mọi phiên bản từ điển"""
+
+    # SQLite giới hạn số tham số trong một câu lệnh
+    _CHUNK_SIZE = 500
+
+    def __init__(self, path):
+        """
+        Mở (hoặc tạo) kho output
+
+        Args:
+            path: Đường dẫn file SQLite
+        """
+        self.path = path
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outputs ('
+            'key TEXT PRIMARY KEY, label INTEGER NOT NULL, pos REAL NOT NULL, neu REAL NOT NULL, '
+            'neg REAL NOT NULL, confidence REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    make_key = staticmethod(SentimentCache.make_key)
+
+    def get_many(self, keys):
+        """
+        Tra cứu nhiều key cùng lúc
+
+        Returns:
+            dict: {key: (label, pos, neu, neg, confidence)} cho các key đã có output
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self._CHUNK_SIZE):
+                chunk = keys[i:i+self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, {", ".join(_RAW_COLUMNS)} FROM outputs WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                found.update((row[0], row[1:]) for row in rows)
+        self.lookups += len(keys)
+        self.hits += len(found)
+        return found
+
+    def put_many(self, items):
+        """Ghi nhiều output {key: (label, pos, neu, neg, confidence)}"""
+        if not items:
+            return
+        rows = [(key, int(output[0]), *(float(value) for value in output[1:])) for key, output in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO outputs (key, {", ".join(_RAW_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.commit()
+
+    def reset_stats(self):
+        self.lookups = 0
+        self.hits = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outputs').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
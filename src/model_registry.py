@@ -0,0 +1,183 @@
+"""
+Registry dùng chung trong process cho các pipeline đã tải
+Mỗi model (theo tên + tùy chọn) chỉ tải một lần, mọi SentimentAnalyzer dùng chung
+(ví dụ nhiều session Streamlit, nhiều lần bấm "Phân Tích Sentiment")
+"""
+
+import copy
+import gc
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _LockedTokenizer:
+    """Bọc tokenizer để các lần gọi trực tiếp cũng đi qua lock của pipeline"""
+
+    def __init__(self, tokenizer, lock):
+        self._tokenizer = tokenizer
+        self._lock = lock
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._tokenizer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tokenizer, name)
+
+
+class SharedPipeline:
+    """
+    Pipeline dùng chung giữa nhiều thread
+
+    Fast tokenizer và model của HuggingFace không an toàn khi gọi đồng thời,
+    nên mỗi lần gọi pipeline/tokenizer được tuần tự hóa bằng một lock riêng của pipeline.
+    """
+
+    def __init__(self, pipeline):
+        self._pipeline = pipeline
+        self._lock = threading.RLock()
+        tokenizer = getattr(pipeline, 'tokenizer', None)
+        self.tokenizer = _LockedTokenizer(tokenizer, self._lock) if tokenizer is not None else None
+        # Các bản sao tokenizer đang rảnh (xem tokenizer_copy)
+        self._spare_tokenizers = []
+        self._spare_lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._pipeline(*args, **kwargs)
+
+    def forward(self, encoded):
+        """
+        Forward pass của model trên batch đã tokenize, dùng chung lock với __call__
+
+        Args:
+            encoded: Dict tensor đầu vào (input_ids, attention_mask, ...) đã nằm trên device của model
+
+        Returns:
+            Tensor logits
+        """
+        import torch
+        with self._lock, torch.inference_mode():
+            return self._pipeline.model(**encoded).logits
+
+    @contextmanager
+    def tokenizer_copy(self):
+        """
+        Mượn một bản sao tokenizer riêng, gọi được không cần lock
+
+        Một instance fast tokenizer không gọi đồng thời được, nên mỗi thread tokenize song song
+        dùng bản sao của riêng nó; bản sao được trả lại để lần sau dùng tiếp thay vì sao chép lại.
+        """
+        with self._spare_lock:
+            tokenizer = self._spare_tokenizers.pop() if self._spare_tokenizers else None
+        if tokenizer is None:
+            with self._lock:
+                tokenizer = copy.deepcopy(self._pipeline.tokenizer)
+        try:
+            yield tokenizer
+        finally:
+            with self._spare_lock:
+                self._spare_tokenizers.append(tokenizer)
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+
+class ModelRegistry:
+    """Lưu các pipeline đã tải theo key, tự bỏ model ít dùng nhất khi vượt quá max_models"""
+
+    def __init__(self, max_models=None):
+        """
+        Args:
+            max_models: Số pipeline tối đa giữ trong registry (None = không giới hạn)
+        """
+        self.max_models = max_models
+        self._pipelines = OrderedDict()
+        self._lock = threading.Lock()
+        # Lock theo key để hai thread cùng yêu cầu một model thì chỉ tải một lần
+        self._load_locks = {}
+
+    def get(self, key, loader):
+        """
+        Lấy pipeline theo key, tải bằng loader() nếu chưa có
+
+        Args:
+            key: Tuple định danh model và tùy chọn (tên, backend, int8, device, ...)
+            loader: Hàm không tham số trả về pipeline mới
+
+        Returns:
+            SharedPipeline
+        """
+        with self._lock:
+            if key in self._pipelines:
+                self._pipelines.move_to_end(key)
+                return self._pipelines[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._pipelines:
+                    self._pipelines.move_to_end(key)
+                    return self._pipelines[key]
+
+            shared = SharedPipeline(loader())
+
+            with self._lock:
+                self._pipelines[key] = shared
+                self._load_locks.pop(key, None)
+                if self.max_models is not None:
+                    while len(self._pipelines) > self.max_models:
+                        self._pipelines.popitem(last=False)
+            return shared
+
+    def evict(self, key):
+        """
+        Bỏ một pipeline khỏi registry
+
+        Bộ nhớ chỉ được giải phóng khi không còn analyzer nào giữ pipeline đó.
+
+        Returns:
+            bool: True nếu key có trong registry
+        """
+        with self._lock:
+            removed = self._pipelines.pop(key, None) is not None
+        if removed:
+            gc.collect()
+        return removed
+
+    def clear(self):
+        """Bỏ tất cả pipeline khỏi registry, trả về số pipeline đã bỏ"""
+        with self._lock:
+            count = len(self._pipelines)
+            self._pipelines.clear()
+        gc.collect()
+        return count
+
+    def keys(self):
+        """Danh sách key đang được giữ, từ ít dùng gần đây nhất đến mới nhất"""
+        with self._lock:
+            return list(self._pipelines)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pipelines)
+
+
+def describe_key(key):
+    """
+    Tên hiển thị của một key trong registry
+
+    Key transformer: (tên model, backend, int8, device) -> "tên (backend, int8)"
+    Key bộ phân loại nhanh: (file artifact, hash nội dung, 'fast', device) -> "file.npz (fast @hash)"
+    """
+    if len(key) == 4 and key[2] == 'fast':
+        path, fingerprint = key[:2]
+        return f"{os.path.basename(path)} (fast @{fingerprint})"
+    name, backend, quantized = key[:3]
+    return f"{name} ({backend}{', int8' if quantized else ''})"
+
+
+# Registry mặc định của process
+MODEL_REGISTRY = ModelRegistry()
@@ -1,22 +1,28 @@
 """
 Script chạy nhanh để phân tích dữ liệu
-Sử dụng: python src/run_analysis.py
+Sử dụng: python src/run_analysis.py [--input FILE]
 """
 
 import sys
 import os
+import argparse
 
 # Thêm thư mục src vào path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from data_analysis import TikTokDataAnalyzer
-
 def main():
     """Chạy phân tích dữ liệu cho file CSV"""
+    parser = argparse.ArgumentParser(description='Phân tích dữ liệu comments TikTok')
+    parser.add_argument('--input', '-i', type=str,
+                        default='dataset_tiktok-comments-637video-scraper_2026-01-15.csv',
+                        help='File CSV đầu vào')
+    args = parser.parse_args()
+    
+    # Import sau khi parse tham số (--help không phải tải pandas)
+    from data_analysis import TikTokDataAnalyzer
     
-    # File mặc định
-    input_file = 'dataset_tiktok-comments-637video-scraper_2026-01-15.csv'
+    input_file = args.input
     
     # Kiểm tra file có tồn tại không
     if not os.path.exists(input_file):
@@ -0,0 +1,252 @@
+"""
+Auto-tune suy luận trên CPU cho máy này
+Thử các tổ hợp backend x số thread intra-op/inter-op x batch size trên mẫu comment lấy từ
+dữ liệu của người dùng, đo comment/s và RAM đỉnh (peak RSS), rồi lưu cấu hình nhanh nhất vào
+profile (tuning_profile.PROFILE_PATH). SentimentAnalyzer và app.py dùng profile này làm mặc định.
+Mỗi tổ hợp backend x thread chạy trong process Python mới: torch chỉ cho đặt số thread inter-op
+một lần mỗi process, và RAM đỉnh được đo riêng cho từng cấu hình
+Sử dụng: python src/run_auto_tune.py [--input comments.csv ...] [--sample 256] [--model ...]
+"""
+
+import sys
+import os
+import argparse
+import importlib.util
+import json
+import random
+import subprocess
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from tuning_profile import PROFILE_PATH, save_profile
+
+# Dòng kết quả của process đo (các dòng khác là log của analyzer)
+_RESULT_PREFIX = 'AUTO_TUNE_RESULT '
+
+DEFAULT_BATCH_SIZES = [8, 16, 32, 64]
+
+
+def peak_rss_mb():
+    """RAM đỉnh (MB) của process hiện tại, None nếu không đo được"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về byte
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    if importlib.util.find_spec('psutil') is not None:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    return None
+
+
+def available_backends():
+    """Backend có thể đo trên máy này (onnx cần optimum và onnxruntime)"""
+    backends = ['torch']
+    if importlib.util.find_spec('optimum') is not None and importlib.util.find_spec('onnxruntime') is not None:
+        backends.append('onnx')
+    return backends
+
+
+def default_thread_counts():
+    """Số thread intra-op cần thử: 1, 2, một nửa và toàn bộ số CPU"""
+    cpus = os.cpu_count() or 1
+    return sorted({n for n in [1, 2, cpus // 2, cpus] if 1 <= n <= cpus})
+
+
+def default_interop_counts():
+    """Số thread inter-op cần thử: 1 và 2 (nếu máy có từ 2 CPU)"""
+    return [n for n in [1, 2] if n <= (os.cpu_count() or 1)]
+
+
+def load_sample(input_files=None, text_column='text', sample_size=256, seed=42):
+    """
+    Lấy mẫu comment (không trùng, không rỗng) từ các file CSV
+
+    Args:
+        input_files: Danh sách file CSV (None = các file trong src/data)
+        text_column: Tên cột chứa text
+        sample_size: Số comment lấy mẫu
+        seed: Seed lấy mẫu (cùng seed thì cùng mẫu giữa các lần tune)
+    """
+    import pandas as pd
+    from sentiment_analyzer import _bundled_datasets
+
+    input_files = input_files or _bundled_datasets()
+    texts = pd.concat([pd.read_csv(f, usecols=[text_column])[text_column] for f in input_files], ignore_index=True)
+    texts = texts.dropna().astype(str)
+    texts = texts[texts.str.strip() != ''].drop_duplicates().tolist()
+    if len(texts) > sample_size:
+        texts = random.Random(seed).sample(texts, sample_size)
+    return texts
+
+
+def measure_config(config):
+    """
+    Đo một tổ hợp backend x thread với mọi batch size (chạy trong process đo)
+
+    Returns:
+        list: Mỗi batch size một dict comments_per_sec, seconds, peak_rss_mb
+    """
+    from sentiment_analyzer import SentimentAnalyzer
+
+    analyzer = SentimentAnalyzer(model_name=config['model_name'], backend=config['backend'],
+                                 intra_op_threads=config['intra_op_threads'],
+                                 inter_op_threads=config['inter_op_threads'],
+                                 max_tokens=config.get('max_tokens'), tuned_profile=False)
+    texts = config['texts']
+    silent = lambda *_: None
+    # Chạy khởi động một batch (khởi tạo thread pool) trước khi đo, với batch size nhỏ nhất:
+    # ru_maxrss là RAM đỉnh của cả process, khởi động bằng batch lớn sẽ che RAM đỉnh của các batch nhỏ
+    warmup = min(config['batch_sizes'])
+    analyzer._run_model_batches(texts[:warmup], batch_size=warmup, progress_callback=silent)
+
+    results = []
+    # Batch size tăng dần nên RAM đỉnh sau mỗi lần đo là RAM đỉnh của batch size đó
+    # (RAM cần cho batch lớn hơn không ảnh hưởng tới số đo của batch nhỏ hơn đã ghi trước)
+    for batch_size in sorted(config['batch_sizes']):
+        start = time.perf_counter()
+        analyzer._run_model_batches(texts, batch_size=batch_size, progress_callback=silent)
+        seconds = time.perf_counter() - start
+        results.append({
+            'batch_size': batch_size,
+            'seconds': seconds,
+            'comments_per_sec': len(texts) / seconds if seconds > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+        })
+    return results
+
+
+def run_config(config, timeout=None):
+    """Chạy measure_config trong process Python mới, trả về list kết quả ([] nếu lỗi)"""
+    try:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker'], input=json.dumps(config),
+                              capture_output=True, text=True, cwd=current_dir, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"    ✗ quá {timeout:.0f}s, bỏ qua")
+        return []
+    for line in proc.stdout.splitlines():
+        if line.startswith(_RESULT_PREFIX):
+            return json.loads(line[len(_RESULT_PREFIX):])
+    error = (proc.stderr.strip().splitlines() or ['không có kết quả'])[-1]
+    print(f"    ✗ lỗi (exit {proc.returncode}): {error[:150]}")
+    return []
+
+
+def tune(texts, model_name, backends, thread_counts, interop_counts, batch_sizes, max_tokens=None,
+         max_rss_mb=None, timeout=None):
+    """
+    Đo mọi tổ hợp, chọn cấu hình nhanh nhất cho từng backend
+
+    Args:
+        texts: Mẫu comment
+        model_name: Model cần tune
+        backends, thread_counts, interop_counts, batch_sizes: Các giá trị cần thử
+        max_tokens: Số token tối đa đưa vào model (như tham số của SentimentAnalyzer)
+        max_rss_mb: Bỏ qua cấu hình có RAM đỉnh vượt ngưỡng này (MB)
+        timeout: Thời gian tối đa (giây) cho mỗi process đo
+
+    Returns:
+        tuple: (backend nhanh nhất, {backend: cấu hình tốt nhất}, list mọi kết quả)
+    """
+    results = []
+    for backend in backends:
+        for intra in thread_counts:
+            for inter in interop_counts:
+                print(f"  {backend:<6} {intra:>2} thread intra-op / {inter} inter-op ...")
+                config = dict(model_name=model_name, backend=backend, intra_op_threads=intra,
+                              inter_op_threads=inter, batch_sizes=batch_sizes, max_tokens=max_tokens, texts=texts)
+                for result in run_config(config, timeout):
+                    result.update(backend=backend, intra_op_threads=intra, inter_op_threads=inter)
+                    rss = result['peak_rss_mb']
+                    print(f"    batch {result['batch_size']:>3}: {result['comments_per_sec']:8.1f} comment/s"
+                          + (f", RAM đỉnh {rss:.0f} MB" if rss is not None else ''))
+                    results.append(result)
+
+    best = {}
+    for result in results:
+        rss = result['peak_rss_mb']
+        if max_rss_mb and rss is not None and rss > max_rss_mb:
+            continue
+        current = best.get(result['backend'])
+        if current is None or result['comments_per_sec'] > current['comments_per_sec']:
+            best[result['backend']] = {key: result[key] for key in
+                                       ['batch_size', 'intra_op_threads', 'inter_op_threads',
+                                        'comments_per_sec', 'peak_rss_mb']}
+    best_backend = max(best, key=lambda b: best[b]['comments_per_sec']) if best else None
+    return best_backend, best, results
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    if '--worker' in sys.argv:
+        print(_RESULT_PREFIX + json.dumps(measure_config(json.loads(sys.stdin.read()))))
+        return
+
+    parser = argparse.ArgumentParser(description='Tìm backend/số thread/batch size nhanh nhất trên máy này')
+    parser.add_argument('--input', '-i', nargs='+', default=None, metavar='CSV',
+                        help='File CSV lấy mẫu comment (mặc định: các file trong src/data)')
+    parser.add_argument('--text-column', '-t', default='text', help='Tên cột chứa text (mặc định: text)')
+    parser.add_argument('--model', '-m', default='cardiffnlp/twitter-roberta-base-sentiment-latest',
+                        choices=['cardiffnlp/twitter-roberta-base-sentiment-latest',
+                                 'nlptown/bert-base-multilingual-uncased-sentiment'],
+                        help='Model cần tune')
+    parser.add_argument('--sample', type=int, default=256, help='Số comment lấy mẫu (mặc định: 256)')
+    parser.add_argument('--backends', default=','.join(available_backends()),
+                        help='Backend cần thử, phân cách bằng dấu phẩy (mặc định: các backend đã cài)')
+    parser.add_argument('--threads', type=_int_list, default=default_thread_counts(),
+                        help='Số thread intra-op cần thử (mặc định: '
+                             f'{",".join(map(str, default_thread_counts()))})')
+    parser.add_argument('--interop-threads', type=_int_list, default=default_interop_counts(),
+                        help='Số thread inter-op cần thử (mặc định: '
+                             f'{",".join(map(str, default_interop_counts()))})')
+    parser.add_argument('--batch-sizes', type=_int_list, default=DEFAULT_BATCH_SIZES,
+                        help=f'Batch size cần thử (mặc định: {",".join(map(str, DEFAULT_BATCH_SIZES))})')
+    parser.add_argument('--max-tokens', type=int, default=None,
+                        help='Đo với giới hạn token như --max-tokens của sentiment_analyzer.py')
+    parser.add_argument('--max-rss', type=float, default=None, metavar='MB',
+                        help='Chỉ chọn cấu hình có RAM đỉnh không vượt quá ngưỡng này')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='Thời gian tối đa cho mỗi process đo, giây (mặc định: 600)')
+    parser.add_argument('--profile', default=PROFILE_PATH, help=f'File profile (mặc định: {PROFILE_PATH})')
+    parser.add_argument('--dry-run', action='store_true', help='Chỉ in kết quả, không lưu profile')
+    args = parser.parse_args()
+
+    texts = load_sample(args.input, args.text_column, args.sample)
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+
+    print("=" * 60)
+    print("AUTO-TUNE SUY LUẬN TRÊN CPU")
+    print("=" * 60)
+    print(f"Model: {args.model} | {len(texts)} comment mẫu | {os.cpu_count()} CPU")
+
+    best_backend, best, _ = tune(texts, args.model, backends, args.threads, args.interop_threads,
+                                 args.batch_sizes, max_tokens=args.max_tokens, max_rss_mb=args.max_rss,
+                                 timeout=args.timeout)
+    if not best_backend:
+        print("\n✗ Không đo được cấu hình nào" + (f" dưới {args.max_rss:.0f} MB" if args.max_rss else ''))
+        sys.exit(1)
+
+    print("\nCấu hình nhanh nhất:")
+    for backend, config in best.items():
+        flag = '→' if backend == best_backend else ' '
+        rss = config['peak_rss_mb']
+        print(f"  {flag} {backend:<6} batch {config['batch_size']:>3}, {config['intra_op_threads']}/"
+              f"{config['inter_op_threads']} thread: {config['comments_per_sec']:.1f} comment/s"
+              + (f", RAM đỉnh {rss:.0f} MB" if rss is not None else ''))
+
+    if args.dry_run:
+        return
+    save_profile(args.model, best_backend, best, len(texts), path=args.profile, max_tokens=args.max_tokens)
+    print(f"\n✓ Đã lưu profile vào: {args.profile}")
+
+
+if __name__ == '__main__':
+    main()
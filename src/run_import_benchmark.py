@@ -0,0 +1,118 @@
+"""
+Đo thời gian khởi động (import) của các đường chạy nhẹ
+Mỗi đường chạy được chạy trong process Python mới nhiều lần, báo median
+Sử dụng: python src/run_import_benchmark.py [--runs N] [--limit GIÂY]
+"""
+
+import sys
+import os
+import argparse
+import ast
+import statistics
+import subprocess
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def app_import_block():
+    """
+    Mã nguồn phần đầu app.py (import và gán biến module) chạy trước lệnh Streamlit đầu tiên
+
+    Đọc trực tiếp từ app.py nên không phải cập nhật khi app.py đổi import.
+    Không chạy cả app.py: ngoài `streamlit run`, các lệnh vẽ trang sẽ chạy hết cả trang
+    """
+    with open(os.path.join(current_dir, 'app.py'), encoding='utf-8') as f:
+        source = f.read()
+    block = []
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+            continue  # docstring
+        if not isinstance(node, (ast.Import, ast.ImportFrom, ast.Assign)):
+            break
+        block.append(ast.get_source_segment(source, node))
+    return '\n'.join(block)
+
+# Tên -> lệnh chạy trong process mới (cwd = src/)
+BENCHMARKS = {
+    'import sentiment_analyzer': [sys.executable, '-c', 'import sentiment_analyzer'],
+    'chấm từ khóa (không model)': [
+        sys.executable, '-c',
+        'from sentiment_analyzer import SentimentAnalyzer; '
+        'SentimentAnalyzer.score_lexicon(["tuyệt vời", "dở tệ =))"])'
+    ],
+    'import data_analysis': [sys.executable, '-c', 'import data_analysis'],
+    'run_analysis.py --help': [sys.executable, 'run_analysis.py', '--help'],
+    'run_sentiment.py --help': [sys.executable, 'run_sentiment.py', '--help'],
+    # Phần import ở đầu app.py (chạy trước lần vẽ đầu tiên của Streamlit)
+    'app.py import đầu trang': [sys.executable, '-c', app_import_block()],
+}
+
+# Module nặng không được phép xuất hiện trong các đường chạy trên
+HEAVY_MODULES = ['torch', 'transformers', 'google.generativeai', 'matplotlib', 'seaborn', 'plotly']
+
+
+def time_command(cmd, runs):
+    """Chạy lệnh runs lần, trả về (median giây, returncode lần cuối, dòng lỗi cuối cùng)"""
+    timings = []
+    returncode = 0
+    error = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=current_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        timings.append(time.perf_counter() - start)
+        returncode = proc.returncode
+        error = (proc.stderr.strip().splitlines() or [''])[-1]
+    return statistics.median(timings), returncode, error
+
+
+def loaded_heavy_modules(module):
+    """Các module nặng bị kéo theo khi import module"""
+    code = (
+        f'import sys, {module}; '
+        f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    )
+    proc = subprocess.run([sys.executable, '-c', code], cwd=current_dir, capture_output=True, text=True)
+    return proc.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Đo thời gian import/khởi động các đường chạy nhẹ')
+    parser.add_argument('--runs', type=int, default=5, help='Số lần chạy mỗi lệnh (mặc định: 5)')
+    parser.add_argument('--limit', type=float, default=1.0,
+                        help='Ngưỡng cảnh báo, giây (mặc định: 1.0)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("ĐO THỜI GIAN KHỞI ĐỘNG")
+    print("=" * 60)
+
+    slow = []
+    failed = []
+    for name, cmd in BENCHMARKS.items():
+        median, returncode, error = time_command(cmd, args.runs)
+        if returncode != 0:
+            print(f"  ✗ {name:<30} lỗi (exit {returncode}): {error[:150]}")
+            failed.append(name)
+            continue
+        flag = '✓' if median < args.limit else '✗'
+        print(f"  {flag} {name:<30} {median*1000:8.0f} ms")
+        if median >= args.limit:
+            slow.append(name)
+
+    print("\nModule nặng bị import sẵn:")
+    for module in ['sentiment_analyzer', 'data_analysis', 'model_registry']:
+        heavy = loaded_heavy_modules(module)
+        print(f"  {module:<20} {heavy or 'không có'}")
+
+    if failed:
+        print(f"\n✗ Không đo được (lỗi khi chạy): {', '.join(failed)}")
+    if slow:
+        print(f"\n⚠️  Chậm hơn {args.limit}s: {', '.join(slow)}")
+    if failed or slow:
+        sys.exit(1)
+    print(f"\n✓ Tất cả đường chạy dưới {args.limit}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,26 @@
 """
 Script chạy nhanh để phân tích sentiment
-Sử dụng: python src/run_sentiment.py
+Sử dụng: python src/run_sentiment.py [--workers N]
 """
 
 import sys
 import os
+import argparse
 
 # Thêm thư mục src vào path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from sentiment_analyzer import SentimentAnalyzer
-
 def main():
     """Chạy phân tích sentiment cho file CSV"""
+    parser = argparse.ArgumentParser(description='Chạy nhanh phân tích sentiment')
+    parser.add_argument('--workers', '-w',
+                       type=int, default=1,
+                       help='Số process chạy song song (mặc định: 1)')
+    args = parser.parse_args()
+    
+    # Import sau khi parse tham số (--help không phải tải pandas)
+    from sentiment_analyzer import SentimentAnalyzer
     
     # File mặc định
     input_file = 'dataset_tiktok-comments-637video-scraper_2026-01-15.csv'
@@ -44,7 +51,7 @@ def main():
         analyzer.process_csv(
             input_file=input_file,
             output_file=None,  # Ghi đè file đầu vào
-            batch_size=32
+            workers=args.workers
         )
         print("\n✓ Hoàn thành!")
     except Exception as e:
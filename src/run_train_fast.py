@@ -0,0 +1,219 @@
+"""
+Huấn luyện bộ phân loại tuyến tính cho backend 'fast' và đánh giá so với transformer
+- Dữ liệu có nhãn: cột trust/sentiment của các file đã gán nhãn trong src/data
+- Chưng cất: mọi comment trong src/data (trừ tập kiểm tra) được transformer (teacher) chấm xác suất
+  pos/neu/neg; mục tiêu huấn luyện là xác suất của teacher, trộn với nhãn người gán ở các dòng có nhãn
+- Đánh giá trên phần dữ liệu có nhãn giữ lại: độ chính xác so với nhãn của bộ phân loại nhanh và
+  của transformer (output thô và sau khi kết hợp từ khóa/emoji), độ đồng thuận giữa hai bên,
+  tốc độ (comment/phút trên 1 core) và kích thước artifact
+Sử dụng: python src/run_train_fast.py [--teacher MODEL | --no-teacher] [--output PATH]
+"""
+
+import sys
+import os
+import argparse
+import json
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+import numpy as np
+import pandas as pd
+
+from fast_classifier import FastClassifier
+from sentiment_analyzer import (DEFAULT_FAST_MODEL_PATH, DEFAULT_MODEL_STORE_PATH, SentimentAnalyzer,
+                                _bundled_datasets)
+
+# Các file đã gán nhãn (cột trust hoặc sentiment: 1, 0, -1)
+LABELED_DATASETS = [
+    os.path.join(current_dir, 'data', 'highland', 'dataset_tiktok-comments-trust-scraper_2026-01-15_10-34-22-836.csv'),
+    os.path.join(current_dir, 'data', 'katinat', 'sentiment_results_20260116_095218.csv'),
+]
+
+
+def load_labeled(input_files, text_column='text', label_column=None):
+    """
+    Đọc các file có nhãn, bỏ dòng rỗng/nhãn không hợp lệ, mỗi comment giữ nhãn đầu tiên
+
+    Args:
+        input_files: Danh sách file CSV
+        text_column: Tên cột chứa text
+        label_column: Tên cột nhãn (None = 'trust' nếu có, nếu không thì 'sentiment')
+
+    Returns:
+        DataFrame: Cột text và label (int)
+    """
+    frames = []
+    for path in input_files:
+        df = pd.read_csv(path)
+        column = label_column or ('trust' if 'trust' in df.columns else 'sentiment')
+        frames.append(pd.DataFrame({'text': df[text_column], 'label': pd.to_numeric(df[column], errors='coerce')}))
+    df = pd.concat(frames, ignore_index=True).dropna()
+    df['text'] = df['text'].astype(str)
+    df = df[(df['text'].str.strip() != '') & df['label'].isin([-1, 0, 1])]
+    return df.drop_duplicates('text').astype({'label': int}).reset_index(drop=True)
+
+
+def one_hot(labels):
+    """Nhãn -1/0/1 -> phân phối (pos, neu, neg)"""
+    targets = np.zeros((len(labels), 3), dtype=np.float32)
+    targets[np.arange(len(labels)), 1 - np.asarray(labels)] = 1
+    return targets
+
+
+def teacher_outputs(teacher, texts):
+    """Output thô (RAW_COLUMNS) của transformer, qua kho output nếu teacher có model_store"""
+    return teacher._with_model_store([text[:512] for text in texts], lambda batch: teacher._run_model_batches(
+        batch, batch_size=teacher.batch_size))
+
+
+def measure_throughput(classifier_path, texts, min_rows=200_000):
+    """
+    Tốc độ chấm điểm của bộ phân loại vừa tải (1 process)
+
+    Chỉ đo trên các comment khác nhau. Nếu chưa đủ min_rows thì chấm lại cả danh sách, mỗi lượt
+    xóa bảng nhớ bucket trước: lượt lặp lại không được tra sẵn từ lượt trước, số đo so sánh
+    được với tốc độ transformer.
+
+    Returns:
+        tuple: (số comment/phút, số comment khác nhau đã dùng)
+    """
+    classifier = FastClassifier.load(classifier_path)
+    unique = list(dict.fromkeys(texts))
+    scored = 0
+    seconds = 0.0
+    while unique and scored < min_rows:
+        classifier._memo.clear()
+        start = time.perf_counter()
+        for i in range(0, len(unique), 4096):
+            classifier.raw_outputs(unique[i:i+4096])
+        seconds += time.perf_counter() - start
+        scored += len(unique)
+    return (scored / seconds * 60 if seconds > 0 else 0.0), len(unique)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Huấn luyện bộ phân loại nhanh (backend 'fast') và đánh giá so với transformer")
+    parser.add_argument('--labeled', nargs='+', default=LABELED_DATASETS, metavar='CSV',
+                        help='File CSV có nhãn (mặc định: highland trust-scraper và katinat sentiment_results)')
+    parser.add_argument('--label-column', default=None,
+                        help='Tên cột nhãn (mặc định: trust nếu có, nếu không thì sentiment)')
+    parser.add_argument('--unlabeled', nargs='*', default=None, metavar='CSV',
+                        help='File CSV không cần nhãn để chưng cất từ teacher (mặc định: các file trong src/data)')
+    parser.add_argument('--text-column', '-t', default='text', help='Tên cột chứa text (mặc định: text)')
+    parser.add_argument('--teacher', default='nlptown/bert-base-multilingual-uncased-sentiment',
+                        choices=['nlptown/bert-base-multilingual-uncased-sentiment',
+                                 'cardiffnlp/twitter-roberta-base-sentiment-latest'],
+                        help='Transformer dùng làm teacher và để so sánh')
+    parser.add_argument('--no-teacher', action='store_true',
+                        help='Chỉ huấn luyện trên nhãn có sẵn (không cần torch), không so sánh với transformer')
+    parser.add_argument('--model-store', default=DEFAULT_MODEL_STORE_PATH, metavar='PATH', help='Kho output thô của teacher, chạy lại không phải chấm lại '
+                                             f'(mặc định: {DEFAULT_MODEL_STORE_PATH})')
+    parser.add_argument('--label-weight', type=float, default=0.5,
+                        help='Tỉ trọng nhãn người gán so với xác suất của teacher ở các dòng có nhãn (mặc định: 0.5)')
+    parser.add_argument('--test-size', type=float, default=0.2,
+                        help='Tỉ lệ dữ liệu có nhãn giữ lại để đánh giá (mặc định: 0.2)')
+    parser.add_argument('--epochs', type=int, default=10, help='Số lượt huấn luyện (mặc định: 10)')
+    parser.add_argument('--output', '-o', default=DEFAULT_FAST_MODEL_PATH,
+                        help=f'File artifact (mặc định: {DEFAULT_FAST_MODEL_PATH})')
+    parser.add_argument('--seed', type=int, default=42, help='Seed chia tập kiểm tra (mặc định: 42)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("HUẤN LUYỆN BỘ PHÂN LOẠI NHANH")
+    print("=" * 60)
+
+    labeled = load_labeled(args.labeled, args.text_column, args.label_column)
+    is_test = np.random.default_rng(args.seed).random(len(labeled)) < args.test_size
+    train, test = labeled[~is_test], labeled[is_test]
+    test_texts = set(test['text'])
+    print(f"Có nhãn: {len(labeled)} comment ({len(train)} huấn luyện, {len(test)} kiểm tra)")
+
+    texts = train['text'].tolist()
+    targets = one_hot(train['label'])
+    teacher = None
+    if not args.no_teacher:
+        unlabeled_files = args.unlabeled if args.unlabeled is not None else _bundled_datasets()
+        unlabeled = pd.concat([pd.read_csv(f, usecols=[args.text_column])[args.text_column] for f in unlabeled_files],
+                              ignore_index=True).dropna().astype(str)
+        train_texts = set(texts)
+        unlabeled = [text for text in unlabeled.drop_duplicates() if text.strip()
+                     and text not in test_texts and text not in train_texts]
+        print(f"Chưng cất từ {args.teacher} trên {len(texts) + len(unlabeled)} comment "
+              f"({len(unlabeled)} comment không nhãn)...")
+
+        teacher = SentimentAnalyzer(model_name=args.teacher, model_store_path=args.model_store)
+        raw = teacher_outputs(teacher, texts + unlabeled)
+        probs = raw[:, 1:4].astype(np.float32)
+        has_output = ~np.isnan(probs).any(axis=1)
+        probs = probs[has_output] / probs[has_output].sum(axis=1, keepdims=True)
+
+        # Dòng có nhãn: trộn nhãn người gán với xác suất của teacher; dòng không nhãn: xác suất của teacher
+        labeled_rows = has_output[:len(texts)]
+        soft = probs[:labeled_rows.sum()]
+        targets = np.concatenate([
+            args.label_weight * targets[labeled_rows] + (1 - args.label_weight) * soft,
+            probs[labeled_rows.sum():],
+        ])
+        texts = [text for text, ok in zip(texts + unlabeled, has_output) if ok]
+
+    start = time.perf_counter()
+    classifier = FastClassifier().fit(texts, targets, epochs=args.epochs)
+    train_seconds = time.perf_counter() - start
+    print(f"Đã huấn luyện trên {len(texts)} comment trong {train_seconds:.1f}s")
+
+    # Đánh giá trên tập kiểm tra (không dùng khi huấn luyện)
+    test_list = test['text'].tolist()
+    labels = test['label'].to_numpy()
+    fast_raw = classifier.raw_outputs(test_list)
+    report = {
+        'teacher': None if args.no_teacher else args.teacher,
+        'train_rows': len(texts),
+        'test_rows': len(test_list),
+        'train_seconds': train_seconds,
+        'fast_accuracy': float((fast_raw[:, 0] == labels).mean()),
+        'fast_pipeline_accuracy': float((SentimentAnalyzer.fuse_outputs(test_list, fast_raw)[0][:, 0] == labels).mean()),
+    }
+    if teacher is not None:
+        start = time.perf_counter()
+        teacher_raw = teacher._run_model_batches([text[:512] for text in test_list], batch_size=teacher.batch_size,
+                                                 progress_callback=lambda *_: None)
+        teacher_seconds = time.perf_counter() - start
+        teacher_fused = SentimentAnalyzer.fuse_outputs(test_list, teacher_raw)[0][:, 0]
+        fast_fused = SentimentAnalyzer.fuse_outputs(test_list, fast_raw)[0][:, 0]
+        report.update({
+            'teacher_accuracy': float((teacher_raw[:, 0] == labels).mean()),
+            'teacher_pipeline_accuracy': float((teacher_fused == labels).mean()),
+            'agreement': float((fast_raw[:, 0] == teacher_raw[:, 0]).mean()),
+            'pipeline_agreement': float((fast_fused == teacher_fused).mean()),
+            'teacher_comments_per_minute': len(test_list) / teacher_seconds * 60 if teacher_seconds > 0 else None,
+        })
+
+    classifier.metadata = {'teacher': report['teacher'], 'trained_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                           'report': report}
+    classifier.save(args.output)
+    report['artifact_bytes'] = os.path.getsize(args.output)
+    throughput, unique_texts = measure_throughput(args.output, test_list + texts)
+    report.update(fast_comments_per_minute=throughput, throughput_unique_texts=unique_texts)
+
+    report_path = os.path.splitext(args.output)[0] + '.report.json'
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\n=== Đánh giá trên {report['test_rows']} comment có nhãn giữ lại ===")
+    print(f"{'':<22}{'model':>10}{'+ từ khóa':>12}")
+    print(f"{'Bộ phân loại nhanh':<22}{report['fast_accuracy']*100:>9.2f}%{report['fast_pipeline_accuracy']*100:>11.2f}%")
+    if teacher is not None:
+        print(f"{'Transformer':<22}{report['teacher_accuracy']*100:>9.2f}%{report['teacher_pipeline_accuracy']*100:>11.2f}%")
+        print(f"Đồng thuận với transformer: {report['agreement']*100:.2f}% "
+              f"(sau khi kết hợp từ khóa: {report['pipeline_agreement']*100:.2f}%)")
+        print(f"Tốc độ transformer: {report['teacher_comments_per_minute']:,.0f} comment/phút")
+    print(f"Tốc độ bộ phân loại nhanh: {report['fast_comments_per_minute']:,.0f} comment/phút "
+          f"(1 core, {report['throughput_unique_texts']} comment khác nhau)")
+    print(f"\n✓ Đã lưu artifact ({report['artifact_bytes'] / 1024:.0f} KB): {args.output}")
+    print(f"✓ Báo cáo: {report_path}")
+
+
+if __name__ == '__main__':
+    main()
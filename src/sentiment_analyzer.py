@@ -8,23 +8,64 @@ Tool phân tích sentiment cho comments TikTok
 
 import pandas as pd
 import numpy as np
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from transformers import pipeline
-import torch
-from tqdm import tqdm
 import warnings
 import sys
 import os
 import re
+import math
 import time
+import hashlib
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-# Try import Gemini
-try:
+# Thêm thư mục src vào path để import các module cùng thư mục (khi dùng `from src.sentiment_analyzer import ...`)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sentiment_cache import SentimentCache
+from model_output_store import ModelOutputStore
+from checkpoint_journal import CheckpointJournal
+from lexicon_matcher import LexiconMatcher
+from label_mapping import STAR_MAPPINGS, LabelMapping
+from staged_pipeline import StagedPipeline
+from model_registry import MODEL_REGISTRY
+from tuning_profile import load_profile
+from fast_classifier import FastClassifier
+from gemini_dispatcher import BatchPacker, GeminiDispatcher, estimate_tokens, gemini_sender, http_sender
+
+# torch, transformers, tqdm và google-generativeai chỉ được import khi thực sự cần
+# (chấm từ khóa, --help, mở app không phải chờ tải các thư viện nặng)
+def _has_gemini():
+    """Kiểm tra google-generativeai đã được cài mà không import"""
+    import importlib.util
+    try:
+        return importlib.util.find_spec('google.generativeai') is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def _genai():
+    """Import google.generativeai khi dùng Gemini"""
     import google.generativeai as genai
-    HAS_GEMINI = True
-except ImportError:
-    HAS_GEMINI = False
-    print("⚠️  google-generativeai chưa được cài đặt. Chạy: pip install google-generativeai")
+    return genai
+
+
+def _progress(iterable, **kwargs):
+    """Bọc iterable bằng tqdm nếu có (cho CLI)"""
+    try:
+        from tqdm import tqdm
+        return tqdm(iterable, **kwargs)
+    except ImportError:
+        return iterable
+
+
+def _progress_bar(total, **kwargs):
+    """Thanh tiến trình tqdm cập nhật thủ công (None nếu không có tqdm)"""
+    try:
+        from tqdm import tqdm
+        return tqdm(total=total, **kwargs)
+    except ImportError:
+        return None
 
 # Fix encoding for Windows console
 if sys.platform == 'win32':
@@ -38,6 +79,21 @@ if sys.platform == 'win32':
 
 warnings.filterwarnings('ignore')
 
+# Thư mục cache cho các model đã export/chuyển đổi (ONNX, ...)
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache')
+
+# File cache sentiment mặc định (xem sentiment_cache.py)
+DEFAULT_CACHE_PATH = os.path.join(MODEL_CACHE_DIR, 'sentiment_cache.sqlite')
+
+# File kho output thô của model mặc định (xem model_output_store.py)
+DEFAULT_MODEL_STORE_PATH = os.path.join(MODEL_CACHE_DIR, 'model_outputs.sqlite')
+
+# File bộ phân loại tuyến tính của backend 'fast' mặc định (huấn luyện bằng run_train_fast.py)
+DEFAULT_FAST_MODEL_PATH = os.path.join(MODEL_CACHE_DIR, 'fast_classifier.npz')
+
+# Backend suy luận: transformer model (torch, onnx) hoặc bộ phân loại tuyến tính chưng cất (fast)
+BACKENDS = ['torch', 'onnx', 'fast']
+
 # Từ khóa tích cực tiếng Việt
 POSITIVE_KEYWORDS = [
     'xinh', 'đẹp', 'cute', 'dễ thương', 'hay', 'tốt', 'tuyệt', 'vui', 'thích', 'yêu',
@@ -101,12 +157,75 @@ POSITIVE_EMOJIS = ['😊', '😍', '🥰', '😘', '😁', '😂', '🤗', '😄
 NEGATIVE_EMOJIS = ['😢', '😭', '😤', '😠', '😡', '🤬', '😞', '😔', '😟', '😕', 
                    '🙁', '☹️', '😣', '😖', '😫', '😩', '💔', '👎', '❌', '🚫']
 
+# Cụm từ "không sao" (cộng thêm điểm tích cực) và dấu hiệu sarcasm
+NO_PROBLEM_PHRASES = ['không sao', 'k sao', 'ko sao', 'khong sao']
+SARCASM_INDICATORS = [':))', '=))', ':)))', '=)))', ':))))', '=))))']
+
+# Phiên bản từ điển từ khóa/emoji, thay đổi khi sửa bất kỳ danh sách nào ở trên (dùng làm key cache)
+LEXICON_VERSION = hashlib.sha1(repr((
+    POSITIVE_KEYWORDS, NEGATIVE_KEYWORDS, NEGATIVE_PHRASES, NEUTRAL_PHRASES,
+    POSITIVE_EMOJIS, NEGATIVE_EMOJIS, NO_PROBLEM_PHRASES, SARCASM_INDICATORS
+)).encode('utf-8')).hexdigest()[:12]
+
+# Tất cả danh sách trên được biên dịch thành một automaton, so khớp trong một lần duyệt text.
+# Emoji và dấu sarcasm không đổi khi lower() nên có thể so khớp chung trên text đã lower.
+LEXICON_MATCHER = LexiconMatcher({
+    'negative_phrases': NEGATIVE_PHRASES,
+    'neutral_phrases': NEUTRAL_PHRASES,
+    'positive_keywords': POSITIVE_KEYWORDS,
+    'negative_keywords': NEGATIVE_KEYWORDS,
+    'positive_emojis': POSITIVE_EMOJIS,
+    'negative_emojis': NEGATIVE_EMOJIS,
+    'no_problem': NO_PROBLEM_PHRASES,
+    'sarcasm': SARCASM_INDICATORS,
+})
+_POS_EMOJI_IDX = LEXICON_MATCHER.category_names.index('positive_emojis')
+_NEG_EMOJI_IDX = LEXICON_MATCHER.category_names.index('negative_emojis')
+
+
+def _add_repeated(score, weight, times):
+    """Cộng weight vào score `times` lần (giữ đúng kết quả số thực như khi cộng trong vòng lặp)"""
+    for _ in range(times):
+        score += weight
+    return score
+
+
+def _add_repeated_array(scores, weights, times):
+    """Phiên bản NumPy của _add_repeated: cộng weight vào từng phần tử đúng times[i] lần"""
+    for j in range(int(times.max()) if len(times) else 0):
+        scores = np.where(times > j, scores + weights, scores)
+    return scores
+
+
+# Cột của mảng kết quả trong analyze_batch: nhãn cuối cùng (-1/0/1), xác suất tích cực/trung tính/
+# tiêu cực của model và độ tin cậy của model (xác suất label cao nhất). Xác suất là NaN khi model
+# không chạy cho dòng đó (text rỗng, đã chốt bằng từ khóa, Gemini)
+OUTPUT_COLUMNS = ['score', 'pos', 'neu', 'neg', 'confidence']
+
+# Cột output thô của model (trước khi kết hợp với từ khóa/emoji): nhãn của label cao nhất (-1/0/1),
+# xác suất tích cực/trung tính/tiêu cực và độ tin cậy. NaN khi model chưa chạy cho dòng đó
+RAW_COLUMNS = ['label', 'pos', 'neu', 'neg', 'confidence']
+
+
+def _label_outputs(labels):
+    """Mảng kết quả (float32) cho các nhãn không có xác suất của model"""
+    labels = np.asarray(labels)
+    outputs = np.full((len(labels), len(OUTPUT_COLUMNS)), np.nan, dtype=np.float32)
+    outputs[:, 0] = labels
+    return outputs
+
 
 class SentimentAnalyzer:
     """Phân tích sentiment sử dụng model đa ngôn ngữ hoặc Gemini API"""
     
     def __init__(self, model_name='cardiffnlp/twitter-roberta-base-sentiment-latest', 
-                 use_gemini=False, gemini_api_key=None):
+                 use_gemini=False, gemini_api_key=None, bucket_by_length=False, backend=None,
+                 quantized=False, cache_path=None, cache_max_entries=1_000_000, lexicon_cascade=False,
+                 cascade_model=None, cascade_threshold=0.7, max_tokens=None,
+                 gemini_concurrency=4, gemini_rpm=60, gemini_tpm=1_000_000, gemini_endpoint=None,
+                 gemini_retry_rounds=2, model_store_path=None, star_mapping='argmax',
+                 pipeline_threads=0, pipeline_queue=2, batch_size=None, intra_op_threads=None,
+                 inter_op_threads=None, tuned_profile=True, fast_model_path=None):
         """
         Khởi tạo sentiment analyzer
         
@@ -117,13 +236,142 @@ class SentimentAnalyzer:
                        - 'gemini-2.5-flash': Sử dụng Gemini 2.5 Flash API (chính xác nhất)
             use_gemini: Nếu True, sử dụng Gemini thay vì transformer model
             gemini_api_key: API key cho Gemini (hoặc lấy từ env GEMINI_API_KEY)
+            bucket_by_length: Nếu True, sắp xếp texts theo số token trước khi chia batch
+                              để giảm padding (kết quả vẫn giữ đúng thứ tự ban đầu)
+            backend: Backend suy luận cho transformer model (None = theo profile auto-tune, không có thì 'torch')
+                     - 'torch': PyTorch
+                     - 'onnx': ONNX Runtime trên CPU, model được export một lần và cache trong MODEL_CACHE_DIR
+                     - 'fast': Bộ phân loại tuyến tính (hashing + logistic) chưng cất từ transformer, không cần
+                               torch, hàng triệu comment/phút trên 1 core (huấn luyện bằng run_train_fast.py)
+            quantized: Nếu True, lượng tử hóa động int8 các lớp Linear (chỉ backend torch, chạy trên CPU).
+                       Model đã lượng tử hóa được cache trong MODEL_CACHE_DIR
+            cache_path: File SQLite để cache kết quả theo nội dung comment (None = không dùng cache)
+            cache_max_entries: Số kết quả tối đa trong cache, vượt quá thì xóa các kết quả lâu không dùng
+            lexicon_cascade: Nếu True, chấm từ khóa cho cả batch trước, các dòng mà kết quả không phụ thuộc
+                             model được chốt luôn, chỉ các dòng còn lại mới chạy transformer
+            cascade_model: Model thứ 2 (nặng, chính xác hơn, ví dụ nlptown/bert-base-multilingual-uncased-sentiment).
+                           Nếu có, model_name (nhẹ, nhanh) chấm mọi comment, chỉ các comment có xác suất
+                           lớp cao nhất < cascade_threshold mới được chấm lại bằng cascade_model
+            cascade_threshold: Ngưỡng xác suất để chuyển comment sang model thứ 2
+            max_tokens: Số token tối đa đưa vào model (ví dụ 128). Comment dài hơn được cắt giữ phần đầu
+                        và phần cuối (head+tail) theo tokenizer của model chính. None = giới hạn 512 token như cũ
+            gemini_concurrency: Số batch request Gemini chạy song song tối đa
+            gemini_rpm: Giới hạn request/phút gửi tới Gemini
+            gemini_tpm: Giới hạn token/phút (input ước lượng + output tối đa) gửi tới Gemini
+            gemini_endpoint: URL endpoint HTTP thay cho Gemini API (ví dụ server giả lập
+                             gemini_stub_server.py), không cần API key
+            gemini_retry_rounds: Số vòng gửi lại các comment Gemini trả thiếu hoặc nhãn không hợp lệ
+            model_store_path: File SQLite lưu output thô của model theo nội dung comment (không phụ thuộc
+                              từ điển từ khóa). Sửa từ điển/ngưỡng rồi chạy lại chỉ cần kết hợp lại trên
+                              output đã lưu, model chỉ chạy cho comment chưa có output (None = không dùng)
+            star_mapping: Cách chuyển model đánh giá theo sao (nlptown) sang sentiment
+                          - 'argmax': label có xác suất cao nhất (mặc định)
+                          - 'expected': số sao kỳ vọng theo xác suất (< 2.5 tiêu cực, > 3.5 tích cực)
+            pipeline_threads: Nếu > 0, chạy chồng lấp 3 stage bằng thread: tokenize (bấy nhiêu thread)
+                              -> forward pass của model -> chuyển output sang nhãn (và tầng cascade),
+                              để model không phải chờ phần xử lý chuỗi. 0 = chạy tuần tự qua pipeline
+            pipeline_queue: Số batch tối đa chờ giữa hai stage (backpressure, giới hạn bộ nhớ)
+            batch_size: Batch size mặc định của analyze_batch/process_csv (None = theo profile auto-tune,
+                        không có thì 32)
+            intra_op_threads: Số thread trong một phép toán của torch/ONNX Runtime (None = theo profile auto-tune,
+                              không có thì giữ mặc định của thư viện)
+            inter_op_threads: Số thread chạy song song các phép toán độc lập (None = như intra_op_threads)
+            tuned_profile: Nếu True, dùng profile do run_auto_tune.py đo trên máy này (tuning_profile.PROFILE_PATH)
+                           cho các tham số backend/batch_size/thread không chỉ định
+            fast_model_path: File bộ phân loại của backend 'fast' (None = DEFAULT_FAST_MODEL_PATH)
         """
-        self.use_gemini = use_gemini or model_name == 'gemini-2.5-flash'
+        use_gemini = use_gemini or model_name == 'gemini-2.5-flash'
+        # Profile auto-tune: backend, batch size và số thread nhanh nhất đã đo cho model trên máy này
+        self.profile = (load_profile(model_name, backend, max_tokens=max_tokens)
+                        if tuned_profile and not use_gemini and not quantized else None)
+        if self.profile:
+            backend = backend or self.profile['backend']
+            batch_size = batch_size or self.profile['batch_size']
+            intra_op_threads = intra_op_threads or self.profile['intra_op_threads']
+            inter_op_threads = inter_op_threads or self.profile['inter_op_threads']
+        backend = backend or 'torch'
+        
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend không hợp lệ: {backend}. Chọn một trong: {', '.join(BACKENDS)}")
+        if quantized and backend != 'torch':
+            raise ValueError("quantized=True chỉ hỗ trợ backend 'torch'")
+        if star_mapping not in STAR_MAPPINGS:
+            raise ValueError(f"star_mapping không hợp lệ: {star_mapping}. Chọn một trong: {', '.join(STAR_MAPPINGS)}")
+        if backend == 'fast' and not use_gemini:
+            fast_model_path = fast_model_path or DEFAULT_FAST_MODEL_PATH
+            if not os.path.exists(fast_model_path):
+                raise FileNotFoundError(f"Chưa có bộ phân loại nhanh: {fast_model_path}. "
+                                        "Huấn luyện bằng: python src/run_train_fast.py")
+            if bucket_by_length or pipeline_threads or max_tokens:
+                print("Backend fast không tokenize: bỏ qua bucket_by_length, pipeline_threads và max_tokens")
+            bucket_by_length, pipeline_threads, max_tokens = False, 0, None
+            # Mỗi batch chỉ là một phép nhân ma trận thưa, batch lớn giảm chi phí vòng lặp
+            batch_size = batch_size or 4096
+        
+        self.use_gemini = use_gemini
         self.gemini_model = None
+        self.gemini_dispatcher = None
+        self.gemini_stats = None
+        self.gemini_retry_rounds = gemini_retry_rounds
+        # Chia batch Gemini theo ngân sách token, học dần trong suốt phiên làm việc
+        self.gemini_packer = BatchPacker()
         self.sentiment_pipeline = None
+        self.fast_classifier = None
+        self.cascade_pipeline = None
+        # Bảng tra label -> sentiment của từng pipeline (từ config.id2label)
+        self.label_mapping = None
+        self.cascade_label_mapping = None
+        self.star_mapping = star_mapping
+        self.cascade_threshold = cascade_threshold
+        self.max_tokens = max_tokens
+        self.bucket_by_length = bucket_by_length
+        self.pipeline_threads = pipeline_threads
+        self.pipeline_queue = pipeline_queue
+        self.backend = backend
+        self.quantized = quantized
+        self.batch_size = batch_size or 32
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        # Tham số khởi tạo, dùng để tạo lại analyzer trong các worker process
+        # (worker tự chia thread theo số process nên không dùng profile)
+        self._init_kwargs = dict(model_name=model_name, bucket_by_length=bucket_by_length,
+                                 backend=backend, quantized=quantized,
+                                 cascade_model=cascade_model, cascade_threshold=cascade_threshold,
+                                 max_tokens=max_tokens, star_mapping=star_mapping,
+                                 pipeline_threads=pipeline_threads, pipeline_queue=pipeline_queue,
+                                 batch_size=self.batch_size, tuned_profile=False, fast_model_path=fast_model_path)
+        self.lexicon_cascade = lexicon_cascade
+        # Thống kê padding, loại trùng và cascade của lần analyze_batch gần nhất
+        self.padding_stats = None
+        self.dedup_stats = None
+        self.cascade_stats = None
+        self.tier_stats = None
+        self.pipeline_stats = None
+        # Cache kết quả theo text + model + phiên bản từ điển và luật kết hợp
+        self.cache = SentimentCache(cache_path, max_entries=cache_max_entries) if cache_path else None
+        cache_model = f"gemini@{gemini_endpoint}" if gemini_endpoint else 'gemini' if self.use_gemini else f"{model_name}|{backend}{'|int8' if quantized else ''}"
+        fast_fingerprint = None
+        if backend == 'fast' and not self.use_gemini:
+            # Kết quả phụ thuộc trọng số đã huấn luyện, không phụ thuộc model_name
+            fast_fingerprint = FastClassifier.fingerprint(fast_model_path)
+            cache_model = f"fast@{fast_fingerprint}"
+        if cascade_model and not self.use_gemini:
+            cache_model += f"|{cascade_model}@{cascade_threshold}"
+        if max_tokens and not self.use_gemini:
+            cache_model += f"|tok{max_tokens}"
+        if star_mapping != 'argmax' and not self.use_gemini:
+            cache_model += f"|stars-{star_mapping}"
+        self._cache_model_key = f"{cache_model}|{LEXICON_VERSION}|{FUSION_VERSION}"
+        # Output thô của model không phụ thuộc từ điển: key chỉ gồm text + model
+        self.model_store = ModelOutputStore(model_store_path) if model_store_path and not self.use_gemini else None
+        self._model_store_key = cache_model
         
-        if self.use_gemini:
-            if not HAS_GEMINI:
+        if self.use_gemini and gemini_endpoint:
+            print(f"Đang dùng endpoint Gemini: {gemini_endpoint}")
+            self.gemini_dispatcher = GeminiDispatcher(http_sender(gemini_endpoint), max_in_flight=gemini_concurrency,
+                                                      requests_per_minute=gemini_rpm, tokens_per_minute=gemini_tpm)
+        elif self.use_gemini:
+            if not _has_gemini():
                 raise ImportError("google-generativeai chưa được cài đặt. Chạy: pip install google-generativeai")
             
             # Lấy API key từ parameter hoặc environment variable
@@ -133,6 +381,7 @@ class SentimentAnalyzer:
             
             print("Đang khởi tạo Gemini 2.5 Flash...")
             try:
+                genai = _genai()
                 genai.configure(api_key=api_key)
                 # Thử dùng gemini-2.0-flash-exp (model mới nhất), fallback về gemini-1.5-flash
                 try:
@@ -144,83 +393,192 @@ class SentimentAnalyzer:
             except Exception as e:
                 print(f"❌ Lỗi khi khởi tạo Gemini: {e}")
                 raise
+            self.gemini_dispatcher = GeminiDispatcher(gemini_sender(self.gemini_model), max_in_flight=gemini_concurrency,
+                                                      requests_per_minute=gemini_rpm, tokens_per_minute=gemini_tpm)
+        elif backend == 'fast':
+            # Chỉ cần NumPy/SciPy, chạy trên CPU
+            self.device = -1
+            print(f"Đang tải bộ phân loại nhanh: {fast_model_path}...")
+            # Key gồm hash nội dung: huấn luyện lại artifact cùng đường dẫn thì tải bản mới và bỏ bản cũ
+            for key in MODEL_REGISTRY.keys():
+                if key[0] == fast_model_path and key[2] == backend and key[1] != fast_fingerprint:
+                    MODEL_REGISTRY.evict(key)
+            self.fast_classifier = MODEL_REGISTRY.get((fast_model_path, fast_fingerprint, backend, self.device),
+                                                      lambda: FastClassifier.load(fast_model_path))
+            teacher = self.fast_classifier.metadata.get('teacher')
+            print(f"Bộ phân loại nhanh đã sẵn sàng{f' (chưng cất từ {teacher})' if teacher else ''}")
+            if cascade_model:
+                self._load_cascade_model(cascade_model, cascade_threshold, star_mapping)
         else:
             print(f"Đang tải model: {model_name}...")
-            self.device = 0 if torch.cuda.is_available() else -1
+            # ONNX Runtime backend và model int8 chỉ chạy trên CPU
+            import torch
+            self.device = 0 if torch.cuda.is_available() and backend == 'torch' and not quantized else -1
+            self._set_torch_threads(torch)
+            if self.profile:
+                print(f"Dùng profile auto-tune: backend {backend}, batch {self.batch_size}, "
+                      f"{intra_op_threads}/{inter_op_threads} thread "
+                      f"(đã đo {self.profile['comments_per_sec']:.0f} comment/s)")
             try:
-                self.sentiment_pipeline = pipeline(
-                    "sentiment-analysis",
-                    model=model_name,
-                    tokenizer=model_name,
-                    device=self.device,
-                    return_all_scores=False,
-                    truncation=True,
-                    max_length=512
-                )
-                print(f"Model đã sẵn sàng (device: {'GPU' if self.device >= 0 else 'CPU'})")
+                self.sentiment_pipeline = self._load_pipeline(model_name)
+                print(f"Model đã sẵn sàng (device: {'GPU' if self.device >= 0 else 'CPU'}, backend: {backend}"
+                      f"{', int8' if quantized else ''})")
+            except ImportError:
+                raise
             except Exception as e:
                 print(f"Lỗi khi tải model: {e}")
                 print("Đang thử model dự phòng...")
                 # Fallback to multilingual model
-                self.sentiment_pipeline = pipeline(
-                    "sentiment-analysis",
-                    model='nlptown/bert-base-multilingual-uncased-sentiment',
-                    device=self.device,
-                    return_all_scores=False,
-                    truncation=True,
-                    max_length=512
-                )
+                self.sentiment_pipeline = self._load_pipeline('nlptown/bert-base-multilingual-uncased-sentiment')
                 print("Đã tải model dự phòng thành công")
+            self.label_mapping = LabelMapping.from_pipeline(self.sentiment_pipeline, star_mapping)
+            
+            if cascade_model:
+                self._load_cascade_model(cascade_model, cascade_threshold, star_mapping)
     
-    def _check_keywords_and_emojis(self, text):
+    def _load_cascade_model(self, cascade_model, cascade_threshold, star_mapping):
+        """Tải model thứ 2 của cascade và bảng tra label của nó"""
+        print(f"Đang tải model thứ 2 (cascade, ngưỡng {cascade_threshold}): {cascade_model}...")
+        self.cascade_pipeline = self._load_pipeline(cascade_model)
+        self.cascade_label_mapping = LabelMapping.from_pipeline(self.cascade_pipeline, star_mapping)
+        print("Model thứ 2 đã sẵn sàng")
+    
+    def _set_torch_threads(self, torch):
+        """Đặt số thread intra-op/inter-op của torch cho cả process (nếu đã chỉ định)"""
+        if self.intra_op_threads:
+            torch.set_num_threads(self.intra_op_threads)
+        if self.inter_op_threads:
+            try:
+                torch.set_num_interop_threads(self.inter_op_threads)
+            except RuntimeError:
+                # torch chỉ cho đặt trước lần đầu chạy song song trong process
+                pass
+    
+    def _load_pipeline(self, model_name):
         """
-        Kiểm tra từ khóa và emoji để bổ sung cho phân tích sentiment
+        Lấy pipeline sentiment-analysis cho model_name theo backend đã chọn
+        
+        Pipeline được lấy từ MODEL_REGISTRY (tải một lần cho cả process, dùng chung giữa các analyzer).
+        Giải phóng bằng MODEL_REGISTRY.evict(key) hoặc MODEL_REGISTRY.clear().
+        """
+        key = (model_name, self.backend, self.quantized, self.device)
+        return MODEL_REGISTRY.get(key, lambda: self._create_pipeline(model_name))
+    
+    def _create_pipeline(self, model_name):
+        """Tải mới pipeline sentiment-analysis cho model_name theo backend đã chọn"""
+        from transformers import pipeline
+        
+        model = model_name
+        if self.backend == 'onnx':
+            model = self._load_onnx_model(model_name)
+        elif self.quantized:
+            model = self._load_quantized_model(model_name)
+        
+        return pipeline(
+            "sentiment-analysis",
+            model=model,
+            tokenizer=model_name,
+            device=self.device,
+            return_all_scores=False,
+            truncation=True,
+            max_length=512
+        )
+    
+    def _load_onnx_model(self, model_name):
+        """
+        Tải model ONNX từ cache, hoặc export từ HuggingFace lần đầu rồi lưu vào cache
         
         Returns:
-            tuple: (positive_score, negative_score, neutral_indicator) từ 0-1
+            ORTModelForSequenceClassification: Model chạy bằng ONNX Runtime (graph optimization đầy đủ)
+        """
+        try:
+            import onnxruntime as ort
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+        except ImportError:
+            raise ImportError("Backend ONNX cần optimum và onnxruntime. Chạy: pip install optimum[onnxruntime]")
+        
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            session_options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            session_options.inter_op_num_threads = self.inter_op_threads
+        
+        export_dir = os.path.join(MODEL_CACHE_DIR, 'onnx', model_name.replace('/', '__'))
+        if os.path.exists(os.path.join(export_dir, 'model.onnx')):
+            print(f"Đang tải model ONNX từ cache: {export_dir}")
+            return ORTModelForSequenceClassification.from_pretrained(export_dir, session_options=session_options)
+        
+        print("Đang export model sang ONNX (chỉ chạy lần đầu)...")
+        model = ORTModelForSequenceClassification.from_pretrained(
+            model_name, export=True, session_options=session_options
+        )
+        model.save_pretrained(export_dir)
+        print(f"Đã lưu model ONNX vào: {export_dir}")
+        return model
+    
+    def _load_quantized_model(self, model_name):
+        """
+        Tải model đã lượng tử hóa động int8 từ cache, hoặc lượng tử hóa model fp32 lần đầu rồi lưu cache
+        
+        Returns:
+            Model sequence-classification với các lớp Linear dạng int8
+        """
+        import torch
+        from transformers import AutoConfig, AutoModelForSequenceClassification
+        
+        cache_path = os.path.join(MODEL_CACHE_DIR, 'quantized', model_name.replace('/', '__'), 'model_int8.pt')
+        
+        if os.path.exists(cache_path):
+            print(f"Đang tải model int8 từ cache: {cache_path}")
+            # Dựng kiến trúc từ config (không tải trọng số fp32), lượng tử hóa rồi nạp state dict int8
+            model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(model_name))
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            model.load_state_dict(torch.load(cache_path, weights_only=False))
+        else:
+            print("Đang lượng tử hóa model sang int8 (chỉ chạy lần đầu)...")
+            model = AutoModelForSequenceClassification.from_pretrained(model_name)
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            torch.save(model.state_dict(), cache_path)
+            print(f"Đã lưu model int8 vào: {cache_path}")
+        
+        model.eval()
+        return model
+    
+    @staticmethod
+    def _lexicon_counts(text):
+        """
+        Đếm số từ khóa/cụm từ/emoji xuất hiện theo từng nhóm của LEXICON_MATCHER (một lần duyệt text)
+        
+        Returns:
+            list: Số lượng theo thứ tự LEXICON_MATCHER.category_names
         """
-        text_lower = text.lower()
-        positive_score = 0
-        negative_score = 0
-        neutral_indicator = 0
-        
-        # Kiểm tra cụm từ tiêu cực trước (quan trọng hơn)
-        for phrase in NEGATIVE_PHRASES:
-            if phrase in text_lower:
-                negative_score += 0.5  # Cụm từ có trọng số cao hơn
-        
-        # Kiểm tra cụm từ neutral (giải thích/thông tin)
-        for phrase in NEUTRAL_PHRASES:
-            if phrase in text_lower:
-                neutral_indicator += 0.4
-        
-        # Kiểm tra từ khóa tích cực
-        for keyword in POSITIVE_KEYWORDS:
-            if keyword in text_lower:
-                positive_score += 0.25  # Giảm trọng số từng từ đơn
-        
-        # Kiểm tra từ khóa tiêu cực
-        for keyword in NEGATIVE_KEYWORDS:
-            if keyword in text_lower:
-                negative_score += 0.25  # Giảm trọng số từng từ đơn
-        
-        # Kiểm tra emoji tích cực
-        for emoji in POSITIVE_EMOJIS:
-            if emoji in text:
-                positive_score += 0.15  # Giảm trọng số emoji
-        
-        # Kiểm tra emoji tiêu cực
-        for emoji in NEGATIVE_EMOJIS:
-            if emoji in text:
-                negative_score += 0.15
+        return LEXICON_MATCHER.count(text.lower())
+    
+    @staticmethod
+    def _scores_from_counts(counts):
+        """Tính (positive_score, negative_score, neutral_indicator) từ kết quả _lexicon_counts"""
+        neg_phrases, neutral_phrases, pos_keywords, neg_keywords, pos_emojis, neg_emojis, no_problem, sarcasm = counts
+        
+        # Cụm từ tiêu cực có trọng số cao hơn, từ đơn và emoji có trọng số thấp hơn
+        # (thứ tự cộng giữ nguyên như khi kiểm tra từng danh sách)
+        negative_score = _add_repeated(0, 0.5, neg_phrases)
+        negative_score = _add_repeated(negative_score, 0.25, neg_keywords)
+        negative_score = _add_repeated(negative_score, 0.15, neg_emojis)
+        
+        positive_score = _add_repeated(0, 0.25, pos_keywords)
+        positive_score = _add_repeated(positive_score, 0.15, pos_emojis)
+        
+        # Cụm từ neutral (giải thích/thông tin)
+        neutral_indicator = _add_repeated(0, 0.4, neutral_phrases)
         
         # Xử lý các trường hợp đặc biệt
-        if any(phrase in text_lower for phrase in ['không sao', 'k sao', 'ko sao', 'khong sao']):
+        if no_problem:
             positive_score += 0.4
         
         # Sarcasm detection: "=))", ":))" trong context tiêu cực
-        sarcasm_indicators = [':))', '=))', ':)))', '=)))', ':))))', '=))))']
-        has_sarcasm = any(indicator in text for indicator in sarcasm_indicators)
+        has_sarcasm = sarcasm > 0
         
         # Nếu có sarcasm và có từ tiêu cực -> tiêu cực mạnh hơn
         if has_sarcasm and negative_score > 0:
@@ -232,6 +590,83 @@ class SentimentAnalyzer:
         
         return min(positive_score, 1.0), min(negative_score, 1.0), min(neutral_indicator, 1.0)
     
+    @staticmethod
+    def _scores_from_count_arrays(counts):
+        """
+        Phiên bản NumPy của _scores_from_counts cho cả cột
+        
+        Args:
+            counts: Mảng (số text x số nhóm) theo thứ tự LEXICON_MATCHER.category_names
+            
+        Returns:
+            tuple: (positive_scores, negative_scores, neutral_indicators), mỗi phần tử là mảng float
+        """
+        (neg_phrases, neutral_phrases, pos_keywords, neg_keywords,
+         pos_emojis, neg_emojis, no_problem, sarcasm) = counts.T
+        zeros = np.zeros(len(counts))
+        
+        negative = _add_repeated_array(zeros, 0.5, neg_phrases)
+        negative = _add_repeated_array(negative, 0.25, neg_keywords)
+        negative = _add_repeated_array(negative, 0.15, neg_emojis)
+        
+        positive = _add_repeated_array(zeros, 0.25, pos_keywords)
+        positive = _add_repeated_array(positive, 0.15, pos_emojis)
+        
+        neutral = _add_repeated_array(zeros, 0.4, neutral_phrases)
+        
+        positive = np.where(no_problem > 0, positive + 0.4, positive)
+        
+        # Sarcasm: tăng tiêu cực, giảm tích cực trong context tiêu cực
+        has_sarcasm = sarcasm > 0
+        negative = np.where(has_sarcasm & (negative > 0), negative + 0.3, negative)
+        positive = np.where(has_sarcasm & (positive > 0) & (negative > 0.3),
+                            np.maximum(0, positive - 0.3), positive)
+        
+        return np.minimum(positive, 1.0), np.minimum(negative, 1.0), np.minimum(neutral, 1.0)
+    
+    @staticmethod
+    def lexicon_count_matrix(texts):
+        """
+        Đếm từ khóa/cụm từ/emoji theo nhóm cho cả cột (mỗi text duy nhất chỉ xử lý một lần)
+        
+        Args:
+            texts: List hoặc Series các texts
+            
+        Returns:
+            numpy array (số text x số nhóm) theo thứ tự LEXICON_MATCHER.category_names
+        """
+        series = pd.Series(texts, dtype=object)
+        codes, uniques = pd.factorize(series.where(series.notna(), '').astype(str))
+        lowered = pd.Series(uniques, dtype=object).str.lower()
+        return LEXICON_MATCHER.count_matrix(lowered)[codes]
+    
+    @classmethod
+    def score_lexicon(cls, texts):
+        """
+        Tính điểm từ khóa/emoji cho cả cột bằng ma trận thưa (nhanh hơn gọi
+        _check_keywords_and_emojis từng dòng, kết quả giống hệt)
+        
+        Không cần tải model: gọi được trực tiếp SentimentAnalyzer.score_lexicon(texts)
+        
+        Args:
+            texts: List hoặc Series các texts
+            
+        Returns:
+            DataFrame: Các cột positive, negative, neutral (0-1), cùng index với texts nếu là Series
+        """
+        index = texts.index if isinstance(texts, pd.Series) else None
+        positive, negative, neutral = cls._scores_from_count_arrays(cls.lexicon_count_matrix(texts))
+        return pd.DataFrame({'positive': positive, 'negative': negative, 'neutral': neutral}, index=index)
+    
+    def _check_keywords_and_emojis(self, text):
+        """
+        Kiểm tra từ khóa và emoji để bổ sung cho phân tích sentiment
+        
+        Returns:
+            tuple: (positive_score, negative_score, neutral_indicator) từ 0-1
+        """
+        return self._scores_from_counts(self._lexicon_counts(text))
+    
     def analyze_text_gemini(self, text):
         """
         Phân tích sentiment bằng Gemini API
@@ -275,7 +710,7 @@ Trả về CHỈ số: 1, 0, hoặc -1"""
 
             response = self.gemini_model.generate_content(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
+                generation_config=_genai().types.GenerationConfig(
                     temperature=0.2,  # Tăng một chút để linh hoạt hơn
                     max_output_tokens=5,  # Giảm xuống vì chỉ cần số
                 )
@@ -352,128 +787,505 @@ Trả về CHỈ số: 1, 0, hoặc -1"""
         # Nếu dùng Gemini, gọi phương thức Gemini
         if self.use_gemini and self.gemini_model:
             return self.analyze_text_gemini(text)
+        if self.use_gemini and self.gemini_dispatcher:
+            return int(self._analyze_batch_gemini_unique([text])[0])
         
         try:
-            # Giới hạn độ dài text để tránh lỗi
-            text = str(text)[:512]
-            
-            # Kiểm tra từ khóa và emoji trước
-            pos_keyword_score, neg_keyword_score, neutral_indicator = self._check_keywords_and_emojis(text)
-            
-            # Nếu có dấu hiệu neutral mạnh (giải thích/thông tin), ưu tiên neutral
-            if neutral_indicator > 0.5 and abs(pos_keyword_score - neg_keyword_score) < 0.4:
-                # Nếu là giải thích/thông tin và không có cảm xúc rõ ràng -> neutral
-                return 0
-            
-            # Phân tích bằng model
-            result = self.sentiment_pipeline(text)[0]
-            label = result['label'].upper()
-            score = result.get('score', 0.5)
-            
-            # Chuyển đổi label thành sentiment score
-            model_score = 0
-            model_confidence = score
-            if '5 STAR' in label or '4 STAR' in label:
-                model_score = 1
-            elif '1 STAR' in label or '2 STAR' in label:
-                model_score = -1
-            elif 'POSITIVE' in label or 'POS' in label:
-                model_score = 1
-            elif 'NEGATIVE' in label or 'NEG' in label:
-                model_score = -1
-            
-            # Kết hợp kết quả model với từ khóa/emoji
-            # Ưu tiên keyword score nếu nó mạnh hơn model score
-            final_score = model_score
+            # Chạy model (nếu từ khóa chưa cho thấy đây là giải thích/thông tin) rồi kết hợp với từ khóa/emoji
+            return int(self._with_model_outputs([text], self._run_model_batch)[0, 0])
+                
+        except Exception as e:
+            print(f"Lỗi khi phân tích: {str(text)[:50]}... - {str(e)}")
+            return 0
+    
+    def _run_model(self, texts):
+        """
+        Chạy model cho list texts trong một lần gọi pipeline
+        
+        Nếu có cascade_model: các text có độ tin cậy < cascade_threshold được chấm lại
+        bằng model thứ 2 (cũng trong một lần gọi), thống kê số dòng/thời gian mỗi tầng trong self.tier_stats
+        
+        Returns:
+            numpy array: Mảng output thô (len(texts) x RAW_COLUMNS)
+        """
+        start = time.perf_counter()
+        if self.fast_classifier is not None:
+            return self._cascade_tier(texts, self.fast_classifier.raw_outputs(texts), time.perf_counter() - start)
+        if self.max_tokens:
+            texts = self._truncate_head_tail(texts)
+        # top_k=None: trả về xác suất của mọi label, chuyển sang -1/0/1 bằng bảng tra của model
+        outputs = self.label_mapping.raw_outputs(self.label_mapping.probability_matrix(
+            self.sentiment_pipeline(texts, batch_size=len(texts), top_k=None)))
+        return self._cascade_tier(texts, outputs, time.perf_counter() - start)
+    
+    def _cascade_tier(self, texts, outputs, tier1_seconds):
+        """Chấm lại bằng cascade_model các text tầng 1 có độ tin cậy < cascade_threshold (nếu có)"""
+        if self.cascade_pipeline is None:
+            return outputs
+        
+        if self.tier_stats is None:
+            self.tier_stats = {'tier1_rows': 0, 'tier1_seconds': 0.0, 'tier2_rows': 0, 'tier2_seconds': 0.0}
+        self.tier_stats['tier1_rows'] += len(texts)
+        self.tier_stats['tier1_seconds'] += tier1_seconds
+        
+        low_confidence = np.flatnonzero(outputs[:, 4] < self.cascade_threshold)
+        if len(low_confidence):
+            start = time.perf_counter()
+            heavy_outputs = self.cascade_pipeline([texts[i] for i in low_confidence], batch_size=len(low_confidence),
+                                                  top_k=None)
+            outputs[low_confidence] = self.cascade_label_mapping.raw_outputs(
+                self.cascade_label_mapping.probability_matrix(heavy_outputs))
+            self.tier_stats['tier2_rows'] += len(low_confidence)
+            self.tier_stats['tier2_seconds'] += time.perf_counter() - start
+        
+        return outputs
+    
+    def _tokenize_stage(self, batch):
+        """
+        Stage 1 (chế độ chồng lấp): cắt head+tail nếu cần rồi tokenize cả batch thành tensor
+        
+        Mỗi thread tokenize mượn bản sao tokenizer riêng nên các thread chạy song song thật sự
+        (tokenizer chung của pipeline bị khóa, chỉ một thread dùng được tại một thời điểm).
+        """
+        with self.sentiment_pipeline.tokenizer_copy() as tokenizer:
+            texts = self._truncate_head_tail(batch, tokenizer) if self.max_tokens else batch
+            encoded = tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors='pt')
+        return texts, encoded
+    
+    def _forward_stage(self, item):
+        """Stage 2 (chế độ chồng lấp): forward pass của model, trả về ma trận xác suất (softmax)"""
+        import torch
+        texts, encoded = item
+        start = time.perf_counter()
+        if self.device >= 0:
+            device = self.sentiment_pipeline.model.device
+            encoded = {name: tensor.to(device) for name, tensor in encoded.items()}
+        # Qua lock của pipeline dùng chung: session khác có thể đang chạy cùng model
+        logits = self.sentiment_pipeline.forward(encoded)
+        probs = torch.softmax(logits.float(), dim=-1).cpu().numpy()
+        return texts, probs, time.perf_counter() - start
+    
+    def _postprocess_stage(self, item):
+        """Stage 3 (chế độ chồng lấp): xác suất -> output thô bằng bảng tra label, rồi tầng cascade"""
+        texts, probs, seconds = item
+        return self._cascade_tier(texts, self.label_mapping.raw_outputs(probs), seconds)
+    
+    def _run_batches_overlapped(self, batches, progress_callback=None):
+        """
+        Chạy các batch qua 3 stage chồng lấp (StagedPipeline), thống kê trong self.pipeline_stats
+        
+        Batch bị lỗi ở bất kỳ stage nào được chạy lại tuần tự bằng _run_model_batch.
+        
+        Returns:
+            list: Mảng output thô (RAW_COLUMNS) của từng batch
+        """
+        runner = StagedPipeline([
+            ('tokenize', self._tokenize_stage, self.pipeline_threads),
+            ('infer', self._forward_stage, 1),
+            ('postprocess', self._postprocess_stage, 1),
+        ], max_pending=self.pipeline_queue)
+        
+        bar = _progress_bar(len(batches), desc="Phân tích sentiment") if progress_callback is None else None
+        def on_done(done, total):
+            if progress_callback:
+                progress_callback(done, total)
+            elif bar is not None:
+                bar.update(1)
+        outputs = runner.run(batches, on_done=on_done)
+        if bar is not None:
+            bar.close()
+        
+        for i, output in enumerate(outputs):
+            if isinstance(output, Exception):
+                print(f"Lỗi khi phân tích batch: {str(output)[:100]}")
+                outputs[i] = self._run_model_batch(batches[i])
+        
+        self.pipeline_stats = runner.stats
+        print(f"Pipeline chồng lấp: {runner.format_stats()}")
+        return outputs
+    
+    def _truncate_head_tail(self, texts, tokenizer=None):
+        """
+        Cắt các text dài hơn max_tokens, giữ nửa đầu và nửa cuối số token
+        (cảm xúc thường nằm ở câu đầu và câu cuối)
+        
+        Cắt theo offset ký tự của tokenizer nên text giữ nguyên chữ gốc. Cần fast tokenizer,
+        nếu không có thì trả về texts như cũ (pipeline tự cắt ở 512 token).
+        
+        Args:
+            texts: List texts
+            tokenizer: Tokenizer dùng để cắt (None = tokenizer của pipeline chính)
+        
+        Returns:
+            list: Texts đã cắt
+        """
+        tokenizer = tokenizer or self.sentiment_pipeline.tokenizer
+        if not getattr(tokenizer, 'is_fast', False):
+            return texts
+        
+        budget = max(2, self.max_tokens - tokenizer.num_special_tokens_to_add())
+        head = budget // 2
+        tail = budget - head
+        offsets = tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+        
+        truncated = []
+        for text, text_offsets in zip(texts, offsets):
+            if len(text_offsets) <= budget:
+                truncated.append(text)
+            else:
+                truncated.append(text[:text_offsets[head - 1][1]] + ' ' + text[text_offsets[-tail][0]:])
+        return truncated
+    
+    @staticmethod
+    def _fuse_arrays(model_scores, confidences, pos, neg, neutral, pos_emojis, neg_emojis):
+        """
+        Kết hợp output của model với điểm từ khóa/emoji cho cả mảng (NumPy select, một lượt cho mọi dòng)
+        
+        Các ngưỡng kết hợp chỉ nằm ở đây: sửa xong có thể áp dụng lại trên output đã lưu
+        trong ModelOutputStore (fuse_outputs) mà không chạy lại model.
+        
+        Args:
+            model_scores: Mảng -1/0/1 từ model
+            confidences: Mảng độ tin cậy của model
+            pos, neg, neutral: Mảng điểm từ khóa (_scores_from_count_arrays)
+            pos_emojis, neg_emojis: Mảng số emoji tích cực/tiêu cực
             
-            # Nếu keyword score rất mạnh (>0.7), ưu tiên keyword
-            if neg_keyword_score > 0.7:
-                final_score = -1
-            elif pos_keyword_score > 0.7 and neg_keyword_score < 0.3:
-                final_score = 1
-            # Nếu keyword score khá mạnh (>0.5) và model confidence thấp (<0.6), ưu tiên keyword
-            elif neg_keyword_score > 0.5 and model_confidence < 0.6:
-                final_score = -1
-            elif pos_keyword_score > 0.5 and neg_keyword_score < 0.3 and model_confidence < 0.6:
-                final_score = 1
-            # Nếu keyword và model conflict, ưu tiên keyword nếu mạnh hơn
-            elif neg_keyword_score > pos_keyword_score + 0.4 and model_score >= 0:
-                final_score = -1
-            elif pos_keyword_score > neg_keyword_score + 0.4 and model_score <= 0:
-                final_score = 1
-            # Nếu keyword score tương đối và model confidence cao, giữ model
-            elif abs(pos_keyword_score - neg_keyword_score) < 0.3 and model_confidence > 0.7:
-                final_score = model_score
-            # Nếu keyword difference rõ ràng (>0.3), điều chỉnh theo keyword
-            elif neg_keyword_score > pos_keyword_score + 0.3:
-                final_score = -1
-            elif pos_keyword_score > neg_keyword_score + 0.3:
-                final_score = 1
+        Returns:
+            numpy array: Mảng -1/0/1
+        """
+        # Điều kiện xét theo thứ tự, điều kiện đầu tiên đúng quyết định kết quả
+        final = np.select(
+            [
+                # Keyword score rất mạnh (>0.7) -> ưu tiên keyword
+                neg > 0.7,
+                (pos > 0.7) & (neg < 0.3),
+                # Keyword score khá mạnh (>0.5) và model confidence thấp (<0.6) -> ưu tiên keyword
+                (neg > 0.5) & (confidences < 0.6),
+                (pos > 0.5) & (neg < 0.3) & (confidences < 0.6),
+                # Keyword và model conflict -> ưu tiên keyword nếu mạnh hơn
+                (neg > pos + 0.4) & (model_scores >= 0),
+                (pos > neg + 0.4) & (model_scores <= 0),
+                # Keyword score tương đối và model confidence cao -> giữ model
+                (np.abs(pos - neg) < 0.3) & (confidences > 0.7),
+                # Keyword difference rõ ràng (>0.3) -> điều chỉnh theo keyword
+                neg > pos + 0.3,
+                pos > neg + 0.3,
+            ],
+            [-1, 1, -1, 1, -1, 1, model_scores, -1, 1],
+            default=model_scores
+        )
+        
+        # Nhiều emoji tiêu cực/tích cực
+        final = np.where((neg_emojis >= 2) & (final >= 0), -1,
+                         np.where((pos_emojis >= 2) & (neg < 0.4) & (final <= 0), 1, final))
+        
+        # Giải thích/thông tin nhưng cảm xúc yếu -> neutral
+        explanation = neutral > 0.4
+        final = np.where(explanation & (final == 1) & (pos < 0.5), 0, final)
+        final = np.where(explanation & (final == -1) & (neg < 0.5), 0, final)
+        return final
+    
+    @classmethod
+    def _lexicon_features(cls, texts):
+        """
+        Chấm từ khóa/emoji cho cả list texts (text cắt ở 512 ký tự như khi đưa vào model)
+        
+        Returns:
+            dict: counts, pos, neg, neutral, pos_emojis, neg_emojis (mảng theo từng text) và
+                  skip_model - các dòng rỗng hoặc giải thích/thông tin, luôn là neutral, không cần model
+        """
+        truncated = [str(text)[:512] if not pd.isna(text) else '' for text in texts]
+        counts = cls.lexicon_count_matrix(truncated)
+        pos, neg, neutral = cls._scores_from_count_arrays(counts)
+        empty = np.array([not text.strip() for text in truncated], dtype=bool)
+        return {
+            'counts': counts,
+            'pos': pos,
+            'neg': neg,
+            'neutral': neutral,
+            'pos_emojis': counts[:, _POS_EMOJI_IDX],
+            'neg_emojis': counts[:, _NEG_EMOJI_IDX],
+            'skip_model': empty | ((neutral > 0.5) & (np.abs(pos - neg) < 0.4)),
+        }
+    
+    @classmethod
+    def fuse_outputs(cls, texts, raw, features=None):
+        """
+        Kết hợp output thô của model với từ khóa/emoji cho cả list texts (giai đoạn sau model)
+        
+        Không cần tải model: gọi lại được trên output đã lưu sau khi sửa từ điển hoặc ngưỡng.
+        
+        Args:
+            texts: List các texts
+            raw: Mảng (len(texts) x RAW_COLUMNS), NaN ở các dòng model chưa chạy
+            features: Kết quả _lexicon_features(texts) nếu đã tính
             
-            # Đếm số emoji tích cực và tiêu cực (bổ sung)
-            pos_emoji_count = sum(1 for emoji in POSITIVE_EMOJIS if emoji in text)
-            neg_emoji_count = sum(1 for emoji in NEGATIVE_EMOJIS if emoji in text)
+        Returns:
+            tuple: (outputs, missing) - mảng kết quả (OUTPUT_COLUMNS, float32) và mảng bool các dòng
+                   cần output của model nhưng chưa có (được gán neutral)
+        """
+        if features is None:
+            features = cls._lexicon_features(texts)
+        raw = np.asarray(raw, dtype=np.float64).reshape(-1, len(RAW_COLUMNS))
+        has_output = ~np.isnan(raw[:, 0])
+        missing = ~features['skip_model'] & ~has_output
+        
+        fused = cls._fuse_arrays(np.where(has_output, raw[:, 0], 0).astype(int), raw[:, 4],
+                                 features['pos'], features['neg'], features['neutral'],
+                                 features['pos_emojis'], features['neg_emojis'])
+        outputs = _label_outputs(np.where(features['skip_model'] | missing, 0, fused))
+        outputs[:, 1:] = np.where(features['skip_model'][:, None], np.nan, raw[:, 1:])
+        return outputs, missing
+    
+    def _lexicon_decisions(self, texts):
+        """
+        Chấm từ khóa cho cả list texts và xác định các dòng có kết quả không phụ thuộc model
+        
+        Một dòng được chốt nếu là giải thích/thông tin (giống analyze_text), hoặc logic kết hợp
+        cho cùng một kết quả với mọi output có thể của model (3 label x 3 mức độ tin cậy
+        theo các ngưỡng 0.6/0.7 trong _fuse_arrays).
+        
+        Returns:
+            tuple: (decided, labels) - mảng bool các dòng đã chốt và mảng kết quả tương ứng
+        """
+        features = self._lexicon_features(texts)
+        n = len(texts)
+        outcomes = np.stack([
+            self._fuse_arrays(np.full(n, model_score), np.full(n, confidence),
+                              features['pos'], features['neg'], features['neutral'],
+                              features['pos_emojis'], features['neg_emojis'])
+            for model_score in (-1, 0, 1)
+            for confidence in (0.5, 0.65, 0.8)
+        ])
+        model_independent = (outcomes == outcomes[0]).all(axis=0)
+        
+        decided = features['skip_model'] | model_independent
+        labels = np.where(features['skip_model'], 0, outcomes[0])
+        return decided, labels
+    
+    def _with_cascade(self, texts, analyze_fn):
+        """
+        Cascade từ khóa -> model: chỉ gửi các dòng chưa chốt được bằng từ khóa cho analyze_fn
+        
+        Thống kê lưu trong self.cascade_stats (rows, model_rows, model_fraction)
+        
+        Args:
+            texts: List các texts
+            analyze_fn: Hàm nhận list texts, trả về mảng kết quả (OUTPUT_COLUMNS) cùng thứ tự
             
-            # Nếu có nhiều emoji tiêu cực, tăng cường tiêu cực
-            if neg_emoji_count >= 2 and final_score >= 0:
-                final_score = -1
-            # Nếu có nhiều emoji tích cực và không có từ tiêu cực mạnh, tích cực
-            elif pos_emoji_count >= 2 and neg_keyword_score < 0.4 and final_score <= 0:
-                final_score = 1
+        Returns:
+            numpy array: Mảng kết quả theo đúng thứ tự texts (dòng chốt bằng từ khóa không có xác suất)
+        """
+        if not self.lexicon_cascade or self.use_gemini or not texts:
+            return np.asarray(analyze_fn(texts))
+        
+        decided, labels = self._lexicon_decisions(texts)
+        results = _label_outputs(labels)
+        ambiguous = np.flatnonzero(~decided)
+        if len(ambiguous):
+            results[ambiguous] = np.asarray(analyze_fn([texts[i] for i in ambiguous]))
+        
+        self.cascade_stats = {
+            'rows': len(texts),
+            'model_rows': len(ambiguous),
+            'model_fraction': len(ambiguous) / len(texts)
+        }
+        print(f"Cascade: {len(ambiguous)}/{len(texts)} dòng cần chạy model "
+              f"({self.cascade_stats['model_fraction']*100:.1f}%)")
+        return results
+    
+    def _with_model_outputs(self, texts, run_fn):
+        """
+        Hai giai đoạn tách biệt: lấy output thô của model cho các dòng cần model
+        (tra ModelOutputStore trước, chỉ gọi run_fn cho phần còn thiếu), rồi kết hợp với
+        từ khóa/emoji cho cả mảng bằng fuse_outputs
+        
+        Args:
+            texts: List các texts
+            run_fn: Hàm nhận list texts (đã cắt 512 ký tự), trả về mảng output thô (RAW_COLUMNS) cùng thứ tự
             
-            # Xử lý trường hợp neutral: nếu có neutral indicator và không có cảm xúc rõ ràng
-            if neutral_indicator > 0.4 and abs(final_score) == 1:
-                # Nếu là giải thích/thông tin nhưng có cảm xúc -> giảm độ mạnh
-                if final_score == 1 and pos_keyword_score < 0.5:
-                    final_score = 0
-                elif final_score == -1 and neg_keyword_score < 0.5:
-                    final_score = 0
+        Returns:
+            numpy array: Mảng kết quả (len(texts) x OUTPUT_COLUMNS) theo đúng thứ tự texts
+        """
+        features = self._lexicon_features(texts)
+        raw = np.full((len(texts), len(RAW_COLUMNS)), np.nan)
+        model_idx = np.flatnonzero(~features['skip_model'])
+        if len(model_idx):
+            raw[model_idx] = self._with_model_store([str(texts[i])[:512] for i in model_idx], run_fn)
+        return self.fuse_outputs(texts, raw, features)[0]
+    
+    def _with_model_store(self, texts, run_fn):
+        """Tra output thô trong ModelOutputStore, chỉ gọi run_fn cho các text chưa có rồi lưu lại"""
+        if self.model_store is None:
+            return np.asarray(run_fn(texts), dtype=np.float64)
+        
+        keys = [self.model_store.make_key(text, self._model_store_key) for text in texts]
+        stored = self.model_store.get_many(keys)
+        raw = np.full((len(texts), len(RAW_COLUMNS)), np.nan)
+        miss_idx = []
+        for i, key in enumerate(keys):
+            if key in stored:
+                raw[i] = stored[key]
+            else:
+                miss_idx.append(i)
+        
+        if miss_idx:
+            raw[miss_idx] = np.asarray(run_fn([texts[i] for i in miss_idx]), dtype=np.float64)
+            # Dòng model lỗi (NaN) không được lưu, lần sau chạy lại
+            self.model_store.put_many({keys[i]: raw[i] for i in miss_idx if not np.isnan(raw[i, 0])})
+        return raw
+    
+    def _record_padding(self, token_lengths):
+        """Cộng số token thật/đã pad của một batch vào self.padding_stats"""
+        if token_lengths and self.padding_stats is not None:
+            self.padding_stats['real_tokens'] += sum(token_lengths)
+            self.padding_stats['padded_tokens'] += max(token_lengths) * len(token_lengths)
+    
+    def _run_model_batch(self, batch, token_lengths=None):
+        """
+        Chạy model cho một batch trong 1 lần forward pass
+        
+        Args:
+            batch: List các texts (không rỗng, đã cắt 512 ký tự)
+            token_lengths: Số token của từng text (tùy chọn, dùng để thống kê padding)
             
-            return final_score
-                
+        Returns:
+            numpy array: Mảng output thô (len(batch) x RAW_COLUMNS), NaN ở các text model lỗi
+        """
+        if not batch:
+            return np.full((0, len(RAW_COLUMNS)), np.nan)
+        
+        self._record_padding(token_lengths)
+        try:
+            return self._run_model(batch)
         except Exception as e:
-            print(f"Lỗi khi phân tích: {text[:50]}... - {str(e)}")
-            return 0
+            # Nếu batch lỗi, quay về chạy từng text
+            print(f"Lỗi khi phân tích batch: {str(e)[:100]}")
+        
+        raw = np.full((len(batch), len(RAW_COLUMNS)), np.nan)
+        for i, text in enumerate(batch):
+            try:
+                raw[i] = self._run_model([text])[0]
+            except Exception as e:
+                print(f"Lỗi khi phân tích: {text[:50]}... - {str(e)}")
+        return raw
     
     def analyze_batch_gemini(self, texts, batch_size=20, progress_callback=None):
         """
         Phân tích sentiment bằng Gemini với batch processing (nhanh hơn)
-        Gửi nhiều comments cùng lúc trong 1 request
+        Gửi nhiều comments cùng lúc trong 1 request, mỗi comment trùng lặp chỉ gửi một lần
+        (thống kê trong self.dedup_stats)
         """
-        results = []
-        total_batches = (len(texts) + batch_size - 1) // batch_size
+        texts = texts.tolist() if hasattr(texts, 'tolist') else list(texts)
+        return self._with_dedup(
+            texts,
+            lambda uniques: _label_outputs(self._analyze_batch_gemini_unique(uniques, batch_size, progress_callback))
+        )[:, 0].astype(int)
+    
+    def _analyze_batch_gemini_unique(self, texts, batch_size=20, progress_callback=None):
+        """
+        Gửi list texts (đã loại trùng) cho Gemini theo batch, xem analyze_batch_gemini
+        
+        Comment được chia batch theo ngân sách token (self.gemini_packer, batch đầu tối đa batch_size
+        comment, sau đó tự điều chỉnh theo response quan sát được) và gửi song song theo từng đợt
+        qua GeminiDispatcher (tối đa gemini_concurrency request cùng lúc, giới hạn gemini_rpm
+        request/phút và gemini_tpm token/phút). Gemini trả về JSON theo số thứ tự comment; các
+        comment bị thiếu hoặc nhãn không hợp lệ được xếp lại vào đợt sau (tối đa gemini_retry_rounds
+        lần), còn thiếu sau đó mới dùng điểm từ khóa. Thống kê trong self.gemini_stats
+        """
+        from collections import deque
         
+        results = [0] * len(texts)
+        # Vị trí các comment cần gửi, NaN/rỗng giữ điểm 0
+        pending = [i for i, text in enumerate(texts) if not pd.isna(text) and str(text).strip()]
+        comments = {pos: str(texts[pos]).strip()[:500] for pos in pending}  # Giới hạn độ dài
+        item_tokens = {pos: estimate_tokens(f'{len(comments)}. "{comment}"\n') for pos, comment in comments.items()}
+        attempts = dict.fromkeys(pending, 0)
+        queue = deque(pending)
+        
+        packer = self.gemini_packer
+        if packer.observed == 0:
+            packer.items_cap = min(batch_size, packer.max_items)
+        stats = {'batches': 0, 'requests': 0, 'rate_limited': 0, 'errors': 0, 'seconds': 0.0,
+                 'items': len(pending), 'retried_items': 0, 'fallback_items': 0}
+        
+        bar = None
         if progress_callback is None:
             try:
-                progress_range = tqdm(range(0, len(texts), batch_size), desc="Phân tích sentiment (Gemini)")
-            except:
-                progress_range = range(0, len(texts), batch_size)
-        else:
-            progress_range = range(0, len(texts), batch_size)
+                from tqdm import tqdm
+                bar = tqdm(total=len(pending), desc="Phân tích sentiment (Gemini)")
+            except ImportError:
+                pass
         
-        for batch_idx, i in enumerate(progress_range):
-            if progress_callback:
-                progress_callback(batch_idx + 1, total_batches)
-            
-            batch_texts = texts[i:i+batch_size].tolist()
-            batch_scores = []
-            
-            # Tạo batch prompt cho nhiều comments cùng lúc
-            comments_list = []
-            for idx, text in enumerate(batch_texts):
-                if pd.isna(text) or not str(text).strip():
-                    batch_scores.append(0)
-                    continue
+        try:
+            while queue:
+                # Mỗi đợt đủ cho các request song song, đợt sau dùng ước lượng đã cập nhật
+                sizes = packer.pack([item_tokens[pos] for pos in queue],
+                                    max_batches=self.gemini_dispatcher.max_in_flight * 2)
+                batches = [[queue.popleft() for _ in range(size)] for size in sizes]
+                jobs = []
+                for batch in batches:
+                    comments_list = [f"{idx + 1}. \"{comments[pos]}\"" for idx, pos in enumerate(batch)]
+                    jobs.append((self._gemini_batch_prompt(comments_list), packer.max_output_tokens(len(batch))))
                 
-                text_clean = str(text).strip()[:500]  # Giới hạn độ dài
-                comments_list.append(f"{idx + 1}. \"{text_clean}\"")
-            
-            if not comments_list:
-                results.extend([0] * len(batch_texts))
-                continue
-            
-            # Prompt tối ưu cho batch processing
-            prompt = f"""Phân tích cảm xúc các comments sau và trả về CHỈ CÁC SỐ, mỗi dòng 1 số (1, 0, hoặc -1) tương ứng với từng comment theo thứ tự.
+                responses = self.gemini_dispatcher.dispatch(jobs)
+                dispatch_stats = self.gemini_dispatcher.stats
+                stats['batches'] += len(jobs)
+                for key in ('requests', 'rate_limited', 'errors', 'seconds'):
+                    stats[key] += dispatch_stats[key]
+                
+                settled = 0
+                for batch, (_, max_output_tokens), response in zip(batches, jobs, responses):
+                    if isinstance(response, Exception):
+                        print(f"Lỗi Gemini batch: {str(response)[:100]}")
+                        labels = {}
+                        packer.observe(len(batch), 0)
+                    else:
+                        labels = self._parse_gemini_json(response)
+                        answered = sum(1 for idx in range(1, len(batch) + 1) if idx in labels)
+                        truncated = not response.strip().strip('`').strip().endswith('}')
+                        packer.observe(len(batch), answered, response, max_output_tokens, truncated)
+                    
+                    for idx, pos in enumerate(batch):
+                        if idx + 1 in labels:
+                            results[pos] = labels[idx + 1]
+                            settled += 1
+                        elif attempts[pos] < self.gemini_retry_rounds:
+                            attempts[pos] += 1
+                            stats['retried_items'] += 1
+                            queue.append(pos)
+                        else:
+                            # Fallback: vẫn thiếu sau các lần gửi lại thì phân tích bằng keyword
+                            results[pos] = self._gemini_keyword_fallback(str(texts[pos]))
+                            stats['fallback_items'] += 1
+                            settled += 1
+                
+                if progress_callback:
+                    # Tổng số batch ước lượng theo số comment còn lại và items_cap hiện tại
+                    remaining = math.ceil(len(queue) / max(packer.items_cap, 1))
+                    progress_callback(stats['batches'], stats['batches'] + remaining)
+                elif bar is not None:
+                    bar.update(settled)
+        finally:
+            if bar is not None:
+                bar.close()
+        
+        stats['items_per_batch'] = packer.items_cap
+        stats['output_tokens_per_item'] = packer.output_per_item
+        self.gemini_stats = stats
+        
+        if stats['requests']:
+            print(f"Gemini: {stats['batches']} batch, {stats['requests']} request ({stats['rate_limited']} lần 429), "
+                  f"gửi lại {stats['retried_items']} comment, fallback từ khóa {stats['fallback_items']}, "
+                  f"{stats['seconds']:.1f}s | batch hiện tại tối đa {packer.items_cap} comment, "
+                  f"~{packer.output_per_item:.1f} token output/comment")
+        
+        return np.array(results)
+    
+    @staticmethod
+    def _gemini_batch_prompt(comments_list):
+        """Prompt cho batch processing, yêu cầu JSON theo số thứ tự comment"""
+        return f"""Phân tích cảm xúc các comments sau. Trả về CHỈ MỘT JSON object: key là số thứ tự comment (dạng chuỗi), value là 1, 0 hoặc -1.
 
 Comments:
 {chr(10).join(comments_list)}
@@ -485,135 +1297,361 @@ QUY TẮC:
 
 QUAN TRỌNG: Nếu có BẤT KỲ cảm xúc (dù nhẹ), đừng đánh 0.
 
-Trả về CHỈ CÁC SỐ, mỗi dòng 1 số, theo thứ tự:
-1
-0
--1
-..."""
-
-            try:
-                response = self.gemini_model.generate_content(
-                    prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.2,
-                        max_output_tokens=min(100, len(comments_list) * 5),  # Tối ưu tokens
-                    )
-                )
-                
-                result_text = response.text.strip()
-                
-                # Parse kết quả - tìm tất cả số
-                import re
-                numbers = re.findall(r'-?\d+', result_text)
-                
-                # Map kết quả về batch
-                result_idx = 0
-                for text in batch_texts:
-                    if pd.isna(text) or not str(text).strip():
-                        batch_scores.append(0)
-                    elif result_idx < len(numbers):
-                        score = int(numbers[result_idx])
-                        if score in [-1, 0, 1]:
-                            batch_scores.append(score)
-                        else:
-                            # Fallback
-                            pos_keyword_score, neg_keyword_score, neutral_indicator = self._check_keywords_and_emojis(str(text))
-                            if neg_keyword_score > 0.4:
-                                batch_scores.append(-1)
-                            elif pos_keyword_score > 0.4 and neg_keyword_score < 0.3:
-                                batch_scores.append(1)
-                            elif neutral_indicator > 0.6:
-                                batch_scores.append(0)
-                            else:
-                                batch_scores.append(0 if abs(pos_keyword_score - neg_keyword_score) < 0.2 else (1 if pos_keyword_score > neg_keyword_score else -1))
-                        result_idx += 1
-                    else:
-                        # Không đủ kết quả, dùng fallback
-                        pos_keyword_score, neg_keyword_score, neutral_indicator = self._check_keywords_and_emojis(str(text))
-                        if neg_keyword_score > 0.4:
-                            batch_scores.append(-1)
-                        elif pos_keyword_score > 0.4 and neg_keyword_score < 0.3:
-                            batch_scores.append(1)
-                        else:
-                            batch_scores.append(0 if neutral_indicator > 0.6 else (1 if pos_keyword_score > neg_keyword_score else -1))
-                
-                results.extend(batch_scores)
-                
-                # Delay nhỏ giữa các batch
-                time.sleep(0.2)  # 200ms giữa các batch thay vì từng cái
-                
-            except Exception as e:
-                print(f"Lỗi Gemini batch: {str(e)[:100]}")
-                # Fallback: phân tích từng cái bằng keyword
-                for text in batch_texts:
-                    if pd.isna(text) or not str(text).strip():
-                        results.append(0)
-                    else:
-                        pos_keyword_score, neg_keyword_score, neutral_indicator = self._check_keywords_and_emojis(str(text))
-                        if neg_keyword_score > 0.4:
-                            results.append(-1)
-                        elif pos_keyword_score > 0.4 and neg_keyword_score < 0.3:
-                            results.append(1)
-                        elif neutral_indicator > 0.6:
-                            results.append(0)
-                        else:
-                            results.append(0 if abs(pos_keyword_score - neg_keyword_score) < 0.2 else (1 if pos_keyword_score > neg_keyword_score else -1))
+Trả về đủ {len(comments_list)} key, ví dụ: {{"1": 1, "2": 0, "3": -1}}"""
+    
+    @staticmethod
+    def _parse_gemini_json(result_text):
+        """
+        Đọc JSON {số thứ tự: nhãn} từ response của một batch
         
-        return np.array(results)
+        Returns:
+            dict: {số thứ tự (int, từ 1): nhãn} chỉ gồm các mục hợp lệ (nhãn 1, 0, -1)
+        """
+        import json
+        
+        # Bỏ qua ```json ... ``` hoặc chữ thừa quanh JSON
+        match = re.search(r'\{.*\}', result_text, re.DOTALL)
+        try:
+            data = json.loads(match.group(0)) if match else None
+        except ValueError:
+            data = None
+        if data is None:
+            # JSON hỏng (thường do bị cắt cụt ở max_output_tokens): giữ các cặp "số": nhãn đọc được
+            data = dict(re.findall(r'"(\d+)"\s*:\s*(-?\d+)\b', result_text))
+        if not isinstance(data, dict):
+            return {}
+        
+        labels = {}
+        for key, value in data.items():
+            try:
+                idx = int(str(key).strip())
+                score = int(value.strip()) if isinstance(value, str) else value
+            except ValueError:
+                continue
+            if not isinstance(score, bool) and score in [-1, 0, 1]:
+                labels[idx] = int(score)
+        return labels
     
-    def analyze_batch(self, texts, batch_size=32, progress_callback=None):
+    def _gemini_keyword_fallback(self, text):
+        """Điểm theo từ khóa khi không có kết quả hợp lệ từ Gemini"""
+        pos_keyword_score, neg_keyword_score, neutral_indicator = self._check_keywords_and_emojis(text)
+        if neg_keyword_score > 0.4:
+            return -1
+        elif pos_keyword_score > 0.4 and neg_keyword_score < 0.3:
+            return 1
+        elif neutral_indicator > 0.6:
+            return 0
+        else:
+            return 0 if abs(pos_keyword_score - neg_keyword_score) < 0.2 else (1 if pos_keyword_score > neg_keyword_score else -1)
+    
+    def _token_lengths(self, texts):
+        """
+        Đếm số token (sau truncation) của từng text, NaN/rỗng = 0
+
+        Với max_tokens, độ dài được giới hạn ở max_tokens như khi đưa vào model (_truncate_head_tail
+        giữ đúng ngần ấy token kể cả token đặc biệt), nên thứ tự bucket và tỉ lệ padding khớp với batch thực tế
+        """
+        lengths = [0] * len(texts)
+        idx = [i for i, text in enumerate(texts) if not pd.isna(text) and str(text).strip()]
+        if not idx:
+            return lengths
+        tokenizer = self.sentiment_pipeline.tokenizer
+        encoded = tokenizer(
+            [str(texts[i])[:512] for i in idx],
+            truncation=True,
+            max_length=512
+        )['input_ids']
+        # _truncate_head_tail chỉ cắt được với fast tokenizer
+        limit = self.max_tokens if self.max_tokens and getattr(tokenizer, 'is_fast', False) else 512
+        for i, ids in zip(idx, encoded):
+            lengths[i] = min(len(ids), limit)
+        return lengths
+    
+    @staticmethod
+    def _padding_ratio(lengths, batch_size):
+        """Tỉ lệ token padding khi chia lengths thành các batch liên tiếp"""
+        real = padded = 0
+        for i in range(0, len(lengths), batch_size):
+            chunk = [l for l in lengths[i:i+batch_size] if l > 0]
+            if chunk:
+                real += sum(chunk)
+                padded += max(chunk) * len(chunk)
+        return 1 - real / padded if padded else 0.0
+    
+    def analyze_batch(self, texts, batch_size=None, progress_callback=None, bucket_by_length=None,
+                      return_probabilities=False):
         """
         Phân tích sentiment cho nhiều texts (nhanh hơn)
         
         Args:
             texts: List hoặc Series các texts
-            batch_size: Số lượng texts xử lý cùng lúc
+            batch_size: Số lượng texts xử lý cùng lúc (None = self.batch_size)
             progress_callback: Hàm callback để cập nhật progress (current, total)
+            bucket_by_length: Sắp xếp theo số token trước khi chia batch
+                              (None = dùng giá trị đã cấu hình trong __init__)
+            return_probabilities: Nếu True, trả về DataFrame các cột OUTPUT_COLUMNS
+                                  (score + xác suất pos/neu/neg và confidence dạng float32)
             
         Returns:
-            numpy array: Mảng các sentiment scores
+            numpy array: Mảng các sentiment scores (hoặc DataFrame nếu return_probabilities=True)
         """
+        texts = texts.tolist() if hasattr(texts, 'tolist') else list(texts)
+        batch_size = batch_size or self.batch_size
+        # Comment trùng lặp chỉ phân tích một lần, sau đó tra cache, chấm từ khóa (cascade),
+        # cuối cùng mới chạy model
+        outputs = self._with_dedup(texts, lambda uniques: self._with_cache(
+            uniques,
+            lambda misses: self._with_cascade(
+                misses,
+                lambda ambiguous: self._analyze_batch_uncached(ambiguous, batch_size, progress_callback, bucket_by_length)
+            )
+        ))
+        return self._format_outputs(outputs, return_probabilities)
+    
+    @staticmethod
+    def _format_outputs(outputs, return_probabilities):
+        """Mảng kết quả -> mảng nhãn int, hoặc DataFrame OUTPUT_COLUMNS (score int, còn lại float32)"""
+        if not return_probabilities:
+            return outputs[:, 0].astype(int)
+        frame = pd.DataFrame(outputs, columns=OUTPUT_COLUMNS)
+        frame['score'] = frame['score'].astype(int)
+        return frame
+    
+    def _with_dedup(self, texts, analyze_fn):
+        """
+        Gom các text giống hệt nhau, gọi analyze_fn một lần cho mỗi text duy nhất
+        rồi gán kết quả lại cho tất cả các dòng
+        
+        Thống kê lưu trong self.dedup_stats: rows (tổng số dòng), unique (số text duy nhất),
+        duplicate_rows (số dòng dùng lại kết quả của dòng khác)
+        
+        Args:
+            texts: List các texts
+            analyze_fn: Hàm nhận list texts duy nhất, trả về mảng kết quả (OUTPUT_COLUMNS) cùng thứ tự
+            
+        Returns:
+            numpy array: Mảng kết quả (len(texts) x OUTPUT_COLUMNS) theo đúng thứ tự texts
+        """
+        # NaN có code -1 và luôn là neutral
+        codes, uniques = pd.factorize(pd.Series(texts, dtype=object))
+        results = _label_outputs(np.zeros(len(texts)))
+        if len(uniques):
+            unique_outputs = np.asarray(analyze_fn(list(uniques)))
+            valid = codes >= 0
+            results[valid] = unique_outputs[codes[valid]]
+        
+        non_null = int((codes >= 0).sum())
+        self.dedup_stats = {
+            'rows': len(texts),
+            'unique': len(uniques),
+            'duplicate_rows': non_null - len(uniques)
+        }
+        return results
+    
+    def _with_cache(self, texts, analyze_fn):
+        """
+        Tra cache cho toàn bộ texts một lần, chỉ gửi các text chưa có trong cache cho analyze_fn
+        rồi ghi kết quả mới vào cache
+        
+        Args:
+            texts: List các texts
+            analyze_fn: Hàm nhận list texts, trả về mảng kết quả (OUTPUT_COLUMNS) cùng thứ tự
+            
+        Returns:
+            numpy array: Mảng kết quả theo đúng thứ tự texts
+        """
+        if self.cache is None:
+            return np.asarray(analyze_fn(texts))
+        
+        keys = [None if pd.isna(text) or not str(text).strip() else self.cache.make_key(text, self._cache_model_key)
+                for text in texts]
+        valid_keys = [key for key in keys if key is not None]
+        hits = self.cache.get_many(valid_keys)
+        
+        results = _label_outputs(np.zeros(len(texts)))
+        miss_idx = []
+        for i, key in enumerate(keys):
+            if key is None:
+                continue
+            if key in hits:
+                results[i] = hits[key]
+            else:
+                miss_idx.append(i)
+        self.cache.record(len(valid_keys), len(valid_keys) - len(miss_idx))
+        
+        if miss_idx:
+            miss_outputs = np.asarray(analyze_fn([texts[i] for i in miss_idx]))
+            results[miss_idx] = miss_outputs
+            self.cache.put_many({keys[i]: output for i, output in zip(miss_idx, miss_outputs)})
+        
+        return results
+    
+    def _analyze_batch_uncached(self, texts, batch_size=32, progress_callback=None, bucket_by_length=None):
+        """Phân tích list texts bằng model (không qua cache), xem analyze_batch"""
         # Nếu dùng Gemini, sử dụng batch processing
-        if self.use_gemini and self.gemini_model:
-            return self.analyze_batch_gemini(texts, batch_size=min(batch_size, 20), progress_callback=progress_callback)
+        if self.use_gemini and self.gemini_dispatcher:
+            return _label_outputs(self._analyze_batch_gemini_unique(texts, batch_size=min(batch_size, 20),
+                                                                    progress_callback=progress_callback))
         
-        results = []
+        return self._with_model_outputs(texts, lambda model_texts: self._run_model_batches(
+            model_texts, batch_size, progress_callback, bucket_by_length))
+    
+    def _run_model_batches(self, texts, batch_size=32, progress_callback=None, bucket_by_length=None):
+        """
+        Chạy model cho list texts theo batch (có thể sắp xếp theo độ dài token)
+        
+        Returns:
+            numpy array: Mảng output thô (len(texts) x RAW_COLUMNS) theo đúng thứ tự texts
+        """
+        if bucket_by_length is None:
+            bucket_by_length = self.bucket_by_length
+        
+        results = np.full((len(texts), len(RAW_COLUMNS)), np.nan)
         total_batches = (len(texts) + batch_size - 1) // batch_size
+        self.tier_stats = None
+        self.pipeline_stats = None
         
-        # Xử lý theo batch để tăng tốc
-        # Sử dụng tqdm nếu không có callback (cho CLI)
-        if progress_callback is None:
-            try:
-                progress_range = tqdm(range(0, len(texts), batch_size), desc="Phân tích sentiment")
-            except:
-                progress_range = range(0, len(texts), batch_size)
-        else:
-            progress_range = range(0, len(texts), batch_size)
+        # Bucketing: xử lý theo thứ tự độ dài token, ghi kết quả về vị trí gốc
+        token_lengths = None
+        order = list(range(len(texts)))
+        self.padding_stats = None
+        if bucket_by_length and texts:
+            token_lengths = self._token_lengths(texts)
+            order = sorted(order, key=lambda i: token_lengths[i])
+            self.padding_stats = {'real_tokens': 0, 'padded_tokens': 0,
+                                  'unsorted_padding_ratio': self._padding_ratio(token_lengths, batch_size)}
         
-        for batch_idx, i in enumerate(progress_range):
-            if progress_callback:
-                progress_callback(batch_idx + 1, total_batches)
-            batch = texts[i:i+batch_size].tolist()
+        if self.pipeline_threads > 0 and texts:
+            # Tokenize batch sau trong khi model chạy batch hiện tại
+            batch_orders = [order[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+            batch_outputs = self._run_batches_overlapped([[texts[j] for j in batch_order] for batch_order in batch_orders],
+                                                         progress_callback)
+            for batch_order, output in zip(batch_orders, batch_outputs):
+                self._record_padding([token_lengths[j] for j in batch_order] if token_lengths else None)
+                results[batch_order] = output
+        else:
+            # Xử lý theo batch để tăng tốc
+            # Sử dụng tqdm nếu không có callback (cho CLI)
+            if progress_callback is None:
+                progress_range = _progress(range(0, len(texts), batch_size), desc="Phân tích sentiment")
+            else:
+                progress_range = range(0, len(texts), batch_size)
             
-            # Xử lý từng text trong batch để tránh lỗi
-            for text in batch:
-                if pd.isna(text) or not str(text).strip():
-                    results.append(0)
-                    continue
+            for batch_idx, i in enumerate(progress_range):
+                if progress_callback:
+                    progress_callback(batch_idx + 1, total_batches)
+                batch_order = order[i:i+batch_size]
+                batch = [texts[j] for j in batch_order]
+                batch_lengths = [token_lengths[j] for j in batch_order] if token_lengths else None
                 
-                try:
-                    # Sử dụng analyze_text để có logic cải thiện
-                    sentiment_score = self.analyze_text(text)
-                    results.append(sentiment_score)
-                        
-                except Exception as e:
-                    # Nếu lỗi, mặc định là neutral
-                    print(f"Lỗi khi phân tích: {str(e)[:100]}")
-                    results.append(0)
+                # Một forward pass cho cả batch
+                results[batch_order] = self._run_model_batch(batch, batch_lengths)
         
-        return np.array(results)
+        if token_lengths is not None:
+            padded = self.padding_stats['padded_tokens']
+            self.padding_stats['padding_ratio'] = 1 - self.padding_stats['real_tokens'] / padded if padded else 0.0
+            print(f"Padding: {self.padding_stats['padding_ratio']*100:.1f}% token là padding "
+                  f"(không sắp xếp: {self.padding_stats['unsorted_padding_ratio']*100:.1f}%)")
+        
+        if self.tier_stats:
+            print(f"Tầng 1: {self.tier_stats['tier1_rows']} dòng, {self.tier_stats['tier1_seconds']:.2f}s | "
+                  f"Tầng 2: {self.tier_stats['tier2_rows']} dòng, {self.tier_stats['tier2_seconds']:.2f}s")
+        
+        return results
+    
+    def analyze_batch_parallel(self, texts, batch_size=None, workers=1, progress_callback=None,
+                               return_probabilities=False, executor=None):
+        """
+        Phân tích sentiment bằng nhiều process, mỗi process tải model một lần
+        
+        Texts được chia thành các shard liên tiếp, kết quả được ghép lại đúng thứ tự ban đầu.
+        Nếu workers <= 1, dùng Gemini, hoặc không tạo được process pool thì chạy 1 process.
+        
+        Args:
+            texts: List hoặc Series các texts
+            batch_size: Số lượng texts xử lý cùng lúc trong mỗi worker (None = self.batch_size)
+            workers: Số process
+            progress_callback: Hàm callback để cập nhật progress (current, total) theo shard
+            return_probabilities: Xem analyze_batch
+            executor: Process pool tạo bằng _worker_pool(workers), dùng lại giữa nhiều lần gọi
+                      (None = tạo pool mới cho lần gọi này, mỗi worker tải lại model)
+            
+        Returns:
+            numpy array: Mảng các sentiment scores (hoặc DataFrame nếu return_probabilities=True)
+        """
+        texts = texts.tolist() if hasattr(texts, 'tolist') else list(texts)
+        batch_size = batch_size or self.batch_size
+        if workers <= 1 or self.use_gemini or len(texts) <= batch_size:
+            return self.analyze_batch(texts, batch_size=batch_size, progress_callback=progress_callback,
+                                      return_probabilities=return_probabilities)
+        
+        # Loại trùng, tra cache và cascade ở process chính, chỉ chia các text cần model cho worker
+        outputs = self._with_dedup(texts, lambda uniques: self._with_cache(
+            uniques,
+            lambda misses: self._with_cascade(
+                misses,
+                lambda ambiguous: self._analyze_parallel_uncached(ambiguous, batch_size, workers, progress_callback,
+                                                                  executor)
+            )
+        ))
+        return self._format_outputs(outputs, return_probabilities)
+    
+    def _analyze_parallel_uncached(self, texts, batch_size, workers, progress_callback=None, executor=None):
+        """Chạy model trên process pool rồi kết hợp với từ khóa ở process chính (không qua cache)"""
+        return self._with_model_outputs(texts, lambda model_texts: self._run_model_parallel(
+            model_texts, batch_size, workers, progress_callback, executor))
     
-    def process_csv(self, input_file, output_file=None, text_column='text', trust_column='sentiment', batch_size=32):
+    def _worker_pool(self, workers):
+        """
+        Process pool cho analyze_batch_parallel, dùng được như context manager
+
+        Worker được tạo khi có shard đầu tiên và tải model một lần, rồi dùng lại cho mọi lần gọi
+        nhận pool này (các đợt checkpoint, các chunk của file lớn).
+        Trả về nullcontext() (giá trị None) nếu không cần nhiều process.
+        """
+        if workers <= 1 or self.use_gemini:
+            return contextlib.nullcontext()
+        # Chia đều số thread torch cho các worker để tránh tranh chấp CPU
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"Process pool: {workers} worker ({num_threads} thread/worker)")
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self._init_kwargs, num_threads)
+        )
+    
+    def _run_model_parallel(self, texts, batch_size, workers, progress_callback=None, executor=None):
+        """Chia texts thành shard, chạy model trên process pool, trả về mảng output thô (RAW_COLUMNS)"""
+        # Mỗi worker giữ vài batch để cân bằng tải giữa các process, nhưng đủ shard để mọi worker có việc
+        shard_size = max(1, min(batch_size * 4, math.ceil(len(texts) / workers)))
+        shards = [texts[i:i+shard_size] for i in range(0, len(texts), shard_size)]
+        
+        print(f"Đang chạy {workers} worker process ({len(shards)} shard)...")
+        results = []
+        own_executor = executor is None
+        try:
+            if own_executor:
+                executor = self._worker_pool(workers)
+            shard_results = executor.map(_analyze_shard, [(shard, batch_size) for shard in shards])
+            if progress_callback is None:
+                shard_results = _progress(shard_results, total=len(shards), desc=f"Phân tích sentiment ({workers} process)")
+            for shard_idx, shard_scores in enumerate(shard_results):
+                if progress_callback:
+                    progress_callback(shard_idx + 1, len(shards))
+                results.extend(shard_scores)
+        except Exception as e:
+            print(f"Không chạy được nhiều process ({str(e)[:100]}), chuyển về 1 process...")
+            return self._run_model_batches(texts, batch_size=batch_size, progress_callback=progress_callback)
+        finally:
+            if own_executor and executor is not None:
+                executor.shutdown()
+        
+        return np.array(results, dtype=np.float64).reshape(-1, len(RAW_COLUMNS))
+    
+    def process_csv(self, input_file, output_file=None, text_column='text', trust_column='sentiment', batch_size=None,
+                    workers=1, checkpoint=False, checkpoint_every=20, checkpoint_seconds=60, chunk_rows=None,
+                    probabilities=False, relabel=False):
         """
         Xử lý file CSV: đọc, phân tích sentiment, và lưu kết quả
         
@@ -622,8 +1660,27 @@ Trả về CHỈ CÁC SỐ, mỗi dòng 1 số, theo thứ tự:
             output_file: Đường dẫn file CSV đầu ra (nếu None thì ghi đè file đầu vào)
             text_column: Tên cột chứa text
             trust_column: Tên cột sentiment cần tạo/cập nhật (mặc định: 'sentiment')
-            batch_size: Số lượng texts xử lý cùng lúc
+            batch_size: Số lượng texts xử lý cùng lúc (None = self.batch_size)
+            workers: Số process chạy song song (1 = không chia process)
+            checkpoint: Nếu True, ghi kết quả vào journal `<output_file>.journal` sau mỗi đợt
+                        (checkpoint_every batch hoặc khoảng checkpoint_seconds giây). Chạy lại với
+                        cùng input/output thì bỏ qua các dòng đã xong; journal bị xóa khi ghi xong file
+            checkpoint_every: Số batch tối đa mỗi đợt checkpoint
+            checkpoint_seconds: Thời gian mục tiêu (giây) của mỗi đợt checkpoint
+            chunk_rows: Nếu có, đọc/ghi file theo từng chunk bấy nhiêu dòng (bộ nhớ không phụ thuộc
+                        kích thước file), xem _process_csv_streaming. Khi đó hàm trả về None
+            probabilities: Nếu True, ghi thêm các cột `<trust_column>_pos/_neu/_neg/_confidence`
+                           (xác suất của model; rỗng với các dòng được quyết định bằng từ khóa hoặc Gemini)
+            relabel: Nếu True, chấm lại mọi dòng kể cả dòng đã có sentiment (sau khi sửa từ điển/ngưỡng).
+                     Dùng kèm model_store_path để chỉ kết hợp lại trên output model đã lưu
         """
+        if output_file is None:
+            output_file = input_file
+        batch_size = batch_size or self.batch_size
+        if chunk_rows:
+            return self._process_csv_streaming(input_file, output_file, text_column, trust_column,
+                                               batch_size, workers, chunk_rows, checkpoint, probabilities, relabel)
+        
         print(f"Đang đọc file: {input_file}")
         df = pd.read_csv(input_file)
         
@@ -634,8 +1691,11 @@ Trả về CHỈ CÁC SỐ, mỗi dòng 1 số, theo thứ tự:
         if trust_column not in df.columns:
             df[trust_column] = None
         
-        # Lọc các dòng cần phân tích (chưa có sentiment hoặc sentiment rỗng)
-        mask = df[trust_column].isna() | (df[trust_column] == '')
+        # Lọc các dòng cần phân tích (chưa có sentiment hoặc sentiment rỗng, hoặc mọi dòng nếu relabel)
+        if relabel:
+            mask = pd.Series(True, index=df.index)
+        else:
+            mask = df[trust_column].isna() | (df[trust_column] == '')
         texts_to_analyze = df.loc[mask, text_column]
         
         if len(texts_to_analyze) == 0:
@@ -646,28 +1706,256 @@ Trả về CHỈ CÁC SỐ, mỗi dòng 1 số, theo thứ tự:
         
         # Phân tích sentiment
         print("Bắt đầu phân tích sentiment...")
-        sentiment_scores = self.analyze_batch(texts_to_analyze, batch_size=batch_size)
+        if self.cache is not None:
+            self.cache.reset_stats()
+        if self.model_store is not None:
+            self.model_store.reset_stats()
+        journal = None
+        if checkpoint:
+            journal, outputs = self._run_with_checkpoint(df, mask, input_file, output_file, text_column, trust_column,
+                                                         batch_size, workers, checkpoint_every, checkpoint_seconds,
+                                                         probabilities, relabel)
+        else:
+            outputs = self.analyze_batch_parallel(texts_to_analyze, batch_size=batch_size, workers=workers,
+                                                  return_probabilities=True).to_numpy(np.float32)
         
         # Cập nhật cột sentiment
-        df.loc[mask, trust_column] = sentiment_scores
+        df.loc[mask, trust_column] = outputs[:, 0].astype(int)
+        if probabilities:
+            self._assign_probabilities(df, mask, outputs, trust_column)
         
         # Thống kê kết quả
         print("\n=== Thống kê kết quả ===")
         print(f"Tích cực (1): {(df[trust_column] == 1).sum()} ({((df[trust_column] == 1).sum() / len(df) * 100):.2f}%)")
         print(f"Trung tính (0): {(df[trust_column] == 0).sum()} ({((df[trust_column] == 0).sum() / len(df) * 100):.2f}%)")
         print(f"Tiêu cực (-1): {(df[trust_column] == -1).sum()} ({((df[trust_column] == -1).sum() / len(df) * 100):.2f}%)")
-        
-        # Lưu file
-        if output_file is None:
-            output_file = input_file
+        if self.dedup_stats:
+            print(f"Loại trùng: {self.dedup_stats['unique']} comment duy nhất / {self.dedup_stats['rows']} dòng "
+                  f"({self.dedup_stats['duplicate_rows']} dòng dùng lại kết quả)")
+        if self.cache is not None:
+            print(f"Cache: {self.cache.hits}/{self.cache.lookups} comment có sẵn kết quả "
+                  f"(hit rate {self.cache.hit_rate*100:.1f}%)")
+        self._print_model_store_stats()
         
         print(f"\nĐang lưu kết quả vào: {output_file}")
         df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        if journal is not None:
+            journal.remove()
         print("Hoàn thành!")
         
         return df
     
-    def process_csv_dataframe(self, df, text_column='text', trust_column='sentiment', batch_size=32):
+    @staticmethod
+    def _probability_columns(trust_column):
+        """Tên các cột xác suất ghi cạnh cột sentiment"""
+        return [f"{trust_column}_{name}" for name in OUTPUT_COLUMNS[1:]]
+    
+    @classmethod
+    def _assign_probabilities(cls, df, mask, outputs, trust_column):
+        """Ghi xác suất (float32, làm tròn 4 chữ số) cho các dòng trong mask, giữ nguyên giá trị cũ của dòng khác"""
+        for column, values in zip(cls._probability_columns(trust_column), outputs[:, 1:].T):
+            if column not in df.columns:
+                df[column] = np.nan
+            df[column] = df[column].astype(np.float32)
+            df.loc[mask, column] = np.round(values, 4)
+    
+    def _print_model_store_stats(self):
+        """In số comment lấy output model từ ModelOutputStore (không phải chạy model)"""
+        if self.model_store is not None and self.model_store.lookups:
+            print(f"Output model đã lưu: {self.model_store.hits}/{self.model_store.lookups} comment chỉ cần "
+                  f"kết hợp lại với từ khóa (hit rate {self.model_store.hit_rate*100:.1f}%)")
+    
+    def _process_csv_streaming(self, input_file, output_file, text_column, trust_column, batch_size, workers,
+                               chunk_rows, checkpoint, probabilities=False, relabel=False):
+        """
+        Xử lý file CSV theo từng chunk: đọc chunk_rows dòng, phân tích, ghi nối vào file đầu ra
+        
+        Chỉ giữ một chunk trong bộ nhớ. Các cột được đọc/ghi dạng chuỗi nên giá trị giữ nguyên như
+        file đầu vào. Kết quả ghi vào `<output_file>.partial` rồi mới đổi tên thành output_file
+        (ghi đè được cả file đầu vào). Nếu checkpoint=True, sau mỗi chunk lưu số chunk và kích thước
+        file đã ghi vào journal `<output_file>.journal`; chạy lại thì cắt file .partial về lần
+        ghi cuối và đọc tiếp từ chunk kế tiếp.
+        """
+        import json
+        
+        partial_file = f"{output_file}.partial"
+        counts = {1: 0, 0: 0, -1: 0}
+        state = {'chunks': 0, 'bytes': 0, 'rows': 0, 'analyzed': 0, 'counts': counts}
+        journal = None
+        if checkpoint:
+            fingerprint = self._checkpoint_fingerprint(input_file, text_column, trust_column, probabilities, relabel,
+                                                       f"chunk{chunk_rows}")
+            journal = CheckpointJournal(f"{output_file}.journal", fingerprint)
+            saved = journal.get_meta('stream')
+            if saved and os.path.exists(partial_file):
+                state = json.loads(saved)
+                counts = state['counts'] = {int(k): v for k, v in state['counts'].items()}
+                # Bỏ phần ghi dở sau checkpoint cuối
+                with open(partial_file, 'r+b') as f:
+                    f.truncate(state['bytes'])
+                print(f"Tiếp tục từ checkpoint: {state['rows']} dòng ({state['chunks']} chunk) đã xong ({journal.path})")
+        
+        print(f"Đang đọc file theo chunk {chunk_rows} dòng: {input_file}")
+        if self.cache is not None:
+            self.cache.reset_stats()
+        if self.model_store is not None:
+            self.model_store.reset_stats()
+        
+        # Một process pool cho cả file: worker chỉ tải model một lần, không phải mỗi chunk
+        with self._worker_pool(workers) as executor:
+            reader = pd.read_csv(input_file, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+            for chunk_idx, chunk in enumerate(reader):
+                if chunk_idx < state['chunks']:
+                    continue
+                
+                # Kiểm tra xem cột sentiment đã tồn tại chưa, nếu không thì thêm vào cuối
+                if trust_column not in chunk.columns:
+                    chunk[trust_column] = ''
+                if probabilities:
+                    for column in self._probability_columns(trust_column):
+                        if column not in chunk.columns:
+                            chunk[column] = ''
+                
+                # Lọc các dòng cần phân tích (chưa có sentiment hoặc sentiment rỗng, hoặc mọi dòng nếu relabel)
+                mask = pd.Series(relabel, index=chunk.index) | (chunk[trust_column].str.strip() == '')
+                if mask.any():
+                    texts = chunk.loc[mask, text_column].replace('', np.nan)
+                    outputs = self.analyze_batch_parallel(texts, batch_size=batch_size, workers=workers,
+                                                          return_probabilities=True, executor=executor)
+                    chunk.loc[mask, trust_column] = outputs['score'].astype(str).to_numpy()
+                    if probabilities:
+                        # Cột chuỗi: xác suất làm tròn 4 chữ số, NaN -> rỗng
+                        for column, name in zip(self._probability_columns(trust_column), OUTPUT_COLUMNS[1:]):
+                            values = outputs[name].round(4)
+                            chunk.loc[mask, column] = values.map('{:g}'.format).where(values.notna(), '').to_numpy()
+                
+                scores = pd.to_numeric(chunk[trust_column], errors='coerce')
+                for score in counts:
+                    counts[score] += int((scores == score).sum())
+                
+                first = chunk_idx == 0
+                with open(partial_file, 'w' if first else 'a', encoding='utf-8-sig' if first else 'utf-8',
+                          newline='') as f:
+                    chunk.to_csv(f, index=False, header=first)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    state['bytes'] = f.tell()
+                
+                state['chunks'] = chunk_idx + 1
+                state['rows'] += len(chunk)
+                state['analyzed'] += int(mask.sum())
+                print(f"Chunk {chunk_idx + 1}: {state['rows']} dòng đã xử lý ({state['analyzed']} dòng phân tích)")
+                if journal is not None:
+                    journal.set_meta('stream', json.dumps(state))
+        
+        total = max(state['rows'], 1)
+        print("\n=== Thống kê kết quả ===")
+        print(f"Tổng số dòng: {state['rows']}, đã phân tích: {state['analyzed']}")
+        print(f"Tích cực (1): {counts[1]} ({counts[1] / total * 100:.2f}%)")
+        print(f"Trung tính (0): {counts[0]} ({counts[0] / total * 100:.2f}%)")
+        print(f"Tiêu cực (-1): {counts[-1]} ({counts[-1] / total * 100:.2f}%)")
+        if self.cache is not None:
+            print(f"Cache: {self.cache.hits}/{self.cache.lookups} comment có sẵn kết quả "
+                  f"(hit rate {self.cache.hit_rate*100:.1f}%)")
+        self._print_model_store_stats()
+        
+        print(f"\nĐang lưu kết quả vào: {output_file}")
+        os.replace(partial_file, output_file)
+        if journal is not None:
+            journal.remove()
+        print("Hoàn thành!")
+        return None
+    
+    def _checkpoint_fingerprint(self, input_file, text_column, trust_column, probabilities, relabel, *extra):
+        """
+        Fingerprint của journal checkpoint (dùng chung cho chế độ đọc cả file và đọc theo chunk)
+
+        Gồm file đầu vào, các cột, model/từ điển và mọi tùy chọn làm thay đổi kết quả ghi ra:
+        đổi một trong số đó thì journal cũ bị bỏ và chạy lại từ đầu
+
+        Args:
+            extra: Thông tin riêng của từng chế độ (số dòng mỗi chunk, cột key...)
+        """
+        return '|'.join([os.path.abspath(input_file), str(os.path.getsize(input_file)), text_column, trust_column,
+                         self._cache_model_key, f"probs{int(probabilities)}", f"relabel{int(relabel)}", *extra])
+    
+    def _run_with_checkpoint(self, df, mask, input_file, output_file, text_column, trust_column,
+                             batch_size, workers, checkpoint_every, checkpoint_seconds, probabilities=False,
+                             relabel=False):
+        """
+        Phân tích các dòng trong mask theo từng đợt, ghi kết quả mỗi đợt vào journal, xem process_csv
+        
+        Returns:
+            tuple: (CheckpointJournal đang mở (xóa sau khi đã ghi file đầu ra),
+                    mảng kết quả OUTPUT_COLUMNS của các dòng trong mask)
+        """
+        rows = df.index[mask]
+        # Key của dòng: cid nếu có và không trùng, nếu không thì số thứ tự dòng
+        if 'cid' in df.columns and df.loc[rows, 'cid'].notna().all() and df.loc[rows, 'cid'].is_unique:
+            key_column = 'cid'
+            row_keys = df.loc[rows, 'cid'].astype(str).tolist()
+        else:
+            key_column = 'row'
+            row_keys = [str(i) for i in range(len(df)) if mask.iloc[i]]
+        
+        fingerprint = self._checkpoint_fingerprint(input_file, text_column, trust_column, probabilities, relabel,
+                                                   str(len(df)), key_column)
+        journal = CheckpointJournal(f"{output_file}.journal", fingerprint)
+        done = journal.load()
+        if done:
+            print(f"Tiếp tục từ checkpoint: {len(done)}/{len(row_keys)} dòng đã phân tích ({journal.path})")
+        
+        todo = np.array([key not in done for key in row_keys], dtype=bool)
+        keys_todo = [key for key, flag in zip(row_keys, todo) if flag]
+        
+        # Loại trùng trên toàn bộ phần còn lại; mỗi đợt chạy một đoạn các text duy nhất
+        # rồi ghi kết quả cho mọi dòng có text đó (NaN có code -1, luôn là neutral)
+        codes, uniques = pd.factorize(df.loc[rows[todo], text_column].astype(object))
+        unique_outputs = _label_outputs(np.zeros(len(uniques)))
+        neutral = _label_outputs(np.zeros(1))[0]
+        
+        pending = {key: neutral for key, code in zip(keys_todo, codes) if code < 0}
+        max_chunk = max(batch_size, batch_size * checkpoint_every)
+        chunk = max_chunk
+        start = 0
+        # Một process pool cho mọi đợt: worker chỉ tải model một lần
+        with self._worker_pool(workers) as executor:
+            while start < len(uniques):
+                stop = min(start + chunk, len(uniques))
+                chunk_start = time.perf_counter()
+                unique_outputs[start:stop] = self.analyze_batch_parallel(
+                    list(uniques[start:stop]), batch_size=batch_size, workers=workers, return_probabilities=True,
+                    executor=executor
+                ).to_numpy(np.float32)
+                elapsed = time.perf_counter() - chunk_start
+                
+                in_chunk = (codes >= start) & (codes < stop)
+                pending.update((key, unique_outputs[code])
+                               for key, code, flag in zip(keys_todo, codes, in_chunk) if flag)
+                journal.record(pending)
+                pending = {}
+                
+                # Đợt sau chạy khoảng checkpoint_seconds giây, không quá checkpoint_every batch
+                if elapsed > 0:
+                    rate = (stop - start) / elapsed
+                    chunk = int(min(max_chunk, max(batch_size, rate * checkpoint_seconds // batch_size * batch_size)))
+                start = stop
+        journal.record(pending)
+        self.dedup_stats = {'rows': len(codes), 'unique': len(uniques),
+                            'duplicate_rows': int((codes >= 0).sum()) - len(uniques)}
+        
+        outputs = _label_outputs(np.zeros(len(row_keys)))
+        for i, key in enumerate(row_keys):
+            if key in done:
+                outputs[i] = done[key]
+        todo_outputs = np.tile(neutral, (len(codes), 1))
+        valid = codes >= 0
+        todo_outputs[valid] = unique_outputs[codes[valid]]
+        outputs[todo] = todo_outputs
+        return journal, outputs
+    
+    def process_csv_dataframe(self, df, text_column='text', trust_column='sentiment', batch_size=None,
+                              probabilities=False):
         """
         Xử lý DataFrame trực tiếp: phân tích sentiment và thêm cột sentiment
         
@@ -675,7 +1963,8 @@ Trả về CHỈ CÁC SỐ, mỗi dòng 1 số, theo thứ tự:
             df: DataFrame cần xử lý
             text_column: Tên cột chứa text
             trust_column: Tên cột sentiment cần tạo/cập nhật (mặc định: 'sentiment')
-            batch_size: Số lượng texts xử lý cùng lúc
+            batch_size: Số lượng texts xử lý cùng lúc (None = self.batch_size)
+            probabilities: Nếu True, thêm các cột xác suất `<trust_column>_pos/_neu/_neg/_confidence`
             
         Returns:
             DataFrame: DataFrame đã được thêm cột sentiment
@@ -695,14 +1984,179 @@ Trả về CHỈ CÁC SỐ, mỗi dòng 1 số, theo thứ tự:
         progress_callback = getattr(self, 'progress_callback', None)
         
         # Phân tích sentiment
-        sentiment_scores = self.analyze_batch(texts_to_analyze, batch_size=batch_size, progress_callback=progress_callback)
+        outputs = self.analyze_batch(texts_to_analyze, batch_size=batch_size, progress_callback=progress_callback,
+                                     return_probabilities=True).to_numpy(np.float32)
         
         # Cập nhật cột sentiment
-        df.loc[mask, trust_column] = sentiment_scores
+        df.loc[mask, trust_column] = outputs[:, 0].astype(int)
+        if probabilities:
+            self._assign_probabilities(df, mask, outputs, trust_column)
         
         return df
 
 
+def _code_version(*functions):
+    """Hash bytecode và hằng số (ngưỡng, trọng số) của các hàm, gồm cả hàm lồng bên trong (bỏ qua docstring)"""
+    digest = hashlib.sha1()
+    docstrings = {function.__doc__ for function in functions}
+    codes = [function.__code__ for function in functions]
+    while codes:
+        code = codes.pop()
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode('utf-8'))
+        for const in code.co_consts:
+            if hasattr(const, 'co_code'):
+                codes.append(const)
+            elif const not in docstrings:
+                digest.update(repr(const).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+# Phiên bản luật kết hợp model với từ khóa/emoji (dùng cùng LEXICON_VERSION trong key cache và checkpoint):
+# ngưỡng nằm trực tiếp trong code nên hash chính các hàm chấm điểm/kết hợp, sửa ngưỡng là đổi key.
+# Kho output thô (ModelOutputStore) không phụ thuộc phiên bản này nên kết hợp lại không phải chạy lại model
+FUSION_VERSION = _code_version(SentimentAnalyzer._fuse_arrays, SentimentAnalyzer._scores_from_count_arrays,
+                               SentimentAnalyzer._lexicon_features, SentimentAnalyzer.fuse_outputs,
+                               _add_repeated_array)
+
+
+# Analyzer của worker process (mỗi process tải model một lần)
+_worker_analyzer = None
+
+
+def _init_worker(init_kwargs, num_threads):
+    """Khởi tạo analyzer trong worker process"""
+    global _worker_analyzer
+    if init_kwargs.get('backend') != 'fast':
+        import torch
+        torch.set_num_threads(num_threads)
+    _worker_analyzer = SentimentAnalyzer(**init_kwargs)
+
+
+def _analyze_shard(args):
+    """Chạy model cho một shard trong worker process, trả về list các dòng output thô (RAW_COLUMNS)"""
+    texts, batch_size = args
+    return _worker_analyzer._run_model_batches(texts, batch_size=batch_size,
+                                               progress_callback=lambda *_: None).tolist()
+
+
+def check_quantized_agreement(input_file, model_name='nlptown/bert-base-multilingual-uncased-sentiment',
+                              text_column='text', label_column='trust', sample_size=500, batch_size=32):
+    """
+    So sánh model int8 với model fp32 trên file đã gán nhãn
+    (ví dụ: src/data/highland/dataset_tiktok-comments-trust-scraper_*.csv)
+    
+    Args:
+        input_file: File CSV có cột text và cột nhãn
+        model_name: Model cần kiểm tra
+        text_column: Tên cột chứa text
+        label_column: Tên cột nhãn (1, 0, -1)
+        sample_size: Số dòng lấy mẫu (None = toàn bộ file)
+        batch_size: Kích thước batch
+        
+    Returns:
+        dict: Tỉ lệ đồng thuận giữa int8 và fp32, độ chính xác so với nhãn và thời gian chạy
+    """
+    df = pd.read_csv(input_file)
+    df = df[df[text_column].notna()]
+    if sample_size and len(df) > sample_size:
+        df = df.sample(n=sample_size, random_state=42)
+    texts = df[text_column]
+    
+    report = {'rows': len(df)}
+    predictions = {}
+    for name, quantized in [('fp32', False), ('int8', True)]:
+        # Không dùng profile auto-tune: hai lần đo phải cùng batch size và số thread
+        loaded = set(MODEL_REGISTRY.keys())
+        analyzer = SentimentAnalyzer(model_name=model_name, backend='torch', quantized=quantized,
+                                     batch_size=batch_size, tuned_profile=False)
+        start = time.perf_counter()
+        predictions[name] = analyzer.analyze_batch(texts, batch_size=batch_size, progress_callback=lambda *_: None)
+        report[f'{name}_seconds'] = time.perf_counter() - start
+        del analyzer
+        # Registry vẫn giữ pipeline sau khi xóa analyzer: bỏ model vừa tải để fp32 và int8 không cùng nằm trong RAM
+        for key in set(MODEL_REGISTRY.keys()) - loaded:
+            MODEL_REGISTRY.evict(key)
+    
+    report['agreement'] = float((predictions['fp32'] == predictions['int8']).mean())
+    if label_column in df.columns:
+        labels = pd.to_numeric(df[label_column], errors='coerce').to_numpy()
+        for name, preds in predictions.items():
+            report[f'{name}_accuracy'] = float((preds == labels).mean())
+    
+    print("\n=== So sánh int8 và fp32 ===")
+    print(f"Số dòng: {report['rows']}")
+    print(f"Đồng thuận int8/fp32: {report['agreement']*100:.2f}%")
+    for name in predictions:
+        line = f"{name}: {report[f'{name}_seconds']:.2f}s"
+        if f'{name}_accuracy' in report:
+            line += f", khớp nhãn {label_column}: {report[f'{name}_accuracy']*100:.2f}%"
+        print(line)
+    
+    return report
+
+
+def _bundled_datasets():
+    """Các file CSV có cột text trong thư mục data của repo"""
+    import glob
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+    files = sorted(glob.glob(os.path.join(data_dir, '**', '*.csv'), recursive=True))
+    return [f for f in files if 'text' in pd.read_csv(f, nrows=0).columns]
+
+
+def measure_truncation(input_files=None, max_tokens=128, model_name='cardiffnlp/twitter-roberta-base-sentiment-latest',
+                       text_column='text', batch_size=32):
+    """
+    So sánh cắt head+tail theo max_tokens với chạy đủ độ dài (512 token)
+    
+    Args:
+        input_files: Danh sách file CSV (None = các file trong src/data)
+        max_tokens: Số token tối đa cần đo
+        model_name: Model sử dụng
+        text_column: Tên cột chứa text
+        batch_size: Kích thước batch
+        
+    Returns:
+        dict: Thời gian mỗi chế độ, thời gian tiết kiệm và tỉ lệ đồng thuận nhãn
+    """
+    input_files = input_files or _bundled_datasets()
+    texts = pd.concat([pd.read_csv(f)[text_column] for f in input_files], ignore_index=True).dropna()
+    texts = texts.drop_duplicates().tolist()
+    
+    analyzer = SentimentAnalyzer(model_name=model_name)
+    silent = lambda *_: None
+    
+    predictions = {}
+    seconds = {}
+    for name, budget in [('full', None), ('truncated', max_tokens)]:
+        analyzer.max_tokens = budget
+        start = time.perf_counter()
+        predictions[name] = analyzer.analyze_batch(texts, batch_size=batch_size, progress_callback=silent)
+        seconds[name] = time.perf_counter() - start
+    
+    analyzer.max_tokens = max_tokens
+    was_truncated = np.array([a != b for a, b in zip(texts, analyzer._truncate_head_tail(texts))])
+    same = predictions['full'] == predictions['truncated']
+    report = {
+        'files': len(input_files),
+        'rows': len(texts),
+        'truncated_rows': int(was_truncated.sum()),
+        'full_seconds': seconds['full'],
+        'truncated_seconds': seconds['truncated'],
+        'seconds_saved': seconds['full'] - seconds['truncated'],
+        'agreement': float(same.mean()) if len(texts) else 1.0,
+        'agreement_truncated_rows': float(same[was_truncated].mean()) if was_truncated.any() else 1.0,
+    }
+    
+    print(f"\n=== Cắt head+tail {max_tokens} token so với đủ độ dài ===")
+    print(f"{report['rows']} comment duy nhất từ {report['files']} file, {report['truncated_rows']} comment bị cắt")
+    print(f"Đủ độ dài: {report['full_seconds']:.2f}s | {max_tokens} token: {report['truncated_seconds']:.2f}s "
+          f"(tiết kiệm {report['seconds_saved']:.2f}s)")
+    print(f"Đồng thuận nhãn: {report['agreement']*100:.2f}% "
+          f"(trên các comment bị cắt: {report['agreement_truncated_rows']*100:.2f}%)")
+    return report
+
+
 def main():
     """Hàm main để chạy tool"""
     import argparse
@@ -717,11 +2171,102 @@ def main():
     parser.add_argument('--model', '-m',
                        default='cardiffnlp/twitter-roberta-base-sentiment-latest',
                        choices=['cardiffnlp/twitter-roberta-base-sentiment-latest',
-                               'nlptown/bert-base-multilingual-uncased-sentiment'],
-                       help='Model sentiment analysis')
+                               'nlptown/bert-base-multilingual-uncased-sentiment',
+                               'gemini-2.5-flash'],
+                       help='Model sentiment analysis (gemini-2.5-flash cần biến môi trường GEMINI_API_KEY)')
+    parser.add_argument('--backend',
+                       default=None,
+                       choices=BACKENDS,
+                       help='Backend suy luận: torch, onnx (ONNX Runtime, chỉ CPU) hoặc fast (bộ phân loại tuyến tính '
+                            'chưng cất, huấn luyện bằng run_train_fast.py) (mặc định: theo profile auto-tune, không có thì torch)')
+    parser.add_argument('--fast-model',
+                       default=None, metavar='PATH',
+                       help=f'File bộ phân loại của --backend fast (mặc định: {DEFAULT_FAST_MODEL_PATH})')
+    parser.add_argument('--quantized',
+                       action='store_true',
+                       help='Lượng tử hóa động int8 (CPU), model được cache sau lần đầu')
+    parser.add_argument('--check-quantized',
+                       metavar='LABELED_CSV',
+                       default=None,
+                       help='Chỉ so sánh int8 với fp32 trên file CSV đã gán nhãn rồi thoát')
     parser.add_argument('--batch-size', '-b',
-                       type=int, default=32,
-                       help='Kích thước batch (mặc định: 32)')
+                       type=int, default=None,
+                       help='Kích thước batch (mặc định: theo profile auto-tune, không có thì 32)')
+    parser.add_argument('--no-profile',
+                       action='store_true',
+                       help='Không dùng profile auto-tune (python src/run_auto_tune.py) cho backend/batch size/số thread')
+    parser.add_argument('--bucket-by-length',
+                       action='store_true',
+                       help='Sắp xếp comments theo độ dài token trước khi chia batch để giảm padding')
+    parser.add_argument('--workers', '-w',
+                       type=int, default=1,
+                       help='Số process chạy song song, mỗi process tải model một lần (mặc định: 1)')
+    parser.add_argument('--max-tokens',
+                       type=int, default=None,
+                       help='Số token tối đa đưa vào model, cắt giữ phần đầu + phần cuối (ví dụ: 128)')
+    parser.add_argument('--measure-truncation',
+                       nargs='*', default=None, metavar='CSV',
+                       help='Chỉ đo thời gian tiết kiệm và độ đồng thuận của --max-tokens (mặc định 128) '
+                            'so với đủ độ dài trên các file CSV (mặc định: các file trong src/data) rồi thoát')
+    parser.add_argument('--cascade-model',
+                       default=None,
+                       choices=['nlptown/bert-base-multilingual-uncased-sentiment',
+                               'cardiffnlp/twitter-roberta-base-sentiment-latest'],
+                       help='Model thứ 2 (nặng) chỉ chấm lại các comment mà --model chấm với độ tin cậy thấp')
+    parser.add_argument('--star-mapping',
+                       default='argmax', choices=STAR_MAPPINGS,
+                       help='Model đánh giá theo sao (nlptown): argmax = label cao nhất, '
+                            'expected = số sao kỳ vọng theo xác suất (mặc định: argmax)')
+    parser.add_argument('--cascade-threshold',
+                       type=float, default=0.7,
+                       help='Ngưỡng xác suất lớp cao nhất của --model để chuyển sang --cascade-model (mặc định: 0.7)')
+    parser.add_argument('--lexicon-cascade',
+                       action='store_true',
+                       help='Chấm từ khóa trước, chỉ chạy model cho các comment chưa chốt được bằng từ khóa')
+    parser.add_argument('--cache',
+                       nargs='?', const=DEFAULT_CACHE_PATH, default=None, metavar='PATH',
+                       help=f'Cache kết quả theo nội dung comment trong file SQLite (mặc định: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--model-store',
+                       nargs='?', const=DEFAULT_MODEL_STORE_PATH, default=None, metavar='PATH',
+                       help='Lưu output thô của model theo nội dung comment (SQLite, không phụ thuộc từ điển từ khóa, '
+                            f'mặc định: {DEFAULT_MODEL_STORE_PATH})')
+    parser.add_argument('--relabel',
+                       action='store_true',
+                       help='Chấm lại mọi dòng kể cả dòng đã có sentiment (dùng kèm --model-store sau khi sửa từ điển/ngưỡng)')
+    parser.add_argument('--pipeline-threads',
+                       type=int, default=0, metavar='N',
+                       help='Chạy chồng lấp tokenize (N thread) / forward pass / xử lý output thay vì tuần tự (mặc định: 0 = tắt)')
+    parser.add_argument('--pipeline-queue',
+                       type=int, default=2, metavar='N',
+                       help='Số batch tối đa chờ giữa hai stage khi dùng --pipeline-threads (mặc định: 2)')
+    parser.add_argument('--probabilities',
+                       action='store_true',
+                       help='Ghi thêm cột xác suất <trust-column>_pos/_neu/_neg/_confidence của model')
+    parser.add_argument('--chunk-rows',
+                       type=int, default=None, metavar='N',
+                       help='Đọc và ghi file theo từng chunk N dòng (file rất lớn, bộ nhớ không phụ thuộc kích thước file)')
+    parser.add_argument('--checkpoint',
+                       action='store_true',
+                       help='Ghi kết quả từng đợt vào journal <output>.journal, chạy lại cùng lệnh thì tiếp tục từ chỗ dừng')
+    parser.add_argument('--checkpoint-every',
+                       type=int, default=20,
+                       help='Số batch tối đa mỗi đợt checkpoint (mặc định: 20)')
+    parser.add_argument('--checkpoint-seconds',
+                       type=float, default=60,
+                       help='Thời gian mục tiêu mỗi đợt checkpoint, giây (mặc định: 60)')
+    parser.add_argument('--gemini-concurrency',
+                       type=int, default=4,
+                       help='Số batch request Gemini chạy song song (mặc định: 4)')
+    parser.add_argument('--gemini-rpm',
+                       type=int, default=60,
+                       help='Giới hạn request/phút gửi tới Gemini (mặc định: 60)')
+    parser.add_argument('--gemini-tpm',
+                       type=int, default=1_000_000,
+                       help='Giới hạn token/phút gửi tới Gemini (mặc định: 1000000)')
+    parser.add_argument('--gemini-endpoint',
+                       default=None, metavar='URL',
+                       help='Gửi batch Gemini tới endpoint HTTP này thay cho Gemini API '
+                            '(ví dụ server giả lập: python src/gemini_stub_server.py)')
     parser.add_argument('--text-column', '-t',
                        default='text',
                        help='Tên cột chứa text (mặc định: text)')
@@ -731,8 +2276,40 @@ def main():
     
     args = parser.parse_args()
     
+    if args.measure_truncation is not None:
+        measure_truncation(args.measure_truncation, max_tokens=args.max_tokens or 128, model_name=args.model,
+                           text_column=args.text_column, batch_size=args.batch_size or 32)
+        return
+    
+    if args.check_quantized:
+        check_quantized_agreement(args.check_quantized, model_name=args.model,
+                                  text_column=args.text_column, batch_size=args.batch_size or 32)
+        return
+    
     # Khởi tạo analyzer
-    analyzer = SentimentAnalyzer(model_name=args.model)
+    analyzer = SentimentAnalyzer(
+        model_name=args.model,
+        bucket_by_length=args.bucket_by_length,
+        backend=args.backend,
+        quantized=args.quantized,
+        cache_path=args.cache,
+        lexicon_cascade=args.lexicon_cascade,
+        cascade_model=args.cascade_model,
+        cascade_threshold=args.cascade_threshold,
+        max_tokens=args.max_tokens,
+        star_mapping=args.star_mapping,
+        pipeline_threads=args.pipeline_threads,
+        pipeline_queue=args.pipeline_queue,
+        batch_size=args.batch_size,
+        tuned_profile=not args.no_profile,
+        fast_model_path=args.fast_model,
+        use_gemini=args.gemini_endpoint is not None,
+        gemini_concurrency=args.gemini_concurrency,
+        gemini_rpm=args.gemini_rpm,
+        gemini_tpm=args.gemini_tpm,
+        gemini_endpoint=args.gemini_endpoint,
+        model_store_path=args.model_store
+    )
     
     # Xử lý file
     analyzer.process_csv(
@@ -740,7 +2317,14 @@ def main():
         output_file=args.output,
         text_column=args.text_column,
         trust_column=args.trust_column,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        workers=args.workers,
+        checkpoint=args.checkpoint,
+        checkpoint_every=args.checkpoint_every,
+        checkpoint_seconds=args.checkpoint_seconds,
+        chunk_rows=args.chunk_rows,
+        probabilities=args.probabilities,
+        relabel=args.relabel
     )
 
 
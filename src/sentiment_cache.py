@@ -0,0 +1,147 @@
+"""
+Cache kết quả sentiment trên đĩa (SQLite)
+Key = hash(text + model + phiên bản từ điển từ khóa và luật kết hợp),
+giúp các file scraper có comment trùng nhau không phải chạy lại model.
+Mỗi key lưu nhãn và xác suất pos/neu/neg, confidence của model (NULL nếu model không chạy)
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Phiên bản định dạng key: key cũ (tính trên text đã chuẩn hóa NFC/khoảng trắng) không còn khớp
+_KEY_VERSION = 2
+
+
+# Các cột xác suất lưu cùng score (thứ tự như OUTPUT_COLUMNS của sentiment_analyzer)
+_PROB_COLUMNS = ['pos', 'neu', 'neg', 'confidence']
+
+
+class SentimentCache:
+    """Cache sentiment score theo nội dung, tự xóa các key lâu không dùng khi vượt quá kích thước"""
+
+    # SQLite giới hạn số tham số trong một câu lệnh
+    _CHUNK_SIZE = 500
+
+    def __init__(self, path, max_entries=1_000_000):
+        """
+        Mở (hoặc tạo) file cache
+
+        Args:
+            path: Đường dẫn file SQLite
+            max_entries: Số key tối đa, vượt quá thì xóa các key ít được dùng gần đây nhất
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sentiment ('
+            'key TEXT PRIMARY KEY, score INTEGER NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_last_used ON sentiment(last_used)')
+        # File cache cũ chỉ có cột score
+        existing = {row[1] for row in self._conn.execute('PRAGMA table_info(sentiment)')}
+        for column in _PROB_COLUMNS:
+            if column not in existing:
+                self._conn.execute(f'ALTER TABLE sentiment ADD COLUMN {column} REAL')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text, model_key):
+        """
+        Tạo key từ đúng text được chấm điểm và định danh model/từ điển
+
+        Không chuẩn hóa text: model và bước kết hợp từ khóa/emoji chấm trên text gốc, hai biến thể
+        NFC/NFD hoặc khác khoảng trắng của cùng một comment có thể ra nhãn khác nhau
+        """
+        return hashlib.sha1(f"{_KEY_VERSION}\x00{model_key}\x00{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Tra cứu nhiều key cùng lúc
+
+        Returns:
+            dict: {key: (score, pos, neu, neg, confidence)} cho các key có trong cache (NaN nếu không có xác suất)
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self._CHUNK_SIZE):
+                chunk = keys[i:i+self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, score, {", ".join(_PROB_COLUMNS)} FROM sentiment WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                found.update((row[0], tuple(math.nan if value is None else value for value in row[1:]))
+                             for row in rows)
+
+            # Cập nhật thời điểm dùng để eviction theo LRU
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    'UPDATE sentiment SET last_used = ? WHERE key = ?',
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items):
+        """Ghi nhiều kết quả {key: (score, pos, neu, neg, confidence)} vào cache (xác suất NaN lưu thành NULL)"""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, output in items.items():
+            score, *probs = output
+            rows.append((key, int(score), *(None if math.isnan(p) else float(p) for p in probs), now))
+        with self._lock:
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO sentiment (key, score, {", ".join(_PROB_COLUMNS)}, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Xóa các key ít được dùng gần đây nhất khi vượt quá max_entries"""
+        count = self._conn.execute('SELECT COUNT(*) FROM sentiment').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                'DELETE FROM sentiment WHERE key IN '
+                '(SELECT key FROM sentiment ORDER BY last_used ASC LIMIT ?)',
+                (excess,)
+            )
+
+    def record(self, lookups, hits):
+        """Cộng dồn thống kê tra cứu"""
+        self.lookups += lookups
+        self.hits += hits
+
+    def reset_stats(self):
+        self.lookups = 0
+        self.hits = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sentiment').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
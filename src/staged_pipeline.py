@@ -0,0 +1,128 @@
+"""
+Chạy chồng lấp các stage xử lý batch bằng thread
+Mỗi stage có thread riêng (hoặc nhiều thread), các stage nối với nhau bằng queue có giới hạn:
+trong khi model chạy batch k, stage trước đã chuẩn bị batch k+1 và stage sau xử lý output
+của batch k-1. Queue đầy thì stage trước phải chờ (backpressure), nên bộ nhớ chỉ giữ vài batch.
+Thời gian làm việc của từng stage được đo để biết stage nào là nút thắt
+"""
+
+import queue
+import threading
+import time
+
+# Đánh dấu hết dữ liệu trong queue
+_DONE = object()
+
+
+class StagedPipeline:
+    """
+    Chuỗi stage chạy song song, kết quả trả về đúng thứ tự đầu vào
+
+        runner = StagedPipeline([('tokenize', tokenize, 2), ('infer', forward, 1)], max_pending=2)
+        outputs = runner.run(batches)
+
+    Lỗi ở một stage không dừng pipeline: item đó bỏ qua các stage còn lại và kết quả
+    tại vị trí của nó là exception.
+    """
+
+    def __init__(self, stages, max_pending=2):
+        """
+        Args:
+            stages: List (tên, hàm, số thread). Hàm nhận output của stage trước
+            max_pending: Số item tối đa chờ giữa hai stage liên tiếp
+        """
+        self.stages = stages
+        self.max_pending = max(1, max_pending)
+        self.stats = None
+
+    def run(self, items, on_done=None):
+        """
+        Args:
+            items: Iterable các đầu vào (được đọc dần, không cần có sẵn toàn bộ)
+            on_done: Hàm gọi ở thread hiện tại sau mỗi item hoàn thành, nhận (số item đã xong, tổng số item)
+
+        Returns:
+            list: Output của stage cuối hoặc exception, cùng thứ tự với items
+        """
+        items = list(items) if on_done is not None else items
+        total = len(items) if on_done is not None else None
+        n_stages = len(self.stages)
+        queues = [queue.Queue(maxsize=self.max_pending) for _ in range(n_stages)] + [queue.Queue()]
+        busy = [0.0] * n_stages
+        counts = [0] * n_stages
+        remaining = [workers for _, _, workers in self.stages]
+        lock = threading.Lock()
+
+        def work(s):
+            _, fn, _ = self.stages[s]
+            while True:
+                item = queues[s].get()
+                if item is _DONE:
+                    # Thread cuối cùng của stage báo hết dữ liệu cho stage sau
+                    with lock:
+                        remaining[s] -= 1
+                        last = remaining[s] == 0
+                    if last:
+                        for _ in range(self.stages[s + 1][2] if s + 1 < n_stages else 1):
+                            queues[s + 1].put(_DONE)
+                    return
+                idx, value = item
+                if not isinstance(value, BaseException):
+                    start = time.perf_counter()
+                    try:
+                        value = fn(value)
+                    except Exception as e:
+                        value = e
+                    with lock:
+                        busy[s] += time.perf_counter() - start
+                        counts[s] += 1
+                queues[s + 1].put((idx, value))
+
+        def feed():
+            for idx, value in enumerate(items):
+                queues[0].put((idx, value))
+            for _ in range(self.stages[0][2]):
+                queues[0].put(_DONE)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for s, (_, _, workers) in enumerate(self.stages):
+            threads += [threading.Thread(target=work, args=(s,), daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        results = {}
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            idx, value = item
+            results[idx] = value
+            if on_done:
+                on_done(len(results), total)
+        for thread in threads:
+            thread.join()
+
+        seconds = time.perf_counter() - start
+        self.stats = {
+            'seconds': seconds,
+            'stages': {
+                name: {
+                    'items': counts[s],
+                    'threads': workers,
+                    'busy_seconds': busy[s],
+                    # Tỉ lệ thời gian các thread của stage thực sự làm việc
+                    'utilization': busy[s] / (seconds * workers) if seconds > 0 else 0.0,
+                }
+                for s, (name, _, workers) in enumerate(self.stages)
+            },
+        }
+        return [results[idx] for idx in range(len(results))]
+
+    def format_stats(self):
+        """Một dòng tóm tắt mức sử dụng từng stage của lần run() gần nhất"""
+        if not self.stats:
+            return ''
+        parts = [f"{name} {stage['utilization']*100:.0f}%" + (f" ({stage['threads']} thread)" if stage['threads'] > 1 else '')
+                 for name, stage in self.stats['stages'].items()]
+        return f"{' | '.join(parts)} trong {self.stats['seconds']:.2f}s"
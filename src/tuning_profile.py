@@ -0,0 +1,74 @@
+"""
+Profile hiệu năng do run_auto_tune.py đo trên máy này (file JSON trong .model_cache)
+Mỗi model lưu cấu hình nhanh nhất (batch size, số thread intra-op/inter-op) cho từng backend
+và backend tốt nhất. SentimentAnalyzer và app.py dùng profile này làm mặc định.
+Module chỉ dùng thư viện chuẩn để app và CLI đọc được profile mà không tải torch
+"""
+
+import json
+import os
+import time
+
+# File profile mặc định
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache', 'tuned_profile.json')
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_profile(model_name, backend=None, path=PROFILE_PATH, max_tokens=None):
+    """
+    Cấu hình đã đo cho model
+
+    Profile đo trên máy có số CPU khác (ví dụ copy thư mục cache sang máy khác) hoặc với
+    giới hạn token khác lần chạy hiện tại (batch size/số thread tốt nhất phụ thuộc độ dài input) bị bỏ qua.
+
+    Args:
+        model_name: Tên model
+        backend: Backend cần lấy cấu hình (None = backend nhanh nhất)
+        path: File profile
+        max_tokens: Giới hạn token của lần chạy hiện tại (None = không giới hạn)
+
+    Returns:
+        dict: backend, batch_size, intra_op_threads, inter_op_threads, comments_per_sec, peak_rss_mb
+              (None nếu chưa có profile phù hợp)
+    """
+    entry = _read(path).get('models', {}).get(model_name)
+    if not entry or entry.get('cpu_count') != os.cpu_count() or entry.get('max_tokens') != max_tokens:
+        return None
+    backend = backend or entry.get('best')
+    config = entry.get('backends', {}).get(backend)
+    return dict(config, backend=backend) if config else None
+
+
+def save_profile(model_name, best_backend, backends, rows, path=PROFILE_PATH, max_tokens=None):
+    """
+    Lưu kết quả auto-tune của một model (giữ nguyên profile của các model khác)
+
+    Args:
+        model_name: Tên model
+        best_backend: Backend nhanh nhất
+        backends: Dict {backend: cấu hình tốt nhất của backend đó}
+        rows: Số comment dùng để đo
+        path: File profile
+        max_tokens: Giới hạn token khi đo (None = không giới hạn)
+    """
+    data = _read(path)
+    data.setdefault('models', {})[model_name] = {
+        'best': best_backend,
+        'backends': backends,
+        'rows': rows,
+        'max_tokens': max_tokens,
+        'cpu_count': os.cpu_count(),
+        'tuned_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)